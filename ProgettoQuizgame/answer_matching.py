@@ -0,0 +1,129 @@
+import string
+import unicodedata
+
+ALIAS_SEPARATOR = "|"  # "Roma|Rome": il presentatore può indicare più risposte accettate
+# Punteggiatura che separa o unisce parole ("L'Aquila", "Jean-Paul", "U.S.A."): nelle
+# risposte alfabetiche diventa uno spazio con un'unica str.translate
+WORD_PUNCTUATION = "'\"-.,;:!?()«»“”‘’–—…¿¡·"
+PUNCTUATION = str.maketrans({char: " " for char in string.punctuation + "«»“”‘’–—…¿¡·"})
+# Forma stretta (numeri e simboli): si uniformano solo le varianti tipografiche
+TYPOGRAPHIC = str.maketrans({"‘": "'", "’": "'", "“": '"', "”": '"', "«": '"', "»": '"', "–": "-", "—": "-", "−": "-"})
+EDGE_PUNCTUATION = "'\".,;:!?()…¿¡"  # Tolta solo ai bordi: "5." == "5", ma "-5" != "5"
+ARTICLES = frozenset(("il", "lo", "la", "i", "gli", "le", "l", "un", "uno", "una", "the", "a", "an"))
+
+
+def fold(text):
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+
+def without_article(words):
+    if len(words) > 1 and words[0] in ARTICLES:
+        return words[1:]  # "La Divina Commedia" == "Divina Commedia"
+    return words
+
+
+def normalize(text):
+    """Forma canonica di una risposta: senza accenti, maiuscole, punteggiatura e articolo iniziale."""
+    return " ".join(without_article(fold(text).translate(PUNCTUATION).split()))
+
+
+def normalize_strict(text):
+    """Forma canonica per risposte con cifre o simboli: segni e simboli restano, spazi e articolo no.
+
+    "-5" resta diverso da "5" e "C++" da "C"; la virgola decimale vale il punto.
+    """
+    words = without_article(fold(text).translate(TYPOGRAPHIC).split())
+    compact = "".join(words).strip(EDGE_PUNCTUATION)
+    return "".join("." if char == "," and 0 < i < len(compact) - 1 and compact[i - 1].isdigit() and compact[i + 1].isdigit() else char
+                   for i, char in enumerate(compact))
+
+
+def is_symbolic(text):
+    """True se la risposta contiene cifre o simboli che ne cambiano il significato (segni, "+", "#", "%"...)."""
+    return any(char.isdigit() or not (char.isalpha() or char.isspace() or char in WORD_PUNCTUATION) for char in fold(text))
+
+
+def default_tolerance(answer):
+    """Errori di battitura tollerati: nessuno per parole fino a 5 lettere ("cane" != "pane"), di più per risposte lunghe."""
+    if len(answer) <= 5:
+        return 0
+    if len(answer) <= 9:
+        return 1
+    return 2
+
+
+def bounded_edit_distance(a, b, limit):
+    """Distanza di Levenshtein tra a e b, oppure limit + 1 appena si capisce che la supera.
+
+    Calcola solo la banda diagonale larga 2 * limit + 1: costo O(len * limit).
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if len(a) > len(b):
+        a, b = b, a
+    too_far = limit + 1
+    previous = [j if j <= limit else too_far for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        current = [too_far] * (len(b) + 1)
+        if i <= limit:
+            current[0] = i
+        low, high = max(1, i - limit), min(len(b), i + limit)
+        char = a[i - 1]
+        best = current[0]
+        for j in range(low, high + 1):
+            cost = previous[j - 1] + (char != b[j - 1])
+            if previous[j] + 1 < cost:
+                cost = previous[j] + 1
+            if current[j - 1] + 1 < cost:
+                cost = current[j - 1] + 1
+            current[j] = cost if cost < too_far else too_far
+            if cost < best:
+                best = cost
+        if best > limit:
+            return too_far  # Tutta la banda è già oltre il limite
+        previous = current
+    return previous[len(b)]
+
+
+class AnswerMatcher:
+    """Risposta corretta precompilata una sola volta per domanda.
+
+    Le varianti accettate sono normalizzate all'inizio: ogni risposta ricevuta
+    costa una normalizzazione, una ricerca in un set e, solo se serve, una
+    distanza di edit limitata verso le varianti di lunghezza compatibile.
+    Le varianti con cifre o simboli si confrontano solo in forma stretta, senza
+    errori di battitura: la punteggiatura si ignora solo nelle risposte alfabetiche.
+    """
+
+    __slots__ = ("answer", "accepted", "exact", "fuzzy")
+
+    def __init__(self, answer, aliases=(), max_distance=None):
+        self.answer = answer
+        variants = [variant for text in (answer, *aliases) for variant in text.split(ALIAS_SEPARATOR)]
+        symbolic = [variant for variant in variants if is_symbolic(variant)]
+        self.exact = frozenset(filter(None, (normalize_strict(variant) for variant in symbolic)))
+        self.accepted = frozenset(filter(None, (normalize(variant) for variant in variants if variant not in symbolic)))
+        # (variante, errori tollerati) per le sole varianti alfabetiche che ammettono errori di battitura
+        self.fuzzy = tuple(
+            (variant, tolerance)
+            for variant in self.accepted
+            for tolerance in [default_tolerance(variant) if max_distance is None else max_distance]
+            if tolerance > 0
+        )
+
+    def matches(self, response):
+        if self.exact and normalize_strict(response) in self.exact:
+            return True
+        if not self.accepted:
+            return False
+        text = normalize(response)
+        if text in self.accepted:
+            return True
+        for variant, tolerance in self.fuzzy:
+            if bounded_edit_distance(text, variant, tolerance) <= tolerance:
+                return True
+        return False
+
+    def __str__(self):
+        return self.answer
@@ -0,0 +1,56 @@
+import threading
+import time
+
+CLOSED = ("CLOSED", 0)  # Detentore fittizio di una domanda già vinta: nessuno può più prenotarsi
+
+
+class BuzzArbiter:
+    """Arbitro autorevole dei buzz, ospitato dal presentatore.
+
+    Le richieste sono ordinate per istante di arrivo (orologio monotono) e per
+    ogni domanda viene concesso un solo detentore. La concessione è un singolo
+    dict.setdefault, atomico in CPython: le richieste concorrenti non si
+    contendono alcun lock, che serve solo per rilasciare o chiudere una domanda.
+    """
+
+    def __init__(self):
+        self.current = None  # Domanda aperta
+        self.holders = {}  # {question_id: (peer, arrivo in ns)}
+        self.lock = threading.Lock()
+        self.granted = 0  # Buzz concessi (uno per detentore)
+
+    def open(self, question_id):
+        """Apre una nuova domanda e dimentica i detentori di quelle precedenti."""
+        with self.lock:
+            self.holders = {}
+            self.current = question_id
+
+    def request(self, question_id, peer):
+        """Registra una prenotazione; restituisce (concessa, detentore, istante di arrivo in ns)."""
+        arrival = time.monotonic_ns()
+        if question_id != self.current:
+            return False, None, arrival  # Prenotazione per una domanda non più aperta
+        entry = (peer, arrival)
+        holder = self.holders.setdefault(question_id, entry)
+        if holder is entry:
+            self.granted += 1
+            return True, peer, arrival
+        return False, holder[0], arrival
+
+    def holder(self, question_id):
+        entry = self.holders.get(question_id)
+        return None if entry is None or entry is CLOSED else entry[0]
+
+    def release(self, question_id, peer):
+        """Libera il buzz dopo una risposta errata o scaduta; solo il detentore può rilasciarlo."""
+        with self.lock:
+            entry = self.holders.get(question_id)
+            if entry is not None and entry is not CLOSED and entry[0] == peer:
+                del self.holders[question_id]
+                return True
+            return False
+
+    def close(self, question_id):
+        """Chiude la domanda dopo una risposta corretta: le prenotazioni successive vengono rifiutate."""
+        with self.lock:
+            self.holders[question_id] = CLOSED
@@ -0,0 +1,510 @@
+"""Contenuti multimediali delle domande (immagini, audio): trasferimento zero-copy e cache sui peer.
+
+Un asset è identificato dallo sha256 del suo contenuto. Il presentatore carica
+sul server i file delle proprie domande, una volta sola: il server li conserva
+per hash (AssetStore, cartella condivisa anche tra i worker pre-fork) e a un
+UPLOAD di un contenuto che ha già risponde subito STORED. La QUESTION porta solo
+id, dimensione e tipo degli asset; i peer li scaricano dal server e li tengono
+in una cache su disco con rimozione LRU (AssetCache).
+
+I trasferimenti passano da una connessione dedicata (AssetClient): un file
+grande non ritarda buzz e risposte sulla connessione della partita. Dopo
+l'apertura (ASSETS → ASSETS_READY) ogni richiesta è un frame JSON e il
+contenuto viaggia grezzo subito dopo la risposta: chi invia usa sendfile (dal
+page cache al socket senza copie in user space), chi riceve scrive con
+recv_into direttamente nella mappa in memoria del file e ne verifica l'hash.
+
+- FETCH {id}        → ASSET {id, size} seguito da size byte, oppure ERROR
+- UPLOAD {id, size} → STORED (già presente), oppure SEND; poi size byte → STORED
+
+Il server serve gli asset solo se è stato avviato con un AssetStore (opzione
+"assets" di server.py) e solo ai peer registrati: l'ASSETS di apertura porta il
+token di sessione ricevuto al REGISTER. La cartella del server ha una quota
+complessiva (max_total): oltre, gli UPLOAD vengono rifiutati.
+
+Il presentatore annuncia con PREFETCH gli asset della domanda successiva mentre
+quella corrente è in gioco: quando arriva la QUESTION i peer li hanno già in
+cache e nessun byte degli asset attraversa la rete in quel momento.
+
+Uso: python assets.py id FILE...        (id, dimensione e tipo dei file)
+"""
+import asyncio
+import hashlib
+import mimetypes
+import mmap
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from protocol import HEADER, MAX_MESSAGE_SIZE, ProtocolError, decode_payload, encode_message, read_message_async, write_message_async
+from liveness import CONNECT_TIMEOUT
+from metrics import METRICS, get_logger, setup_logging
+
+log = get_logger("assets")
+
+CHUNK_SIZE = 256 * 1024  # Byte ricevuti per chiamata a recv_into
+MAX_ASSET_SIZE = 64 * 1024 * 1024
+MAX_STORE_SIZE = 1024 * 1024 * 1024  # Byte di asset conservati in tutto dal server
+CACHE_CAPACITY = 256 * 1024 * 1024  # Byte di asset tenuti in cache da ogni peer
+STORE_DIR = "quiz_assets"  # Asset del server, nella cartella di lavoro (non in una /tmp condivisa)
+TRANSFER_TIMEOUT = 15.0  # Attesa massima di ogni lettura o scrittura sulla connessione degli asset
+
+
+class AssetError(Exception):
+    """Asset mancante, troppo grande o con contenuto diverso dal suo hash."""
+
+
+def valid_id(asset_id):
+    return isinstance(asset_id, str) and len(asset_id) == 64 and all(c in "0123456789abcdef" for c in asset_id)
+
+
+def file_digest(path):
+    """sha256 del file letto dalla sua mappa in memoria."""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            return hashlib.sha256().hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return hashlib.sha256(data).hexdigest()
+
+
+def describe(path):
+    """Descrizione dell'asset inviata nella QUESTION: {"id", "size", "mime", "name"}."""
+    return {
+        "id": file_digest(path),
+        "size": os.path.getsize(path),
+        "mime": mimetypes.guess_type(path)[0] or "application/octet-stream",
+        "name": os.path.basename(path),
+    }
+
+
+def recv_exact(sock, size):
+    data = bytearray(size)
+    view = memoryview(data)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if not count:
+            raise ConnectionError("Connessione chiusa durante il trasferimento")
+        received += count
+    return data
+
+
+def recv_message(sock):
+    """Legge un frame JSON senza leggere oltre: dopo può arrivare il contenuto grezzo di un asset."""
+    header = sock.recv(HEADER.size)
+    if not header:
+        return None
+    if len(header) < HEADER.size:
+        header += recv_exact(sock, HEADER.size - len(header))
+    (size,) = HEADER.unpack(header)
+    if size > MAX_MESSAGE_SIZE:
+        raise ProtocolError(f"Frame troppo grande: {size} byte")
+    return decode_payload(bytes(recv_exact(sock, size)))
+
+
+def recv_reply(sock):
+    """Risposta del server a una richiesta; una connessione chiusa è un errore (la richiesta va ripetuta)."""
+    response = recv_message(sock)
+    if response is None:
+        raise ConnectionError("Connessione degli asset chiusa dal server")
+    if response.get("type") == "ERROR":
+        raise AssetError(response.get("message"))
+    return response
+
+
+def receive_file(sock, path, size, asset_id):
+    """Riceve size byte dal socket nel file path, scrivendoli nella sua mappa in memoria.
+
+    Il contenuto viene verificato contro asset_id prima di comparire con il nome
+    definitivo: un trasferimento interrotto lascia solo il file temporaneo, che
+    viene rimosso.
+    """
+    partial = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+    try:
+        with open(partial, "w+b") as f:
+            if size:
+                f.truncate(size)
+                with mmap.mmap(f.fileno(), size) as data:
+                    view = memoryview(data)
+                    try:
+                        received = 0
+                        while received < size:
+                            count = sock.recv_into(view[received:received + CHUNK_SIZE])
+                            if not count:
+                                raise ConnectionError("Connessione chiusa durante il trasferimento")
+                            received += count
+                        digest = hashlib.sha256(view).hexdigest()
+                    finally:
+                        view.release()
+            else:
+                digest = hashlib.sha256().hexdigest()
+        if digest != asset_id:
+            raise AssetError(f"Contenuto dell'asset {asset_id[:12]} non corrispondente all'hash")
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+
+async def receive_file_async(reader, path, size, asset_id):
+    """Versione asyncio di receive_file (lato server, per gli UPLOAD)."""
+    partial = f"{path}.{os.getpid()}.{id(reader)}.part"
+    digest = hashlib.sha256()
+    try:
+        with open(partial, "wb") as f:
+            left = size
+            while left:
+                chunk = await reader.readexactly(min(left, CHUNK_SIZE))
+                digest.update(chunk)
+                f.write(chunk)
+                left -= len(chunk)
+        if digest.hexdigest() != asset_id:
+            raise AssetError(f"Contenuto dell'asset {asset_id[:12]} non corrispondente all'hash")
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+
+class AssetStore:
+    """Asset del server: un file per hash nella cartella directory, al massimo max_total byte in tutto."""
+
+    def __init__(self, directory=STORE_DIR, max_size=MAX_ASSET_SIZE, max_total=MAX_STORE_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self.max_total = max_total
+        self.reserved = 0  # Byte degli UPLOAD in corso in questo processo
+        self.lock = threading.Lock()
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+
+    def path(self, asset_id):
+        if not valid_id(asset_id):
+            raise AssetError(f"Id di asset non valido: {asset_id!r}")
+        return os.path.join(self.directory, asset_id)
+
+    def check_upload(self, message):
+        size = message.get("size")
+        if not isinstance(size, int) or not 0 <= size <= self.max_size:
+            raise AssetError(f"Dimensione dell'asset non valida: {size!r}")
+        return self.path(message.get("id")), size
+
+    def used(self):
+        """Byte occupati nella cartella, riletti a ogni UPLOAD: i worker pre-fork la condividono."""
+        return sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.is_file())
+
+    def reserve(self, size):
+        """Prenota lo spazio per un UPLOAD; AssetError se la quota è esaurita. Va rilasciato con release."""
+        with self.lock:
+            if self.used() + self.reserved + size > self.max_total:
+                METRICS.inc("server.assets.rejected")
+                raise AssetError(f"Spazio per gli asset esaurito ({self.max_total} byte)")
+            self.reserved += size
+
+    def release(self, size):
+        with self.lock:
+            self.reserved -= size
+
+    def serve(self, sock, addr, idle_timeout=None):
+        """Serve le richieste FETCH e UPLOAD di una connessione degli asset finché resta aperta.
+
+        Una connessione inattiva oltre idle_timeout viene chiusa: il client la
+        riapre alla richiesta successiva.
+        """
+        sock.settimeout(idle_timeout)
+        try:
+            while True:
+                message = recv_message(sock)
+                if message is None:
+                    break
+                try:
+                    if message.get("type") == "FETCH":
+                        path = self.path(message.get("id"))
+                        try:
+                            f = open(path, "rb")
+                        except OSError:
+                            raise AssetError(f"Asset sconosciuto: {message.get('id')}")
+                        with f:
+                            size = os.fstat(f.fileno()).st_size
+                            sock.sendall(encode_message({"type": "ASSET", "id": message["id"], "size": size}))
+                            if size:
+                                sock.sendfile(f)  # os.sendfile: niente copie in user space
+                        METRICS.inc("server.assets.sent")
+                        METRICS.inc("server.assets.bytes_sent", size)
+                    elif message.get("type") == "UPLOAD":
+                        path, size = self.check_upload(message)
+                        if not os.path.exists(path):
+                            self.reserve(size)
+                            try:
+                                sock.sendall(encode_message({"type": "SEND", "id": message["id"]}))
+                                receive_file(sock, path, size, message["id"])
+                            finally:
+                                self.release(size)
+                            METRICS.inc("server.assets.stored")
+                        sock.sendall(encode_message({"type": "STORED", "id": message["id"]}))
+                    else:
+                        raise AssetError(f"Richiesta sconosciuta: {message.get('type')}")
+                except AssetError as e:
+                    log.warning("Richiesta di asset rifiutata da %s: %s", addr, e)
+                    sock.sendall(encode_message({"type": "ERROR", "message": str(e)}))
+        except (OSError, ProtocolError) as e:
+            log.debug("Connessione degli asset con %s chiusa: %s", addr, e)
+        finally:
+            sock.close()
+
+    async def serve_async(self, reader, writer, addr, idle_timeout=None):
+        """Versione asyncio di serve: sendfile sul transport, contenuti ricevuti a blocchi."""
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                message = await asyncio.wait_for(read_message_async(reader), idle_timeout)
+                if message is None:
+                    break
+                try:
+                    if message.get("type") == "FETCH":
+                        path = self.path(message.get("id"))
+                        try:
+                            f = open(path, "rb")
+                        except OSError:
+                            raise AssetError(f"Asset sconosciuto: {message.get('id')}")
+                        with f:
+                            size = os.fstat(f.fileno()).st_size
+                            write_message_async(writer, {"type": "ASSET", "id": message["id"], "size": size})
+                            if size:
+                                await loop.sendfile(writer.transport, f)  # Attende che l'header sia scritto, poi os.sendfile
+                            else:
+                                await writer.drain()
+                        METRICS.inc("server.assets.sent")
+                        METRICS.inc("server.assets.bytes_sent", size)
+                    elif message.get("type") == "UPLOAD":
+                        path, size = self.check_upload(message)
+                        if not os.path.exists(path):
+                            self.reserve(size)
+                            try:
+                                write_message_async(writer, {"type": "SEND", "id": message["id"]})
+                                await writer.drain()
+                                await asyncio.wait_for(receive_file_async(reader, path, size, message["id"]), idle_timeout)
+                            finally:
+                                self.release(size)
+                            METRICS.inc("server.assets.stored")
+                        write_message_async(writer, {"type": "STORED", "id": message["id"]})
+                        await writer.drain()
+                    else:
+                        raise AssetError(f"Richiesta sconosciuta: {message.get('type')}")
+                except AssetError as e:
+                    log.warning("Richiesta di asset rifiutata da %s: %s", addr, e)
+                    write_message_async(writer, {"type": "ERROR", "message": str(e)})
+                    await writer.drain()
+        except (OSError, ProtocolError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+            log.debug("Connessione degli asset con %s chiusa: %s", addr, e)
+        finally:
+            writer.close()
+
+
+class AssetCache:
+    """Cache LRU su disco degli asset di un peer, limitata a capacity byte."""
+
+    def __init__(self, directory=None, capacity=CACHE_CAPACITY):
+        self.owned = directory is None  # Cartella temporanea creata qui: viene rimossa da close
+        self.directory = directory or tempfile.mkdtemp(prefix="quiz_cache_")
+        self.capacity = capacity
+        self.entries = OrderedDict()  # {id: dimensione}, dal meno al più recentemente usato
+        self.used = 0
+        self.lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        # Asset rimasti da una sessione precedente: i più vecchi sono i primi a uscire
+        found = [(entry.stat().st_mtime, entry.name, entry.stat().st_size) for entry in os.scandir(self.directory)
+                 if entry.is_file() and valid_id(entry.name)]
+        for _, asset_id, size in sorted(found):
+            self.entries[asset_id] = size
+            self.used += size
+        self.evict()
+
+    def path(self, asset_id):
+        if not valid_id(asset_id):
+            raise AssetError(f"Id di asset non valido: {asset_id!r}")
+        return os.path.join(self.directory, asset_id)
+
+    def get(self, asset_id):
+        """Percorso dell'asset se è in cache (e lo segna come appena usato); None altrimenti."""
+        with self.lock:
+            if asset_id not in self.entries:
+                return None
+            self.entries.move_to_end(asset_id)
+        return self.path(asset_id)
+
+    def add(self, asset_id, size):
+        """Registra un asset appena scritto nella cartella della cache."""
+        with self.lock:
+            if asset_id not in self.entries:
+                self.used += size
+            self.entries[asset_id] = size
+            self.entries.move_to_end(asset_id)
+            self.evict()
+        return self.path(asset_id)
+
+    def evict(self):
+        # L'asset appena aggiunto resta anche se da solo supera la capacità
+        while self.used > self.capacity and len(self.entries) > 1:
+            asset_id, size = self.entries.popitem(last=False)
+            self.used -= size
+            METRICS.inc("assets.evicted")
+            try:
+                os.remove(self.path(asset_id))
+            except OSError:
+                pass
+
+    def __contains__(self, asset_id):
+        return asset_id in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def close(self):
+        """Rimuove la cartella temporanea della cache; una cartella passata dal chiamante resta per la sessione successiva."""
+        if not self.owned:
+            return
+        with self.lock:
+            self.entries.clear()
+            self.used = 0
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class AssetClient:
+    """Connessione dedicata agli asset verso il server: upload dei file del presentatore e download nella cache."""
+
+    def __init__(self, server, cache=None, timeout=TRANSFER_TIMEOUT):
+        self.server = server
+        self.cache = cache  # Creata al primo download se non viene passata
+        self.timeout = timeout
+        self.session = None  # Token di sessione del peer: il server serve gli asset solo ai peer registrati
+        self.sock = None
+        self.lock = threading.Lock()  # Una richiesta alla volta: i contenuti viaggiano sulla stessa connessione
+        self.described = {}  # {percorso: (mtime_ns, descrizione)}: ogni file viene letto per l'hash una volta sola
+        self.uploaded = set()  # Id già presenti sul server
+
+    def connect(self):
+        sock = socket.create_connection(self.server, timeout=CONNECT_TIMEOUT)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            sock.sendall(encode_message({"type": "ASSETS", "session": self.session}))
+            response = recv_message(sock)
+        except (OSError, ProtocolError):
+            sock.close()
+            raise
+        if not response or response["type"] != "ASSETS_READY":
+            sock.close()
+            raise AssetError(f"Connessione degli asset rifiutata: {(response or {}).get('message')}")
+        sock.settimeout(self.timeout)  # Un server che smette di rispondere non blocca il peer per sempre
+        self.sock = sock
+
+    def request(self, operation):
+        """Esegue operation(sock) sotto il lock, riaprendo una volta la connessione se è caduta."""
+        with self.lock:
+            for attempt in (1, 2):
+                if self.sock is None:
+                    self.connect()
+                try:
+                    return operation(self.sock)
+                except (OSError, ProtocolError) as e:
+                    self.sock.close()
+                    self.sock = None
+                    if attempt == 2:
+                        raise
+                    log.warning("Connessione degli asset interrotta, nuovo tentativo: %s", e)
+
+    def describe(self, path):
+        mtime = os.stat(path).st_mtime_ns
+        cached = self.described.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = self.described[path] = (mtime, describe(path))
+        return cached[1]
+
+    def upload(self, path):
+        """Carica il file sul server se non c'è già; restituisce la descrizione dell'asset."""
+        asset = self.describe(path)
+        if asset["id"] in self.uploaded:
+            return asset
+
+        def send(sock):
+            sock.sendall(encode_message({"type": "UPLOAD", "id": asset["id"], "size": asset["size"]}))
+            response = recv_reply(sock)
+            if response["type"] == "SEND":
+                with open(path, "rb") as f:
+                    if asset["size"]:
+                        sock.sendfile(f)
+                METRICS.inc("assets.uploaded")
+                METRICS.inc("assets.bytes_uploaded", asset["size"])
+                response = recv_reply(sock)
+            if response["type"] != "STORED":
+                raise AssetError(f"Upload di {path} rifiutato: {response}")
+
+        self.request(send)
+        self.uploaded.add(asset["id"])
+        return asset
+
+    def fetch(self, asset):
+        """Percorso locale dell'asset, scaricandolo dal server se non è in cache."""
+        if self.cache is None:
+            with self.lock:
+                if self.cache is None:
+                    self.cache = AssetCache()
+        path = self.cache.get(asset["id"])
+        if path is not None:
+            METRICS.inc("assets.cache_hits")
+            return path
+
+        def download(sock):
+            path = self.cache.get(asset["id"])  # Scaricato nel frattempo da un'altra richiesta (prefetch)
+            if path is not None:
+                METRICS.inc("assets.cache_hits")
+                return path
+            started = time.perf_counter()
+            sock.sendall(encode_message({"type": "FETCH", "id": asset["id"]}))
+            response = recv_reply(sock)
+            if response["type"] != "ASSET":
+                raise AssetError(f"Asset {asset['id'][:12]} non disponibile: {response}")
+            size = response["size"]
+            if size > MAX_ASSET_SIZE:
+                raise ProtocolError(f"Asset troppo grande: {size} byte")
+            receive_file(sock, self.cache.path(asset["id"]), size, asset["id"])
+            METRICS.inc("assets.fetched")
+            METRICS.inc("assets.bytes_fetched", size)
+            METRICS.observe("asset_fetch", time.perf_counter() - started)
+            return self.cache.add(asset["id"], size)
+
+        return self.request(download)
+
+    def prefetch(self, assets):
+        """Scarica in cache gli asset annunciati; gli errori non interrompono la partita."""
+        for asset in assets:
+            try:
+                self.fetch(asset)
+            except (OSError, ProtocolError, AssetError) as e:
+                log.warning("Prefetch dell'asset %s non riuscito: %s", asset.get("id", "?")[:12], e)
+
+    def __contains__(self, asset_id):
+        return self.cache is not None and asset_id in self.cache
+
+    def close(self):
+        with self.lock:
+            if self.sock is not None:
+                self.sock.close()
+                self.sock = None
+            if self.cache is not None and self.cache.owned:
+                self.cache.close()
+                self.cache = None  # Un nuovo download ricrea la cache
+
+
+if __name__ == "__main__":
+    setup_logging()
+    if len(sys.argv) > 2 and sys.argv[1] == "id":
+        for path in sys.argv[2:]:
+            asset = describe(path)
+            print(f"{asset['id']}  {asset['size']:>10}  {asset['mime']}  {path}")
+    else:
+        print(__doc__)
@@ -0,0 +1,61 @@
+"""Microbenchmark della codifica dei messaggi tra peer: JSON contro formato compatto.
+
+Uso: python bench_encoding.py [ripetizioni]
+
+Per ogni tipo di messaggio misura i byte sul filo (header compreso) e il costo
+medio di codifica e decodifica in microsecondi, con una partita da 8 peer.
+"""
+import json
+import sys
+import timeit
+
+from codec import SCHEMAS, NOTICES, MessageCodec
+from protocol import HEADER
+
+PEERS = [("127.0.0.1", 40000 + i) for i in range(8)]
+
+
+def sample_messages():
+    """Un messaggio realistico per ogni tipo, come li costruisce QuizPeer."""
+    peer = {"host": PEERS[3][0], "port": PEERS[3][1]}
+    now = 1760000000.123456
+    return {
+        "BUZZ_REQUEST": {"type": "BUZZ_REQUEST", "question_id": 12, "peer": peer, "sent_at": now},
+        "BUZZ_TIMEOUT": {"type": "BUZZ_TIMEOUT", "question_id": 12, "peer": peer},
+        "BUZZ": {"type": "BUZZ", "question_id": 12, "decision": 31, "message": NOTICES["BUZZ"][0].format(port=peer["port"]),
+                 "peer": peer, "sent_at": now},
+        "WRONG_ANSWER": {"type": "WRONG_ANSWER", "question_id": 12, "decision": 32,
+                         "message": NOTICES["WRONG_ANSWER"][0].format(port=peer["port"]), "peer": peer},
+        "CORRECT_ANSWER": {"type": "CORRECT_ANSWER", "question_id": 12, "decision": 33,
+                           "message": NOTICES["CORRECT_ANSWER"][0].format(port=peer["port"]), "peer": peer},
+        "END": {"type": "END", "message": NOTICES["END"][0].format(port=peer["port"]), "peer": peer},
+        "FEEDBACK": {"type": "FEEDBACK", "question_id": 12, "correct": True, "score": 3},
+        "QUESTION": {"type": "QUESTION", "question": "Qual è la capitale d'Italia?", "question_id": 12, "sent_at": now},
+        "ANSWER": {"type": "ANSWER", "answer": "Roma", "question_id": 12},
+    }
+
+
+def measure(codec, message, repeat):
+    frame = codec.encode(message)
+    payload = frame[HEADER.size:]
+    if codec.decode(payload) != message:
+        raise AssertionError(f"Decodifica diversa dall'originale: {message['type']}")
+    encode = timeit.timeit(lambda: codec.encode(message), number=repeat) / repeat
+    decode = timeit.timeit(lambda: codec.decode(payload), number=repeat) / repeat
+    return {"bytes": len(frame), "encode_us": round(encode * 1e6, 3), "decode_us": round(decode * 1e6, 3)}
+
+
+if __name__ == "__main__":
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    codecs = {"json": MessageCodec("json", PEERS), "compact": MessageCodec("compact", PEERS)}
+    results = {}
+    for kind, message in sample_messages().items():
+        assert kind in SCHEMAS
+        results[kind] = {name: measure(codec, message, repeat) for name, codec in codecs.items()}
+
+    print(f"{'tipo':<15}{'byte json':>10}{'compact':>9}{'enc json':>10}{'compact':>9}{'dec json':>10}{'compact':>9}")
+    for kind, result in results.items():
+        j, c = result["json"], result["compact"]
+        print(f"{kind:<15}{j['bytes']:>10}{c['bytes']:>9}{j['encode_us']:>10}{c['encode_us']:>9}"
+              f"{j['decode_us']:>10}{c['decode_us']:>9}")
+    print(json.dumps(results, indent=2))
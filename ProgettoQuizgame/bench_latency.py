@@ -0,0 +1,107 @@
+"""Benchmark di latenza su rete simulata: partite complete attraverso fault_proxy.
+
+Per ogni scenario avvia un QuizServer in-process, un proxy davanti al server e
+uno davanti alla porta in ascolto di ogni bot (annunciata al server al posto di
+quella vera): ogni collegamento, peer-server e peer-peer, attraversa un solo
+proxy, quindi la latenza dello scenario è il ritardo di sola andata. Registra la
+latenza del round (dalla domanda alla risposta corretta), della consegna delle
+domande, dei buzz e dei feedback, il numero di round al secondo e i byte
+inoltrati. Tutto gira su loopback; bot e proxy hanno seed fissi, quindi due
+esecuzioni con gli stessi argomenti giocano le stesse partite.
+
+Uso: python bench_latency.py                      (tutti gli scenari)
+     python bench_latency.py wan reset --relay --games 5 --output latenze.json
+"""
+import argparse
+import json
+import threading
+
+from bots import run_load
+from fault_proxy import Faults, ProxyLoop
+from server import QuizServer, MODES
+from metrics import setup_logging
+
+SCENARIOS = {
+    "lan": Faults(),
+    "wan": Faults(latency=0.040, jitter=0.010),
+    "wan_lenta": Faults(latency=0.080, jitter=0.020, bandwidth=16 * 1024),
+    "coalescing": Faults(latency=0.020, coalesce=0.015),
+    "reset": Faults(latency=0.010, reset_rate=0.002),
+}
+REPORTED = ("round", "question_delivery", "buzz_propagation", "answer_feedback", "register")
+
+
+def run_scenario(name, faults, port, args):
+    server = QuizServer(port=port, players=args.players, winning_score=args.rounds + 1, mode=args.mode,
+                        backlog=1024, relay=args.relay)
+    threading.Thread(target=server.run, daemon=True).start()
+    proxies = ProxyLoop()
+    seeds = iter(range(args.seed * 1000, args.seed * 1000 + 100000))
+    front = proxies.proxy(("localhost", port), faults, seed=next(seeds))
+    lock = threading.Lock()
+
+    def expose(listen_port):
+        with lock:  # Seed assegnati in ordine di chiamata
+            seed = next(seeds)
+        return proxies.proxy(("localhost", listen_port), faults, seed=seed).port
+
+    try:
+        result = run_load("localhost", front.port, args.games, args.players, args.rounds, tuple(args.think),
+                          args.wrong_rate, args.timeout, args.seed, relay=args.relay, expose=expose)
+    finally:
+        proxies.close()
+    latency = result["latency_ms"]
+    rounds = latency.get("round", {}).get("count", 0)
+    traffic = proxies.stats()
+    return {
+        "scenario": name,
+        "faults": vars(faults),
+        "finished_bots": result["finished_bots"],
+        "bots": result["bots"],
+        "games_played": result["games_played"],
+        "duration_sec": result["duration_sec"],
+        "rounds_per_sec": round(rounds / result["duration_sec"], 2),
+        "proxy": dict(traffic, bytes_per_sec=round(traffic["bytes"] / result["duration_sec"])),
+        "latency_ms": {key: latency[key] for key in REPORTED if key in latency},
+        "errors": result["errors"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Partite complete attraverso proxy con guasti di rete simulati.")
+    parser.add_argument("scenarios", nargs="*", help=f"scenari da eseguire tra {', '.join(SCENARIOS)} (default: tutti)")
+    parser.add_argument("--port", type=int, default=12700, help="porta del primo server; ogni scenario usa la successiva")
+    parser.add_argument("--mode", choices=MODES, default="thread")
+    parser.add_argument("--relay", action="store_true")
+    parser.add_argument("--games", type=int, default=3)
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--think", type=float, nargs=2, default=(0.01, 0.02), metavar=("MIN", "MAX"),
+                        help="riflessione dei bot: bassa, così il round misura soprattutto la rete")
+    parser.add_argument("--wrong-rate", type=float, default=0.2)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="file JSON dei risultati (default: stdout)")
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"scenari sconosciuti: {', '.join(unknown)}")
+
+    setup_logging("CRITICAL")  # Reset e peer scollegati sono attesi: il report li conta
+    results = []
+    for index, name in enumerate(args.scenarios or SCENARIOS):
+        row = run_scenario(name, SCENARIOS[name], args.port + index, args)
+        results.append(row)
+        round_ms = row["latency_ms"].get("round", {})
+        print(f"{name:>12}: round p50 {round_ms.get('p50', '-')} ms, p99 {round_ms.get('p99', '-')} ms, "
+              f"{row['rounds_per_sec']} round/s, {row['finished_bots']}/{row['bots']} bot, {row['proxy']['resets']} reset")
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""Benchmark della modalità pre-fork: registrazioni al secondo al crescere dei worker.
+
+Uso: python bench_prefork.py [numero_client] [concorrenza] [worker massimi] [modalità]
+     python bench_prefork.py coordinatore [collocazioni] [thread per worker] [worker massimi]
+
+Per 1, 2, 4, ... worker (fino al massimo, predefinito il numero di core) avvia
+prefork.run_prefork in un processo separato e registra i client da più processi
+client, uno per core: un solo processo client misurerebbe il proprio GIL invece
+del server. Le stanze si riempiono e ricevono lo START come in una partita vera.
+
+Con "coordinatore" misura solo le collocazioni (JOIN) al secondo che il
+coordinatore serve a 1, 2, 4, ... worker, ognuno con più thread che registrano
+insieme: senza socket dei client né partite, il limite è il canale tra worker e
+coordinatore.
+"""
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+
+from bench_server import raise_fd_limit
+from protocol import read_message_async, write_message_async
+from prefork import Coordinator, Shard, run_prefork
+
+BENCH_PORT = 12398
+PLAYERS = 4
+
+
+def run_coordinator(workers, mode, ready):
+    raise_fd_limit()
+    sys.stdout = open(os.devnull, "w")
+    run_prefork(workers, port=BENCH_PORT, players=PLAYERS, mode=mode, backlog=4096, ready=ready)
+
+
+async def register(semaphore, port, connections):
+    async with semaphore:
+        reader, writer = await asyncio.open_connection("localhost", BENCH_PORT)
+        write_message_async(writer, {"type": "REGISTER", "port": port})  # Porta diversa per ogni client
+        await writer.drain()
+        response = await read_message_async(reader)
+        if not response or response["type"] != "REGISTERED":
+            raise RuntimeError(f"Registrazione fallita: {response!r}")
+        connections.append(writer)
+
+
+async def run_clients(first_port, clients, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    connections = []
+    await asyncio.gather(*(register(semaphore, first_port + i, connections) for i in range(clients)))
+    finished = time.time()
+    for writer in connections:
+        writer.close()
+    return finished
+
+
+def client_process(args):
+    """Un processo client: attende l'istante di partenza comune e registra i suoi client."""
+    first_port, clients, concurrency, start_at = args
+    raise_fd_limit()
+    time.sleep(max(0.0, start_at - time.time()))
+    return asyncio.run(run_clients(first_port, clients, concurrency))
+
+
+def bench(workers, clients, concurrency, mode, client_processes):
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(target=run_coordinator, args=(workers, mode, ready))
+    server.start()
+    ready.wait()
+    time.sleep(0.3)  # Lascia ai worker il tempo di entrare nel ciclo di accept
+    share = clients // client_processes
+    start_at = time.time() + 0.5
+    jobs = [(20000 + i * share, share, max(1, concurrency // client_processes), start_at) for i in range(client_processes)]
+    try:
+        with multiprocessing.Pool(client_processes) as pool:
+            finished = max(pool.map(client_process, jobs))
+    finally:
+        server.terminate()
+        server.join()
+    elapsed = finished - start_at
+    total = share * client_processes
+    return {
+        "workers": workers,
+        "mode": mode,
+        "clients": total,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 4),
+        "registrations_per_sec": round(total / elapsed, 1),
+    }
+
+
+def place_process(index, channel, placements, threads, start_at, finished):
+    """Un worker finto: threads thread che chiedono al coordinatore placements collocazioni in tutto."""
+    shard = Shard(index, channel, None, {})
+    per_thread = placements // threads
+
+    def place(thread):
+        for i in range(per_thread):
+            shard.place((f"10.{index}.{thread}.1", 1024 + i))
+
+    workers = [threading.Thread(target=place, args=(thread,)) for thread in range(threads)]
+    time.sleep(max(0.0, start_at - time.time()))
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    finished.put(time.time())
+
+
+def bench_coordinator(workers, placements, threads):
+    context = multiprocessing.get_context("fork")
+    channels = [socket.socketpair() for _ in range(workers)]
+    coordinator = context.Process(target=lambda: Coordinator([ours for ours, _ in channels], PLAYERS, 3).run(), daemon=True)
+    coordinator.start()
+    finished = context.Queue()
+    start_at = time.time() + 0.5
+    share = placements // workers
+    shards = [context.Process(target=place_process, args=(index, theirs, share, threads, start_at, finished))
+              for index, (_, theirs) in enumerate(channels)]
+    for shard in shards:
+        shard.start()
+    elapsed = max(finished.get() for _ in shards) - start_at
+    for shard in shards:
+        shard.join()
+    coordinator.terminate()
+    total = share // threads * threads * workers
+    return {"workers": workers, "threads": threads, "placements": total,
+            "seconds": round(elapsed, 4), "placements_per_sec": round(total / elapsed, 1)}
+
+
+def main_coordinator():
+    placements = int(sys.argv[2]) if len(sys.argv) > 2 else 40000
+    threads = int(sys.argv[3]) if len(sys.argv) > 3 else 16
+    max_workers = int(sys.argv[4]) if len(sys.argv) > 4 else 4
+    results = []
+    workers = 1
+    while workers <= max_workers:
+        results.append(bench_coordinator(workers, placements, threads))
+        workers *= 2
+    baseline = results[0]["placements_per_sec"]
+    for result in results:
+        print(f"{result['workers']:>3} worker: {result['placements_per_sec']:>9} collocazioni/s "
+              f"(x{result['placements_per_sec'] / baseline:.2f})")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["coordinatore"]:
+        main_coordinator()
+        sys.exit()
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 4000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+    cores = os.cpu_count() or 1
+    max_workers = int(sys.argv[3]) if len(sys.argv) > 3 else cores
+    mode = sys.argv[4] if len(sys.argv) > 4 else "thread"
+    raise_fd_limit()
+    results = []
+    workers = 1
+    while workers <= max_workers:
+        results.append(bench(workers, clients, concurrency, mode, cores))
+        workers *= 2
+    baseline = results[0]["registrations_per_sec"]
+    print(f"Core disponibili: {cores}")
+    for result in results:
+        print(f"{result['workers']:>3} worker: {result['registrations_per_sec']:>9} reg/s "
+              f"(x{result['registrations_per_sec'] / baseline:.2f})")
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,127 @@
+"""Benchmark delle registrazioni: confronta il QuizServer a thread con quello asyncio.
+
+Uso: python bench_server.py [numero_client] [concorrenza]
+
+Per ogni modalità avvia il server in un processo separato, apre le connessioni
+REGISTER con un client asyncio e misura registrazioni al secondo, picco di RSS
+e numero di thread del processo server. Thread e memoria vengono campionati
+mentre le connessioni sono aperte (durante le registrazioni e con tutti i client
+registrati), prima che i client si scolleghino.
+"""
+import asyncio
+import json
+import multiprocessing
+import resource
+import sys
+import time
+
+from metrics import setup_logging
+from protocol import read_message_async, write_message_async
+from server import QuizServer, MODES
+
+BENCH_PORT = 12399
+SAMPLE_INTERVAL = 0.05  # Secondi tra due campioni di /proc durante le registrazioni
+
+
+def raise_fd_limit():
+    """Porta il limite dei file descriptor al massimo consentito (servono migliaia di socket)."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def run_server(mode, port, players, ready):
+    raise_fd_limit()
+    setup_logging("ERROR")  # I log per connessione (DEBUG/INFO) falserebbero la misura
+    server = QuizServer(port=port, players=players, mode=mode, backlog=4096)
+    ready.set()
+    server.run()
+
+
+def process_stats(pid):
+    """Legge picco di memoria residente (KiB) e numero di thread da /proc."""
+    stats = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("VmHWM", "VmRSS"):
+                stats[key] = int(value.split()[0])
+            elif key == "Threads":
+                stats[key] = int(value)
+    return stats
+
+
+async def register(port, semaphore, connections, peer_port):
+    async with semaphore:
+        reader, writer = await asyncio.open_connection("localhost", port)
+        # Porta diversa per ogni client: il server rifiuta un indirizzo già registrato
+        write_message_async(writer, {"type": "REGISTER", "port": peer_port})
+        await writer.drain()
+        response = await read_message_async(reader)
+        if not response or response["type"] != "REGISTERED":
+            raise RuntimeError(f"Registrazione fallita: {response!r}")
+        connections.append(writer)  # Le connessioni restano aperte come quelle dei giocatori
+
+
+def keep_peak(peak, stats):
+    for key, value in stats.items():
+        peak[key] = max(peak.get(key, 0), value)
+
+
+async def sample(pid, peak):
+    """Campiona thread e memoria del server finché non viene cancellato."""
+    while True:
+        keep_peak(peak, process_stats(pid))
+        await asyncio.sleep(SAMPLE_INTERVAL)
+
+
+async def run_clients(port, clients, concurrency, pid):
+    """Registra i client; restituisce la durata e il picco di thread e memoria con le connessioni aperte."""
+    semaphore = asyncio.Semaphore(concurrency)
+    connections = []
+    peak = {}
+    sampler = asyncio.create_task(sample(pid, peak))
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(register(port, semaphore, connections, 20000 + i) for i in range(clients)))
+        elapsed = time.perf_counter() - started
+    finally:
+        sampler.cancel()
+    keep_peak(peak, process_stats(pid))  # Tutti i client registrati e ancora collegati
+    for writer in connections:
+        writer.close()
+    return elapsed, peak
+
+
+def bench(mode, clients, concurrency):
+    ready = multiprocessing.Event()
+    process = multiprocessing.Process(target=run_server, args=(mode, BENCH_PORT, clients + 1, ready), daemon=True)
+    process.start()
+    ready.wait()
+    time.sleep(0.2)  # Lascia al server il tempo di entrare nel ciclo di accept
+    try:
+        elapsed, stats = asyncio.run(run_clients(BENCH_PORT, clients, concurrency, process.pid))
+    finally:
+        process.terminate()
+        process.join()
+    return {
+        "mode": mode,
+        "clients": clients,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 4),
+        "registrations_per_sec": round(clients / elapsed, 1),
+        "peak_rss_kib": stats.get("VmHWM"),
+        "threads": stats.get("Threads"),  # Picco con le connessioni aperte
+    }
+
+
+if __name__ == "__main__":
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    raise_fd_limit()
+    results = []
+    for mode in MODES:
+        results.append(bench(mode, clients, concurrency))
+    for result in results:
+        print(f"{result['mode']:>8}: {result['registrations_per_sec']:>9} reg/s, "
+              f"RSS di picco {result['peak_rss_kib']} KiB, thread {result['threads']}")
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,396 @@
+"""Generatore di carico headless: simula centinaia di giocatori contro un QuizServer.
+
+Ogni bot è un QuizPeer senza GUI (nessun import di tkinter). Il server assegna i
+ruoli: i presentatori inviano domande, i giocatori si prenotano e rispondono con
+tempi di riflessione configurabili, passando dall'arbitro dei buzz. Alla fine viene stampato un report JSON con
+p50/p95/p99 delle latenze di registrazione, attesa della prima domanda, consegna
+delle domande, propagazione dei buzz e feedback alle risposte.
+
+Uso: python bots.py --games 50 --players 4 --rounds 5 --output risultati.json
+     python bots.py --games 5 --players 4 --tournament 2   (tornei a due fasi)
+     python bots.py --games 5 --spectators 200   (200 spettatori per partita)
+     python bots.py --games 5 --assets 8 --asset-size 512   (domande con allegati da 512 KB)
+     python bots.py --games 2 --players 3 --rounds 1 --tournament 1 --pause 0.05 --strict
+         (controllo di regressione: partite di un torneo che riusano gli stessi id di domanda e di decisione)
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from peer import QuizPeer
+from server import QuizServer, MODES
+from tournament import TournamentRules
+from event_log import EventLog, SYNC_MODES
+from spectators import Spectator
+from assets import AssetCache, AssetStore
+from codec import ENCODINGS
+from metrics import METRICS, serve, setup_logging
+
+LATENCIES = ("register", "first_question", "question_delivery", "buzz_propagation", "answer_feedback", "round")
+DECISION_TIMEOUT = 5.0  # Attesa massima di una decisione dell'arbitro prima di riprovare
+
+
+class LatencyRecorder:
+    """Raccoglie campioni di latenza (in secondi) per nome e ne calcola i percentili."""
+
+    def __init__(self, names=LATENCIES):
+        self.samples = {name: [] for name in names}
+        self.lock = threading.Lock()
+
+    def record(self, name, seconds):
+        with self.lock:
+            self.samples.setdefault(name, []).append(seconds)
+
+    @staticmethod
+    def percentile(ordered, fraction):
+        """Percentile con il metodo nearest-rank su una lista già ordinata."""
+        index = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))
+        return ordered[index]
+
+    def summary(self):
+        """Statistiche per metrica, in millisecondi."""
+        with self.lock:
+            snapshot = {name: sorted(values) for name, values in self.samples.items()}
+        report = {}
+        for name, ordered in snapshot.items():
+            if not ordered:
+                report[name] = {"count": 0}
+                continue
+            report[name] = {
+                "count": len(ordered),
+                "mean": round(sum(ordered) / len(ordered) * 1000, 3),
+                "p50": round(self.percentile(ordered, 0.50) * 1000, 3),
+                "p95": round(self.percentile(ordered, 0.95) * 1000, 3),
+                "p99": round(self.percentile(ordered, 0.99) * 1000, 3),
+                "max": round(ordered[-1] * 1000, 3),
+            }
+        return report
+
+
+def make_questions(count, rng):
+    """Domande aritmetiche generate al volo: la risposta è nota al bot che gioca."""
+    questions = []
+    for _ in range(count):
+        a, b = rng.randint(1, 99), rng.randint(1, 99)
+        questions.append((f"Quanto fa {a} + {b}?", str(a + b)))
+    return questions
+
+
+def make_asset_files(directory, count, size, rng):
+    """File di prova da allegare alle domande: contenuti casuali, quindi hash tutti diversi."""
+    paths = []
+    for index in range(count):
+        path = os.path.join(directory, f"allegato{index}.bin")
+        with open(path, "wb") as f:
+            f.write(rng.randbytes(size))
+        paths.append(path)
+    return paths
+
+
+class Bot:
+    """Un giocatore simulato: si registra, riceve il ruolo e gioca senza intervento umano."""
+
+    def __init__(self, server_host, server_port, recorder, think_time, wrong_rate, rounds, seed, encoding="compact", relay=False, tournament=False, event_log=None, expose=None, asset_pool=(), asset_cache=None):
+        self.peer = QuizPeer(server_host=server_host, server_port=server_port, encoding=encoding, relay=relay, event_log=event_log, asset_cache=asset_cache)
+        self.recorder = recorder
+        self.think_time = think_time  # (minimo, massimo) in secondi
+        self.wrong_rate = wrong_rate  # Probabilità di sbagliare il primo tentativo
+        self.rounds = rounds
+        self.tournament = tournament  # Gioca le partite successive finché il server non chiude il torneo
+        self.expose = expose  # expose(porta in ascolto) -> porta da annunciare (es. quella di un fault_proxy)
+        self.asset_pool = asset_pool  # File tra cui il presentatore sceglie l'allegato di ogni domanda
+        self.rng = random.Random(seed)
+        self.error = None
+        # Stato della domanda corrente, aggiornato dalle notifiche dell'arbitro
+        self.state = threading.Condition()
+        self.question_id = None
+        self.holder = None
+        self.early_buzz = None  # (question_id, porta) di un BUZZ arrivato prima della sua domanda
+        self.round_over = False
+        self.feedback = None  # Esito dell'ultima risposta inviata
+
+    def think(self):
+        time.sleep(self.rng.uniform(*self.think_time))
+
+    def run(self, timeout):
+        try:
+            self.peer.start_peer_server(self.on_event)
+            if self.expose and self.peer.peer_port:
+                self.peer.advertised_port = self.expose(self.peer.peer_port)
+            started = time.perf_counter()
+            self.peer.register()
+            self.recorder.record("register", time.perf_counter() - started)
+            self.peer.listen_for_game()
+            game = self.peer.game
+            while game is not None:
+                if self.peer.role == "PRESENTER":
+                    self.present()
+                self.peer.wait_for_end(timeout)
+                if not self.tournament:
+                    break
+                game = self.peer.wait_for_game(game, timeout)
+        except Exception as e:
+            self.error = str(e)
+
+    def present(self):
+        questions = make_questions(self.rounds, self.rng)
+        # Un allegato per domanda, scelto da un insieme piccolo: alcuni si ripetono e vanno presi dalla cache
+        attachments = [[self.rng.choice(self.asset_pool)] if self.asset_pool else [] for _ in questions] + [[]]
+        for round_number, (question, answer) in enumerate(questions):
+            if self.peer.game_over.is_set():
+                break
+            if round_number:
+                self.think()  # La prima domanda è pronta: parte appena arriva il ruolo
+            if attachments[round_number + 1]:
+                # Gli allegati della domanda successiva viaggiano mentre si gioca questa
+                self.peer.transfers.submit(self.peer.announce_assets, attachments[round_number + 1])
+            started = time.perf_counter()
+            self.peer.start_presenter(question, answer, assets=attachments[round_number])
+            self.recorder.record("round", time.perf_counter() - started)  # Dalla domanda alla risposta corretta
+        if not self.peer.game_over.is_set():
+            # Nessuno ha raggiunto il punteggio di vittoria: chiude la partita con il migliore
+            self.peer.notify_end_game(self.peer.scores.leader())
+
+    def on_event(self, data, conn):
+        now = time.time()
+        kind = data["type"]
+        if kind == "QUESTION":
+            if data.get("sent_at"):  # Le domande recuperate con il RESUMED non hanno l'ora di invio
+                self.recorder.record("question_delivery", now - data["sent_at"])
+            if self.peer.question_seq == self.peer.first_seq and self.peer.ready_at:
+                self.recorder.record("first_question", now - self.peer.ready_at)
+            with self.state:
+                self.question_id = data.get("question_id")
+                # Domanda e BUZZ viaggiano su connessioni diverse: la decisione può arrivare prima
+                early, self.early_buzz = self.early_buzz, None
+                self.holder = early[1] if early and early[0] == self.question_id else None
+                self.round_over = False
+                self.feedback = None
+            # Il thread di lettura deve restare libero per ricevere il FEEDBACK sullo stesso canale
+            threading.Thread(target=self.play, args=(data["question"], data.get("question_id")), daemon=True).start()
+            return
+        with self.state:
+            if kind == "START":
+                # Nuova partita: gli id delle domande ripartono dal nuovo presentatore
+                self.question_id = self.holder = self.early_buzz = self.feedback = None
+                self.round_over = False
+            elif kind == "FEEDBACK" and data.get("question_id") == self.question_id:
+                self.feedback = data
+            elif kind == "BUZZ" and data.get("question_id") == self.question_id:
+                if data.get("sent_at"):
+                    self.recorder.record("buzz_propagation", now - data["sent_at"])
+                self.holder = data["peer"]["port"]
+            elif kind == "BUZZ" and (self.question_id is None or data.get("question_id", 0) > self.question_id):
+                self.early_buzz = (data.get("question_id"), data["peer"]["port"])
+            elif kind == "RESUMED":
+                buzz = (data.get("state") or {}).get("buzz")
+                self.holder = buzz[1] if buzz else None  # Buzz deciso mentre eravamo disconnessi
+            elif kind == "WRONG_ANSWER" and data.get("question_id", self.question_id) == self.question_id:
+                self.holder = None  # L'arbitro ha liberato il buzz
+            elif kind == "CORRECT_ANSWER" and data.get("question_id", self.question_id) == self.question_id or kind == "END":
+                self.round_over = True
+            self.state.notify_all()
+
+    def play(self, question, question_id):
+        """Prenotazione e risposta per una domanda, in un thread dedicato."""
+        a, b = (int(token) for token in question.rstrip("?").split()[-3::2])
+        answers = [str(a + b + 1)] if self.rng.random() < self.wrong_rate else []
+        answers.append(str(a + b))
+        over = lambda: self.round_over or self.question_id != question_id
+        try:
+            while answers:
+                self.think()
+                if over():
+                    return
+                self.peer.request_buzz()
+                with self.state:
+                    self.state.wait_for(lambda: over() or self.holder is not None, DECISION_TIMEOUT)
+                    if over():
+                        return
+                    mine = self.holder == self.peer.address[1]  # La porta annunciata, non quella in ascolto
+                if mine:
+                    self.think()
+                    started = time.perf_counter()
+                    self.peer.send_answer(answers[0])
+                    with self.state:
+                        self.state.wait_for(lambda: over() or self.feedback is not None, DECISION_TIMEOUT)
+                        feedback, self.feedback = self.feedback, None
+                    if feedback is None:
+                        if over():
+                            return  # Round chiuso da un altro giocatore
+                        # Risposta o esito persi in una disconnessione: il buzz si libera come allo scadere del tempo nella GUI
+                        self.peer.report_buzz_timeout()
+                        with self.state:
+                            self.holder = None
+                        continue
+                    answers.pop(0)
+                    self.recorder.record("answer_feedback", time.perf_counter() - started)
+                    if feedback["correct"]:
+                        return
+                # Il buzz è di un altro giocatore (o abbiamo sbagliato): si riprova quando viene liberato
+                with self.state:
+                    self.state.wait_for(lambda: over() or self.holder is None, DECISION_TIMEOUT)
+        except OSError:
+            pass  # Il canale della domanda è stato chiuso: la partita è finita
+
+def watch(spectator, recorder, deadline):
+    """Uno spettatore headless: attende che la stanza esista e ne segue la partita fino alla chiusura."""
+    while True:
+        try:
+            spectator.connect()
+            break
+        except (OSError, ConnectionError):
+            if time.perf_counter() > deadline:
+                return
+            time.sleep(0.05)  # La stanza nasce con la prima registrazione
+    record = lambda spectator, message: recorder.record("spectator_lag", max(0.0, time.time() - message["t"]))
+    try:
+        spectator.run(record)
+    except OSError:
+        pass
+
+
+def run_load(server_host, server_port, games, players, rounds, think_time, wrong_rate, timeout, seed, encoding="compact", relay=False, tournament=False, event_log=None, spectators=0, spectator_rate=None, expose=None, assets=0, asset_size=256 * 1024):
+    recorder = LatencyRecorder()
+    # File degli allegati e cache dei bot in una cartella temporanea rimossa alla fine
+    workdir = tempfile.TemporaryDirectory(prefix="quiz_bots_")
+    pool = make_asset_files(workdir.name, assets, asset_size, random.Random(seed)) if assets else ()
+    bots = [Bot(server_host, server_port, recorder, think_time, wrong_rate, rounds, seed + i, encoding, relay, tournament, event_log, expose,
+                pool, AssetCache(os.path.join(workdir.name, f"cache{i}")) if assets else None)
+            for i in range(games * players)]
+    threads = [threading.Thread(target=bot.run, args=(timeout,), daemon=True) for bot in bots]
+    started = time.perf_counter()
+    deadline = started + timeout
+    # Le stanze del server in-process sono numerate da 1 nell'ordine di apertura
+    audience = [Spectator(server_host, server_port, room, spectator_rate) for room in range(1, games + 1) for _ in range(spectators)]
+    watchers = [threading.Thread(target=watch, args=(spectator, recorder, deadline), daemon=True) for spectator in audience]
+    for thread in watchers + threads:
+        thread.start()
+    for thread in threads + watchers:
+        thread.join(max(0, deadline - time.perf_counter()))
+    elapsed = time.perf_counter() - started
+    played = {}  # {stanza: partite avviate}, più di una per stanza nei tornei
+    for bot in bots:
+        played[bot.peer.room] = max(played.get(bot.peer.room, 0), bot.peer.game)
+        bot.peer.transfers.shutdown(wait=False, cancel_futures=True)
+        bot.peer.assets.close()
+    workdir.cleanup()
+    metrics = METRICS.snapshot()
+    counters = metrics["counters"]
+    return {
+        "config": {
+            "games": games,
+            "players_per_game": players,
+            "rounds": rounds,
+            "think_time": list(think_time),
+            "wrong_rate": wrong_rate,
+            "seed": seed,
+            "encoding": encoding,
+            "relay": relay,
+            "tournament": tournament,
+            "spectators": spectators,
+            "assets": assets,
+            "asset_size": asset_size,
+        },
+        "duration_sec": round(elapsed, 3),
+        "bots": len(bots),
+        "finished_bots": sum((bot.peer.tournament_over if tournament else bot.peer.game_over).is_set() for bot in bots),
+        "games_played": sum(played.values()),
+        "errors": sorted({bot.error for bot in bots if bot.error}),
+        "spectators": {
+            "connected": sum(spectator.version > 0 for spectator in audience),
+            "finished": sum(spectator.closed for spectator in audience),
+            "updates": sum(spectator.updates for spectator in audience),
+        },
+        "assets": {
+            "uploaded": counters.get("assets.uploaded", 0),
+            "fetched": counters.get("assets.fetched", 0),
+            "cache_hits": counters.get("assets.cache_hits", 0),
+            "question_misses": counters.get("assets.question_misses", 0),  # Scaricati al momento della domanda
+            "bytes_fetched": counters.get("assets.bytes_fetched", 0),
+            "question_wait_ms": metrics["latency"].get("question_assets", {"count": 0}),
+        },
+        "latency_ms": recorder.summary(),
+        "metrics": metrics,  # Metriche interne di bot e server in-process
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simula giocatori headless contro un QuizServer.")
+    parser.add_argument("--server", help="host:porta di un server già avviato (default: server in-process)")
+    parser.add_argument("--port", type=int, default=12400, help="porta del server in-process")
+    parser.add_argument("--mode", choices=MODES, default="thread", help="modalità del server in-process")
+    parser.add_argument("--games", type=int, default=10)
+    parser.add_argument("--players", type=int, default=4, help="peer per partita, presentatore incluso")
+    parser.add_argument("--rounds", type=int, default=5, help="domande per partita")
+    parser.add_argument("--think", type=float, nargs=2, default=(0.05, 0.2), metavar=("MIN", "MAX"))
+    parser.add_argument("--wrong-rate", type=float, default=0.2)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--encoding", choices=ENCODINGS, default="compact", help="codifica proposta dai bot")
+    parser.add_argument("--relay", action="store_true", help="eventi tramite l'hub del server, bot senza porta in ascolto")
+    parser.add_argument("--tournament", type=int, metavar="FASI", help="tornei a eliminazione con FASI fasi (presentatori a rotazione)")
+    parser.add_argument("--pause", type=float, default=0.2, help="secondi tra due partite di un torneo")
+    parser.add_argument("--spectators", type=int, default=0, help="spettatori in sola lettura per partita")
+    parser.add_argument("--spectator-rate", type=float, help="aggiornamenti al secondo chiesti da ogni spettatore")
+    parser.add_argument("--assets", type=int, default=0, metavar="N", help="file diversi tra cui scegliere l'allegato di ogni domanda")
+    parser.add_argument("--asset-size", type=int, default=256, metavar="KB", help="dimensione di ogni allegato")
+    parser.add_argument("--event-log", metavar="FILE", help="registra gli eventi di server e presentatori (vedi replay.py)")
+    parser.add_argument("--sync", choices=SYNC_MODES, default="batch", help="politica di fsync del registro degli eventi")
+    parser.add_argument("--strict", action="store_true",
+                        help="esce con errore anche se una decisione dell'arbitro viene scartata o un bot attende DECISION_TIMEOUT")
+    parser.add_argument("--output", help="file JSON dei risultati (default: stdout)")
+    parser.add_argument("--verbose", action="store_true", help="mostra i log dei peer")
+    parser.add_argument("--metrics-port", type=int, help="espone le metriche del processo su http://127.0.0.1:PORTA/metrics")
+    args = parser.parse_args()
+
+    setup_logging("DEBUG" if args.verbose else "ERROR")
+    if args.metrics_port is not None:
+        serve(args.metrics_port)
+    event_log = EventLog(args.event_log, args.sync) if args.event_log else None
+    store = None  # Cartella temporanea degli asset del server in-process
+    if args.server:
+        host, port = args.server.rsplit(":", 1)
+        port = int(port)
+    else:
+        host, port = "localhost", args.port
+        # Punteggio di vittoria irraggiungibile: le partite durano esattamente --rounds domande
+        rules = TournamentRules(stages=args.tournament, pause=args.pause) if args.tournament else None
+        if args.assets:
+            store = tempfile.TemporaryDirectory(prefix="quiz_store_")
+        server = QuizServer(host=host, port=port, players=args.players, winning_score=args.rounds + 1,
+                            mode=args.mode, backlog=1024, relay=args.relay, tournament=rules, event_log=event_log,
+                            assets=AssetStore(store.name) if store else None)
+        threading.Thread(target=server.run, daemon=True).start()
+    result = run_load(host, port, args.games, args.players, args.rounds, tuple(args.think),
+                      args.wrong_rate, args.timeout, args.seed, args.encoding, args.relay, bool(args.tournament), event_log,
+                      args.spectators, args.spectator_rate, assets=args.assets, asset_size=args.asset_size * 1024)
+    if event_log:
+        event_log.close()
+    if store:
+        store.cleanup()
+
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    ok = result["finished_bots"] == result["bots"]
+    if args.strict:
+        # In locale nessuna decisione arriva superata e nessun round aspetta il ritentativo dei bot
+        stale = result["metrics"]["counters"].get("peer.stale_decisions", 0)
+        slowest = result["latency_ms"].get("round", {}).get("max", 0)
+        if stale or slowest >= DECISION_TIMEOUT * 1000:
+            print(f"Controllo fallito: {stale} decisioni scartate, round più lento {slowest} ms", file=sys.stderr)
+            ok = False
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
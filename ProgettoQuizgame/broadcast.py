@@ -0,0 +1,51 @@
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+from metrics import METRICS
+
+# Esito dell'invio a un singolo peer: elapsed è in secondi, error è None se l'invio è riuscito.
+SendReport = namedtuple("SendReport", ["peer", "ok", "elapsed", "error"])
+
+
+class Broadcaster:
+    """Invia lo stesso frame a tutti i peer in parallelo, con concorrenza e tempi limitati.
+
+    Un peer lento o irraggiungibile consuma al massimo la propria scadenza e non
+    ritarda gli altri: la latenza del broadcast non cresce con il numero di giocatori.
+    """
+
+    def __init__(self, pool, max_workers=16, timeout=2.0):
+        self.pool = pool
+        self.timeout = timeout  # Scadenza di default per ogni peer, in secondi
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="broadcast")
+
+    def broadcast(self, peers, frame, timeout=None):
+        """Invia il frame a tutti i peer e restituisce un SendReport per ciascuno."""
+        deadline = self.timeout if timeout is None else timeout
+        started = time.perf_counter()
+        futures = {self.executor.submit(self._send, peer, frame, deadline): peer for peer in peers}
+        wait(futures, timeout=deadline)
+
+        reports = []
+        for future, peer in futures.items():
+            if future.done():
+                reports.append(future.result())
+            else:
+                # L'invio prosegue in background ma non trattiene il chiamante oltre la scadenza
+                reports.append(SendReport(peer, False, time.perf_counter() - started, "timeout"))
+        METRICS.observe("broadcast", time.perf_counter() - started)
+        failures = sum(not report.ok for report in reports)
+        if failures:
+            METRICS.inc("broadcast.failures", failures)
+        return reports
+
+    def _send(self, peer, frame, deadline):
+        started = time.perf_counter()
+        try:
+            self.pool.send_frame(peer, frame, timeout=deadline)
+            return SendReport(peer, True, time.perf_counter() - started, None)
+        except OSError as e:
+            return SendReport(peer, False, time.perf_counter() - started, str(e) or type(e).__name__)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,179 @@
+"""Codifica compatta dei messaggi tra peer, negoziata alla registrazione.
+
+Un payload JSON inizia sempre con '{'; un payload compatto inizia con il codice
+del tipo di messaggio (1-31), quindi il ricevente riconosce il formato frame per
+frame e accetta sempre entrambi. Nel formato compatto:
+
+- i campi numerici sono impacchettati con struct;
+- i peer viaggiano come indice nella lista "peers" dello START (2 byte) invece
+  dell'oggetto {"host", "port"};
+- i testi fissi delle notifiche sono un indice nel catalogo NOTICES, ricostruito
+  da chi riceve.
+
+Un messaggio che non rientra esattamente nello schema del suo tipo (campi in più,
+tipi diversi, peer sconosciuto, testo libero) viene inviato in JSON: la
+decodifica restituisce sempre lo stesso dizionario che è stato codificato.
+"""
+import struct
+from protocol import HEADER, MAX_MESSAGE_SIZE, ROUTE, ROUTE_MARKER, ProtocolError, encode_message, decode_payload
+
+ENCODINGS = ("compact", "json")  # In ordine di preferenza
+
+# Testi delle notifiche: chi riceve li ricostruisce dalla porta del peer
+NOTICES = {
+    "BUZZ": ("Il peer {port} si è prenotato!, ha 10 secondi per rispondere",),
+    "WRONG_ANSWER": (
+        "Il player {port} ha risposto in maniera errata!",
+        "Il peer {port} ha impiegato troppo tempo a rispondere!",
+    ),
+    "CORRECT_ANSWER": ("Il player {port} ha risposto correttamente!",),
+    "END": ("FINE GIOCO: Il player {port} ha vinto!",),
+}
+
+# Tipi di campo: I intero senza segno a 32 bit, d float, ? booleano,
+# peer indice nella tabella dei peer, notice indice in NOTICES, text stringa finale UTF-8
+FIELD_FORMATS = {"I": "I", "d": "d", "?": "?", "peer": "H", "notice": "B"}
+
+# {tipo: (codice, [(campo, tipo di campo)])}; il campo text, se c'è, è sempre l'ultimo
+SCHEMAS = {
+    "BUZZ_REQUEST": (1, [("question_id", "I"), ("peer", "peer"), ("sent_at", "d")]),
+    "BUZZ_TIMEOUT": (2, [("question_id", "I"), ("peer", "peer")]),
+    # Decisioni dell'arbitro: "decision" è il loro numero d'ordine (vedi QuizPeer.stale_decision)
+    "BUZZ": (3, [("question_id", "I"), ("decision", "I"), ("peer", "peer"), ("sent_at", "d"), ("message", "notice")]),
+    "WRONG_ANSWER": (4, [("question_id", "I"), ("decision", "I"), ("peer", "peer"), ("message", "notice")]),
+    "CORRECT_ANSWER": (5, [("question_id", "I"), ("decision", "I"), ("peer", "peer"), ("message", "notice")]),
+    "END": (6, [("peer", "peer"), ("message", "notice")]),
+    "FEEDBACK": (7, [("question_id", "I"), ("correct", "?"), ("score", "I")]),
+    "QUESTION": (8, [("question_id", "I"), ("sent_at", "d"), ("question", "text")]),
+    "ANSWER": (9, [("question_id", "I"), ("answer", "text")]),
+}
+
+
+class Schema:
+    """Layout binario di un tipo di messaggio, precompilato in uno struct."""
+
+    __slots__ = ("name", "code", "fields", "keys", "text", "struct")
+
+    def __init__(self, name, code, fields):
+        self.name = name
+        self.code = code
+        self.text = fields[-1][0] if fields[-1][1] == "text" else None
+        self.fields = [field for field in fields if field[1] != "text"]
+        self.keys = frozenset(["type"] + [name for name, _ in fields])
+        self.struct = struct.Struct("!B" + "".join(FIELD_FORMATS[kind] for _, kind in self.fields))
+
+
+SCHEMA_BY_TYPE = {name: Schema(name, code, fields) for name, (code, fields) in SCHEMAS.items()}
+SCHEMA_BY_CODE = {schema.code: schema for schema in SCHEMA_BY_TYPE.values()}
+
+
+def negotiate(offers):
+    """Codifica comune a tutti i peer di una partita; chi non ne dichiara nessuna parla solo JSON."""
+    common = set(ENCODINGS)
+    for offer in offers:
+        common &= set(offer or ("json",))
+    return next(encoding for encoding in ENCODINGS if encoding in common or encoding == "json")
+
+
+class MessageCodec:
+    """Codifica e decodifica i messaggi tra peer di una partita.
+
+    La decodifica accetta sempre entrambi i formati; la codifica usa quello
+    compatto solo dopo che lo START lo ha scelto per la partita.
+    """
+
+    def __init__(self, encoding="json", peers=()):
+        self.configure(encoding, peers)
+
+    def configure(self, encoding, peers):
+        """Imposta la codifica negoziata e la tabella dei peer (la lista dello START, uguale per tutti)."""
+        self.peers = [tuple(peer) for peer in peers]
+        self.peer_ids = {peer: index for index, peer in enumerate(self.peers)}
+        self.compact = encoding == "compact"
+
+    def encode(self, message):
+        """Restituisce il frame (header compreso) del messaggio."""
+        if self.compact:
+            payload = self.pack(message)
+            if payload is not None:
+                return HEADER.pack(len(payload)) + payload
+        return encode_message(message)
+
+    def pack(self, message):
+        """Payload compatto del messaggio, oppure None se non rientra nel suo schema."""
+        schema = SCHEMA_BY_TYPE.get(message.get("type"))
+        if schema is None or message.keys() != schema.keys:
+            return None
+        values = [schema.code]
+        for name, kind in schema.fields:
+            value = message[name]
+            if kind == "I":
+                if type(value) is not int or not 0 <= value <= 0xFFFFFFFF:
+                    return None
+            elif kind == "d":
+                if type(value) is not float:
+                    return None
+            elif kind == "?":
+                if type(value) is not bool:
+                    return None
+            elif kind == "peer":
+                if not isinstance(value, dict) or value.keys() != {"host", "port"}:
+                    return None
+                value = self.peer_ids.get((value["host"], value["port"]))
+                if value is None:
+                    return None
+            elif kind == "notice":
+                port = message["peer"]["port"]
+                templates = NOTICES[schema.name]
+                value = next((i for i, template in enumerate(templates) if template.format(port=port) == value), None)
+                if value is None:
+                    return None  # Testo personalizzato: lo porta il JSON
+            values.append(value)
+        payload = schema.struct.pack(*values)
+        if schema.text is not None:
+            text = message[schema.text]
+            if not isinstance(text, str):
+                return None
+            payload += text.encode()
+        if len(payload) > MAX_MESSAGE_SIZE:
+            raise ProtocolError(f"Messaggio troppo grande: {len(payload)} byte")
+        return payload
+
+    def decode(self, payload):
+        """Decodifica un payload in uno dei due formati.
+
+        Un frame inoltrato dall'hub porta l'indice del mittente: il messaggio
+        viene decodificato con la chiave "sender" = (host, porta) aggiunta.
+        """
+        if payload[:1] == b"{":
+            return decode_payload(payload)
+        if payload[:1] == bytes((ROUTE_MARKER,)) and len(payload) > ROUTE.size:
+            _, index = ROUTE.unpack_from(payload)
+            if index >= len(self.peers):
+                raise ProtocolError(f"Mittente sconosciuto: {index}")
+            message = self.decode(payload[ROUTE.size:])
+            message["sender"] = self.peers[index]
+            return message
+        schema = SCHEMA_BY_CODE.get(payload[0]) if payload else None
+        if schema is None or len(payload) < schema.struct.size:
+            raise ProtocolError(f"Payload compatto non valido ({len(payload)} byte)")
+        values = schema.struct.unpack_from(payload)
+        message = {"type": schema.name}
+        for (name, kind), value in zip(schema.fields, values[1:]):
+            if kind == "peer":
+                if value >= len(self.peers):
+                    raise ProtocolError(f"Peer sconosciuto: {value}")
+                host, port = self.peers[value]
+                value = {"host": host, "port": port}
+            elif kind == "notice":
+                try:
+                    value = NOTICES[schema.name][value].format(port=message["peer"]["port"])
+                except IndexError:
+                    raise ProtocolError(f"Notifica sconosciuta: {value}") from None
+            message[name] = value
+        if schema.text is not None:
+            try:
+                message[schema.text] = payload[schema.struct.size:].decode()
+            except UnicodeDecodeError as e:
+                raise ProtocolError(f"Payload non valido: {e}") from e
+        return message
@@ -0,0 +1,162 @@
+import selectors
+import socket
+import threading
+from collections import deque
+from protocol import Connection, ProtocolError
+from metrics import METRICS, get_logger
+
+log = get_logger("collector")
+
+
+class AnswerCollector:
+    """Canali delle domande del presentatore, sorvegliati da un solo thread.
+
+    Il presentatore apre un canale verso ogni giocatore alla prima domanda e lo
+    riusa per tutta la partita. Un unico ciclo selectors legge le risposte di
+    tutti i giocatori e le passa a on_message(peer, conn, messaggio): qui c'è
+    solo il trasporto, la logica del round resta al presentatore.
+    """
+
+    def __init__(self, on_message, on_close=None, connect_timeout=3.0, codec=None):
+        self.on_message = on_message
+        self.codec = codec  # Codifica negoziata per la partita, usata anche per il feedback
+        self.on_close = on_close  # Chiamata con l'indirizzo del giocatore quando un canale si chiude
+        self.connect_timeout = connect_timeout
+        self.selector = selectors.DefaultSelector()
+        self.channels = {}  # {(host, port): Connection}
+        self.lock = threading.Lock()
+        self.open_lock = threading.Lock()  # Un solo thread alla volta apre canali: niente canali doppi
+        self.tasks = deque()  # Operazioni sul selector da eseguire nel thread del ciclo
+        # Coppia di socket per svegliare select() quando arriva un nuovo canale
+        self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+        self.wakeup_reader.setblocking(False)
+        self.selector.register(self.wakeup_reader, selectors.EVENT_READ, None)
+        self.thread = None
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def call_soon(self, task):
+        """Accoda un'operazione per il thread del ciclo e lo sveglia."""
+        self.tasks.append(task)
+        try:
+            self.wakeup_writer.send(b"\0")
+        except OSError:
+            pass  # Buffer pieno: il ciclo è già stato svegliato
+
+    def send_all(self, peers, frame):
+        """Invia lo stesso frame a tutti i giocatori in un solo passaggio; restituisce quelli raggiunti.
+
+        Solo i giocatori senza canale richiedono una connessione: dal secondo round
+        in poi l'invio è un sendall per giocatore, senza thread né handshake.
+        """
+        self.start()
+        targets = []
+        with self.open_lock:
+            for peer in peers:
+                with self.lock:
+                    conn = self.channels.get(peer)
+                if conn is None:
+                    try:
+                        conn = self.open_channel(peer)
+                    except OSError as e:
+                        log.warning("Impossibile connettersi al peer %s: %s", peer, e)
+                        continue
+                targets.append((peer, conn))
+        delivered = []
+        for peer, conn in targets:
+            try:
+                conn.send_frame(frame)
+                delivered.append(peer)
+            except OSError as e:
+                log.warning("Impossibile inviare la domanda al peer %s: %s", peer, e)
+                self.drop(peer)
+        return delivered
+
+    def warm(self, peers):
+        """Apre in anticipo i canali mancanti, così la prima domanda parte senza handshake."""
+        self.start()
+        with self.open_lock:
+            for peer in peers:
+                with self.lock:
+                    if peer in self.channels:
+                        continue
+                try:
+                    self.open_channel(peer)
+                except OSError as e:
+                    log.debug("Canale verso %s non aperto in anticipo: %s", peer, e)
+
+    def open_channel(self, peer):
+        conn = Connection.connect(peer, timeout=self.connect_timeout, codec=self.codec)
+        conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn.meter = METRICS.meter(peer)
+        with self.lock:
+            self.channels[peer] = conn
+        self.call_soon(lambda: self.selector.register(conn.sock, selectors.EVENT_READ, (peer, conn)))
+        return conn
+
+    def drop(self, peer):
+        """Chiude il canale verso un giocatore (da qualunque thread)."""
+        with self.lock:
+            conn = self.channels.pop(peer, None)
+        if conn is not None:
+            self.call_soon(lambda: self.forget(peer, conn))
+
+    def drop_all(self):
+        """Chiude tutti i canali, ad esempio a fine partita."""
+        with self.lock:
+            peers = list(self.channels)
+        for peer in peers:
+            self.drop(peer)
+
+    def forget(self, peer, conn):
+        try:
+            self.selector.unregister(conn.sock)
+        except (KeyError, ValueError):
+            pass  # Mai registrato o già chiuso
+        conn.close()
+        if self.on_close:
+            self.on_close(peer)
+
+    def run(self):
+        """Ciclo unico di raccolta, attivo per tutta la partita."""
+        while True:
+            for key, _ in self.selector.select():
+                if key.data is None:
+                    self.run_tasks()
+                    continue
+                peer, conn = key.data
+                try:
+                    messages = conn.recv_ready()
+                except (OSError, ProtocolError) as e:
+                    log.info("Errore nella comunicazione con il peer %s: %s", peer, e)
+                    messages = None
+                if messages is None:
+                    with self.lock:
+                        owned = self.channels.get(peer) is conn
+                        if owned:
+                            del self.channels[peer]
+                    if owned:  # Altrimenti è già stato chiuso con drop()
+                        self.forget(peer, conn)
+                    continue
+                for message in messages:
+                    try:
+                        self.on_message(peer, conn, message)
+                    except Exception as e:
+                        log.exception("Errore nella gestione del messaggio di %s: %s", peer, e)
+
+    def run_tasks(self):
+        try:
+            while self.wakeup_reader.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        while self.tasks:
+            task = self.tasks.popleft()
+            try:
+                task()
+            except (KeyError, ValueError, OSError) as e:
+                log.debug("Operazione sul canale non riuscita: %s", e)
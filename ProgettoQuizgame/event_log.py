@@ -0,0 +1,143 @@
+"""Registro degli eventi di gioco su file, in sola aggiunta.
+
+Ogni evento è una riga JSON con l'istante ("t"), il tipo ("event") e i suoi
+campi: REGISTER, START, QUESTION, BUZZ, ANSWER, END e gli eventi dei tornei.
+Chi registra un evento lo accoda soltanto; un thread dedicato scrive gli
+eventi a blocchi con una sola write e, secondo la politica scelta, fa fsync:
+
+- "never": i dati restano nella cache del sistema operativo (sopravvivono a un
+  crash del processo, non a uno del sistema);
+- "batch": un fsync per blocco (predefinito);
+- "always": un fsync per evento, il più lento.
+
+Dopo un crash l'ultima riga può essere troncata: la lettura la salta. I file
+si leggono un evento alla volta (riga per riga o da un mmap), senza caricarli
+interi in memoria: vedi replay.py.
+"""
+import atexit
+import json
+import mmap
+import os
+import queue
+import threading
+import time
+from metrics import METRICS, get_logger
+
+log = get_logger("event_log")
+
+SYNC_MODES = ("never", "batch", "always")
+decode_event = json.JSONDecoder().decode  # Su str: evita il rilevamento della codifica di json.loads a ogni riga
+
+
+class EventLog:
+    """Scrittore asincrono di eventi su un file in sola aggiunta."""
+
+    def __init__(self, path, sync="batch", batch_size=512, flush_interval=0.05):
+        if sync not in SYNC_MODES:
+            raise ValueError(f"Politica di fsync non valida: {sync} (valori ammessi: {', '.join(SYNC_MODES)})")
+        self.path = path
+        self.sync = sync
+        self.batch_size = 1 if sync == "always" else batch_size
+        self.flush_interval = flush_interval  # Attesa massima di un evento prima di essere scritto
+        self.file = open(path, "ab")
+        self.queue = queue.SimpleQueue()
+        self.closed = False
+        self.written = 0
+        self.dropped = 0  # Eventi arrivati dopo close: contati e segnalati, non scritti
+        self.lock = threading.Lock()  # Nessun evento può finire in coda dopo il segnale di chiusura
+        self.thread = threading.Thread(target=self.run, name="event-log", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)  # Gli eventi ancora in coda vengono scritti all'uscita
+
+    def record(self, event, **fields):
+        """Accoda un evento con l'istante corrente; la serializzazione avviene nel thread di scrittura."""
+        fields["t"] = time.time()
+        fields["event"] = event
+        self.append(fields)
+
+    def append(self, event):
+        """Accoda un evento già completo di "t" ed "event" (ad esempio copiato da un altro registro)."""
+        with self.lock:
+            if not self.closed:
+                self.queue.put(event)
+                return
+            self.dropped += 1
+        METRICS.inc("event_log.dropped")
+        log.warning("Evento %s registrato dopo la chiusura di %s: scartato", event.get("event"), self.path)
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] is not None:
+                try:
+                    batch.append(self.queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            stop = batch[-1] is None
+            if stop:
+                batch.pop()
+            if batch:
+                self.write(batch)
+            if stop:
+                break
+
+    def write(self, batch):
+        started = time.perf_counter()
+        data = "".join(json.dumps(event, separators=(",", ":")) + "\n" for event in batch).encode()
+        try:
+            self.file.write(data)
+            self.file.flush()
+            if self.sync != "never":
+                os.fsync(self.file.fileno())
+        except OSError as e:
+            log.error("Eventi non scritti su %s: %s", self.path, e)
+            METRICS.inc("event_log.errors")
+            return
+        self.written += len(batch)
+        METRICS.inc("event_log.events", len(batch))
+        METRICS.observe("event_log.write", time.perf_counter() - started)
+
+    def close(self):
+        """Scrive gli eventi in coda e chiude il file."""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.queue.put(None)
+        self.thread.join()
+        self.file.close()
+
+
+class EventReader:
+    """Legge gli eventi di un file uno alla volta, riga per riga o da un mmap del file."""
+
+    def __init__(self, path, use_mmap=False):
+        self.path = path
+        self.use_mmap = use_mmap
+        self.corrupted = 0  # Righe non valide saltate (ad esempio l'ultima, troncata da un crash)
+
+    def __iter__(self):
+        lines = self.mapped_lines() if self.use_mmap else self.file_lines()
+        for line in lines:
+            try:
+                yield decode_event(line)
+            except ValueError:
+                self.corrupted += 1
+
+    def file_lines(self):
+        with open(self.path, encoding="utf-8", errors="replace", buffering=1024 * 1024) as f:
+            yield from f
+
+    def mapped_lines(self):
+        with open(self.path, "rb") as f:
+            if not os.fstat(f.fileno()).st_size:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                offset, end = 0, len(data)
+                while offset < end:
+                    line_end = data.find(b"\n", offset)
+                    if line_end < 0:
+                        line_end = end
+                    yield data[offset:line_end].decode("utf-8", "replace")
+                    offset = line_end + 1
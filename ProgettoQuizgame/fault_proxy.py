@@ -0,0 +1,216 @@
+"""Proxy TCP con guasti di rete simulati, per provare il gioco in condizioni WAN su loopback.
+
+Un FaultProxy ascolta su una porta locale e inoltra ogni connessione verso una
+destinazione (il server o la porta in ascolto di un peer), applicando in
+ciascuna direzione:
+
+- latency e jitter: ritardo di sola andata di ogni blocco letto; l'ordine dei
+  byte resta quello di TCP (un blocco non supera mai il precedente);
+- bandwidth: byte al secondo, con il tempo di trasmissione di ogni blocco;
+- coalesce: i blocchi in arrivo entro la finestra vengono scritti insieme,
+  come fanno Nagle, i router e le schede di rete sotto carico;
+- reset_rate: probabilità per blocco di chiudere la connessione con un RST.
+
+Tutti i proxy girano su un solo event loop in un thread dedicato (ProxyLoop);
+i numeri casuali vengono da un seed per proxy, così le prove sono ripetibili.
+I peer passano dal proxy annunciando al server la porta del proxy invece della
+propria (QuizPeer.advertised_port): vedi bench_latency.py.
+
+Uso: python fault_proxy.py 12346 localhost:12345 --latency 40 --jitter 10 --bandwidth 64000
+"""
+import argparse
+import asyncio
+import random
+import socket
+import struct
+import threading
+from dataclasses import dataclass
+from metrics import METRICS, get_logger, setup_logging
+
+log = get_logger("fault_proxy")
+
+READ_SIZE = 65536
+QUEUE_LIMIT = 64  # Blocchi in transito per direzione: oltre, la lettura si ferma (controllo di flusso TCP)
+
+
+@dataclass
+class Faults:
+    """Guasti applicati da un proxy; tempi in secondi, banda in byte al secondo (None: illimitata)."""
+
+    latency: float = 0.0
+    jitter: float = 0.0
+    bandwidth: float = None
+    coalesce: float = 0.0
+    reset_rate: float = 0.0
+
+
+class FaultProxy:
+    """Inoltra le connessioni verso target applicando i guasti di faults."""
+
+    def __init__(self, target, faults=None, host="127.0.0.1", port=0, seed=None):
+        self.target = target
+        self.faults = faults or Faults()
+        self.host = host
+        self.port = port  # 0: porta scelta dal sistema, nota dopo start()
+        self.rng = random.Random(seed)
+        self.server = None
+        self.connections = 0
+        self.bytes = 0
+        self.resets = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.port
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+
+    async def handle(self, reader, writer):
+        try:
+            upstream_reader, upstream_writer = await asyncio.open_connection(*self.target)
+        except OSError as e:
+            log.warning("Destinazione %s non raggiungibile: %s", self.target, e)
+            writer.close()
+            return
+        self.connections += 1
+        link = [writer, upstream_writer]
+        await asyncio.gather(self.pipe(reader, upstream_writer, link), self.pipe(upstream_reader, writer, link))
+        for end in link:
+            end.close()
+
+    async def pipe(self, reader, writer, link):
+        """Una direzione della connessione: legge, assegna a ogni blocco l'istante di consegna e lo accoda."""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(QUEUE_LIMIT)
+        sender = loop.create_task(self.deliver(queue, writer))
+        faults = self.faults
+        due = 0.0
+        try:
+            while True:
+                data = await reader.read(READ_SIZE)
+                if not data:
+                    break
+                if faults.reset_rate and self.rng.random() < faults.reset_rate:
+                    self.reset(link)
+                    break
+                delay = faults.latency + (self.rng.uniform(-faults.jitter, faults.jitter) if faults.jitter else 0.0)
+                due = max(due, loop.time() + max(0.0, delay))  # Il jitter non riordina i byte
+                await queue.put((due, data))
+        except OSError:
+            pass
+        await queue.put(None)
+        await sender
+
+    async def deliver(self, queue, writer):
+        loop = asyncio.get_running_loop()
+        faults = self.faults
+        free_at = 0.0  # Fine della trasmissione del blocco precedente (banda limitata)
+        held = []  # Blocco già tolto dalla coda ma non ancora da consegnare
+        while True:
+            item = held.pop() if held else await queue.get()
+            if item is None:
+                break
+            due, data = item
+            await asyncio.sleep(due - loop.time())
+            if faults.coalesce:
+                await asyncio.sleep(faults.coalesce)
+                chunks = [data]
+                while not queue.empty():
+                    item = queue.get_nowait()
+                    if item is None or item[0] > loop.time():
+                        held.append(item)
+                        break
+                    chunks.append(item[1])
+                data = b"".join(chunks)
+            if faults.bandwidth:
+                free_at = max(free_at, loop.time()) + len(data) / faults.bandwidth
+                await asyncio.sleep(free_at - loop.time())
+            if writer.is_closing():
+                continue  # Destinazione chiusa: i blocchi rimasti vengono scartati senza fermare la lettura
+            writer.write(data)
+            self.bytes += len(data)
+            try:
+                await writer.drain()
+            except OSError:
+                pass
+        if writer.can_write_eof() and not writer.is_closing():
+            try:
+                writer.write_eof()  # Mezza chiusura: l'altra direzione può ancora finire
+            except OSError:
+                pass
+
+    def reset(self, link):
+        """Chiude entrambi i lati con un RST (SO_LINGER a zero) invece di un FIN."""
+        self.resets += 1
+        METRICS.inc("proxy.resets")
+        for end in link:
+            sock = end.get_extra_info("socket")
+            if sock is not None:
+                try:
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+                except OSError:
+                    pass
+            end.transport.abort()
+
+    def stats(self):
+        return {"connections": self.connections, "bytes": self.bytes, "resets": self.resets}
+
+
+class ProxyLoop:
+    """Event loop in un thread dedicato che ospita tutti i proxy di una prova."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.proxies = []
+        self.thread = threading.Thread(target=self.loop.run_forever, name="fault-proxy", daemon=True)
+        self.thread.start()
+
+    def proxy(self, target, faults=None, seed=None):
+        """Avvia un proxy verso target e lo restituisce già in ascolto (porta in proxy.port)."""
+        proxy = FaultProxy(target, faults, seed=seed)
+        asyncio.run_coroutine_threadsafe(proxy.start(), self.loop).result()
+        self.proxies.append(proxy)
+        return proxy
+
+    def stats(self):
+        totals = {"proxies": len(self.proxies), "connections": 0, "bytes": 0, "resets": 0}
+        for proxy in self.proxies:
+            for key, value in proxy.stats().items():
+                totals[key] += value
+        return totals
+
+    def close(self):
+        for proxy in self.proxies:
+            self.loop.call_soon_threadsafe(proxy.close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(1.0)
+
+
+def main():
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Proxy TCP con latenza, jitter, banda limitata, coalescing e reset.")
+    parser.add_argument("port", type=int, help="porta locale del proxy")
+    parser.add_argument("target", help="host:porta di destinazione")
+    parser.add_argument("--latency", type=float, default=0.0, help="ritardo di sola andata in ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="variazione massima del ritardo in ms")
+    parser.add_argument("--bandwidth", type=float, help="byte al secondo per direzione")
+    parser.add_argument("--coalesce", type=float, default=0.0, help="finestra di accorpamento dei blocchi in ms")
+    parser.add_argument("--reset", type=float, default=0.0, help="probabilità di RST per blocco inoltrato")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    host, port = args.target.rsplit(":", 1)
+    faults = Faults(args.latency / 1000, args.jitter / 1000, args.bandwidth, args.coalesce / 1000, args.reset)
+    proxy = FaultProxy((host, int(port)), faults, port=args.port, seed=args.seed)
+
+    async def serve():
+        await proxy.start()
+        print(f"Proxy in ascolto sulla porta {proxy.port} verso {args.target}: {faults}")
+        await proxy.server.serve_forever()
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""Hub di inoltro del server (modalità relay).
+
+Ogni peer tiene una sola connessione persistente verso il server e pubblica un
+evento una volta sola; l'hub lo inoltra ai peer della stanza. Il traffico per
+evento è O(N) invece dell'O(N²) della rete tra peer, e i peer non devono
+accettare connessioni in ingresso.
+
+L'hub non decodifica i messaggi: legge solo la busta ROUTE (destinatario),
+la sostituisce con l'indice del mittente e scrive lo stesso frame a tutti i
+destinatari. Ogni destinatario ha una coda di scrittura limitata: chi pubblica
+attende al massimo put_timeout se la coda è piena, poi il peer lento viene
+disconnesso invece di rallentare tutta la stanza.
+"""
+import asyncio
+import queue
+import socket
+import threading
+from protocol import HEADER, ROUTE, ROUTE_MARKER, TO_ALL, TO_OTHERS, ProtocolError, route_frame
+from metrics import METRICS, get_logger
+
+log = get_logger("hub")
+
+
+class Subscriber:
+    """Coda di scrittura limitata verso un peer, svuotata da un thread dedicato."""
+
+    def __init__(self, conn, addr, limit=256, put_timeout=1.0):
+        self.conn = conn
+        self.addr = addr
+        self.put_timeout = put_timeout
+        self.queue = queue.Queue(limit)
+        self.closed = False
+        self.thread = threading.Thread(target=self.drain, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def put(self, frame):
+        """Accoda un frame; False se il peer è chiuso o troppo lento e viene scollegato."""
+        if self.closed:
+            return False
+        try:
+            self.queue.put(frame, timeout=self.put_timeout)
+            return True
+        except queue.Full:
+            log.warning("Peer %s troppo lento: disconnesso dall'hub", self.addr)
+            METRICS.inc("hub.slow_subscribers")
+            self.close()
+            return False
+
+    def drain(self):
+        while True:
+            frame = self.queue.get()
+            if frame is None:
+                break
+            try:
+                self.conn.send_frame(frame)
+            except OSError as e:
+                log.info("Errore nell'inoltro a %s: %s", self.addr, e)
+                self.close()
+                break
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.conn.sock.shutdown(socket.SHUT_RDWR)  # Sblocca anche il ciclo di lettura del server
+        except OSError:
+            pass
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass  # Il thread di scrittura uscirà al primo errore di invio
+
+
+class AsyncSubscriber:
+    """Destinatario asyncio: il buffer del trasporto fa da coda, limitato a limit_bytes."""
+
+    def __init__(self, writer, addr, limit_bytes=1024 * 1024):
+        self.writer = writer
+        self.conn = writer  # Come in Subscriber: la connessione del destinatario
+        self.addr = addr
+        self.limit_bytes = limit_bytes
+        self.closed = False
+        self.meter = METRICS.meter(addr)
+
+    def put(self, frame):
+        if self.closed:
+            return False
+        if self.writer.transport.get_write_buffer_size() > self.limit_bytes:
+            log.warning("Peer %s troppo lento: disconnesso dall'hub", self.addr)
+            METRICS.inc("hub.slow_subscribers")
+            self.close()
+            return False
+        self.writer.write(frame)
+        self.meter(len(frame), 0)
+        return True
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.writer.close()
+
+
+class Backlog:
+    """Frame per un peer disconnesso che può ancora riprendere la sessione (vedi sessions.py).
+
+    Alla ripresa i frame passano, nell'ordine, al destinatario della nuova
+    connessione; da quel momento anche quelli che arrivano qui gli vengono girati.
+    """
+
+    def __init__(self, addr, limit=256):
+        self.conn = None
+        self.addr = addr
+        self.limit = limit
+        self.frames = []
+        self.closed = False
+        self.target = None  # Destinatario della nuova connessione, dopo la ripresa
+        self.lock = threading.Lock()
+
+    def put(self, frame):
+        with self.lock:
+            if self.target is not None:
+                return self.target.put(frame)
+            if self.closed or len(self.frames) >= self.limit:
+                self.close()  # Troppo indietro: recupererà lo stato dal RESUMED
+                return False
+            self.frames.append(frame)
+            return True
+
+    def hand_over(self, subscriber):
+        with self.lock:
+            if not self.closed:
+                for frame in self.frames:
+                    subscriber.put(frame)
+            self.frames = []
+            self.target = subscriber
+
+    def close(self):
+        self.closed = True
+        self.frames = []
+
+
+class RoomChannel:
+    """Destinatari di una stanza, nello stesso ordine della lista "peers" dello START."""
+
+    def __init__(self, subscribers):
+        self.subscribers = subscribers
+        self.index = {subscriber.addr: i for i, subscriber in enumerate(subscribers)}
+
+
+class RelayHub:
+    """Inoltra i frame pubblicati dai peer agli altri peer della stessa stanza."""
+
+    def __init__(self, queue_limit=256, put_timeout=1.0):
+        self.queue_limit = queue_limit
+        self.put_timeout = put_timeout
+        self.channels = {}  # {room_id: RoomChannel} della partita in corso
+        self.subscribers = {}  # {room_id: {indirizzo: destinatario}}, riusati da una partita all'altra
+        self.lock = threading.Lock()
+        self.forwarded = 0  # Frame scritti ai destinatari
+
+    def attach(self, room, start_frame, peers=None):
+        """Prepara l'inoltro per una partita della stanza e consegna lo START ai suoi peer.
+
+        peers sono gli indirizzi della partita, nell'ordine dello START (default:
+        tutta la stanza). Lo START è il primo frame nella coda di ogni nuovo
+        destinatario e i thread di scrittura partono solo dopo che la partita è
+        registrata: nessun evento inoltrato può precedere lo START di un peer.
+        Nelle partite successive (tornei) i destinatari esistenti vengono riusati.
+        """
+        connections = dict((addr, conn) for conn, addr in room.peers)
+        peers = list(connections) if peers is None else peers
+        with self.lock:
+            known = self.subscribers.setdefault(room.room_id, {})
+        created = []
+        subscribers = []
+        for addr in peers:
+            subscriber = known.get(addr)
+            if subscriber is None:
+                subscriber = known[addr] = self.subscriber(connections[addr], addr)
+                if isinstance(subscriber, Subscriber):
+                    created.append(subscriber)
+            subscriber.put(start_frame)
+            subscribers.append(subscriber)
+        with self.lock:
+            self.channels[room.room_id] = RoomChannel(subscribers)
+        for subscriber in created:
+            subscriber.start()
+
+    def subscriber(self, conn, addr):
+        if isinstance(conn, asyncio.StreamWriter):
+            return AsyncSubscriber(conn, addr)
+        return Subscriber(conn, addr, self.queue_limit, self.put_timeout)
+
+    def install(self, room, addr, subscriber, conn=None):
+        """Mette subscriber al posto del destinatario del peer; con conn solo se questo usa ancora quella connessione.
+
+        Restituisce il destinatario sostituito, None se non c'era nulla da sostituire.
+        """
+        with self.lock:
+            known = self.subscribers.get(room.room_id)
+            previous = known.get(addr) if known is not None else None
+            if previous is None or (conn is not None and previous.conn is not conn):
+                return None
+            known[addr] = subscriber
+            channel = self.channels.get(room.room_id)
+            if channel is not None and addr in channel.index:
+                channel.subscribers[channel.index[addr]] = subscriber  # Stesso indice della lista dello START
+        return previous
+
+    def park(self, room, addr, conn):
+        """Connessione del peer persa: i frame per lui restano in un Backlog in attesa della ripresa."""
+        previous = self.install(room, addr, Backlog(addr, self.queue_limit), conn)
+        if previous is not None:
+            previous.close()
+
+    def replace(self, room, addr, conn):
+        """Ripresa di una sessione: i frame per il peer passano sulla sua nuova connessione.
+
+        Prima quelli accumulati nel Backlog mentre era disconnesso; quelli persi
+        con la vecchia connessione il peer li recupera dallo stato del RESUMED.
+        """
+        subscriber = self.subscriber(conn, addr)
+        if isinstance(subscriber, Subscriber):
+            subscriber.start()
+        backlog = self.subscribers.get(room.room_id, {}).get(addr)
+        if isinstance(backlog, Backlog):
+            backlog.hand_over(subscriber)  # Prima di install: i frame pubblicati nel frattempo seguono quelli accumulati
+        previous = self.install(room, addr, subscriber)
+        if previous is not None and not isinstance(previous, Backlog):
+            previous.close()  # Il server non si era ancora accorto della caduta
+
+    def deliver(self, room, addrs, frame):
+        """Accoda un frame del server ai peer indicati, in ordine con gli eventi inoltrati; restituisce i peer raggiunti."""
+        known = self.subscribers.get(room.room_id, {})
+        return [addr for addr in addrs if addr in known and known[addr].put(frame)]
+
+    def detach(self, room):
+        with self.lock:
+            self.channels.pop(room.room_id, None)
+            subscribers = self.subscribers.pop(room.room_id, {})
+        for subscriber in subscribers.values():
+            subscriber.close()
+
+    def publish(self, room, sender, payload):
+        """Inoltra il payload imbustato del mittente; restituisce il numero di destinatari raggiunti."""
+        channel = self.channels.get(room.room_id)
+        if channel is None:
+            return 0
+        if len(payload) <= ROUTE.size or payload[0] != ROUTE_MARKER:
+            raise ProtocolError("Frame senza busta di inoltro")
+        source = channel.index.get(sender)
+        if source is None:
+            return 0
+        _, target = ROUTE.unpack_from(payload)
+        # Stesso frame per tutti: la busta porta ora l'indice del mittente
+        forwarded = bytearray(HEADER.pack(len(payload))) + payload
+        ROUTE.pack_into(forwarded, HEADER.size, ROUTE_MARKER, source)
+        frame = bytes(forwarded)
+        if target == TO_ALL:
+            targets = channel.subscribers
+        elif target == TO_OTHERS:
+            targets = [subscriber for i, subscriber in enumerate(channel.subscribers) if i != source]
+        elif target < len(channel.subscribers):
+            targets = [channel.subscribers[target]]
+        else:
+            raise ProtocolError(f"Destinatario sconosciuto: {target}")
+        delivered = sum(subscriber.put(frame) for subscriber in targets)
+        self.forwarded += delivered
+        METRICS.inc("hub.published")
+        METRICS.inc("hub.forwarded", delivered)
+        return delivered
+
+    def unsubscribe(self, room, addr, conn=None):
+        """Chiude il destinatario del peer; con conn solo se usa ancora quella connessione."""
+        known = self.subscribers.get(room.room_id, {})
+        with self.lock:
+            subscriber = known.get(addr)
+            if subscriber is None or (conn is not None and subscriber.conn is not conn):
+                return  # Sessione già ripresa su un'altra connessione
+            del known[addr]
+        subscriber.close()
+
+
+class RelayChannel:
+    """Canale verso un singolo peer attraverso l'hub: si usa come una Connection."""
+
+    def __init__(self, conn, codec, addr):
+        self.conn = conn  # Connessione verso il server
+        self.codec = codec
+        self.addr = addr
+        self.target = codec.peer_ids[addr]  # Indice del peer nella lista dello START
+
+    def send(self, message):
+        self.send_frame(self.codec.encode(message))
+
+    def send_frame(self, frame):
+        self.conn.send_frame(route_frame(frame, self.target))
+
+    def close(self):
+        pass  # La connessione verso il server resta aperta
@@ -0,0 +1,70 @@
+"""Vitalità delle connessioni: scadenze dei socket, heartbeat e peer morti.
+
+Ogni peer invia un HEARTBEAT al server a intervalli regolari sulla connessione
+di registrazione. Il server legge quella connessione con una scadenza pari a
+qualche intervallo: se non arriva nulla entro la scadenza, o la connessione si
+chiude, il peer è considerato morto. Viene tolto dalla stanza e gli altri peer
+ricevono un PEER_LEFT per rimuoverlo da lista dei peer e classifica.
+"""
+import threading
+from protocol import HEADER, encode_message
+from metrics import get_logger
+
+log = get_logger("liveness")
+
+HEARTBEAT_INTERVAL = 2.0  # Secondi tra due heartbeat
+MISSED_HEARTBEATS = 3  # Heartbeat mancati prima di dichiarare morto un peer
+REGISTER_TIMEOUT = 10.0  # Tempo concesso a una nuova connessione per inviare il REGISTER
+CONNECT_TIMEOUT = 5.0  # Connessione al server
+
+HEARTBEAT_FRAME = encode_message({"type": "HEARTBEAT"})
+HEARTBEAT_PAYLOAD = HEARTBEAT_FRAME[HEADER.size:]  # Riconosciuto anche dall'hub, che non decodifica i frame
+
+
+class Liveness:
+    """Scadenze usate dal server: il peer le riceve nel REGISTERED."""
+
+    def __init__(self, interval=HEARTBEAT_INTERVAL, missed=MISSED_HEARTBEATS, register_timeout=REGISTER_TIMEOUT):
+        self.interval = interval
+        self.missed = missed
+        self.register_timeout = register_timeout
+
+    @property
+    def dead_after(self):
+        """Silenzio massimo di un peer registrato; vale anche come scadenza degli invii verso di lui."""
+        return self.interval * self.missed
+
+
+class Heartbeat:
+    """Invia periodicamente un HEARTBEAT sulla connessione al server finché non viene fermato."""
+
+    def __init__(self, conn, interval=HEARTBEAT_INTERVAL):
+        self.conn = conn
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.conn.send_frame(HEARTBEAT_FRAME)
+            except OSError as e:
+                log.warning("Heartbeat non inviato, connessione al server persa: %s", e)
+                break
+
+    def stop(self):
+        self.stopped.set()
+
+
+def peer_left(peer_addr):
+    """Messaggio PEER_LEFT con cui il server comunica l'uscita di un peer."""
+    return {
+        "type": "PEER_LEFT",
+        "message": f"Il player {peer_addr[1]} ha lasciato la partita!",
+        "peer": {"host": peer_addr[0], "port": peer_addr[1]},
+    }
@@ -0,0 +1,236 @@
+"""Metriche e log del server e dei peer.
+
+- Contatori, istogrammi di latenza a bucket fissi e byte inviati/ricevuti per
+  peer, raccolti in un registro Metrics (METRICS è quello condiviso dal processo).
+  Ogni registrazione costa un lock e pochi confronti; con enabled = False
+  diventa un solo controllo.
+- Le metriche si leggono da un endpoint HTTP locale (GET /metrics, JSON) o da
+  un file JSON riscritto periodicamente.
+- I log passano da una coda: chi scrive non attende mai l'I/O, lo fa un thread
+  dedicato. I messaggi per ogni evento sono a livello DEBUG, quindi con il
+  livello predefinito (INFO) costano solo il controllo del livello.
+"""
+import bisect
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Limiti superiori dei bucket degli istogrammi, in secondi (da 100 µs a 10 s)
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MAX_TRAFFIC_PEERS = 4096  # Contatori di traffico tenuti al massimo: oltre, si scartano i più vecchi
+LOG_FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+
+
+class Histogram:
+    """Istogramma di latenze a bucket fissi: memoria costante, percentili approssimati al bucket."""
+
+    __slots__ = ("counts", "count", "total", "max", "lock")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # L'ultimo bucket raccoglie tutto oltre i 10 s
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(BUCKETS, seconds)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def percentile(self, fraction):
+        """Limite superiore del bucket che contiene il percentile richiesto."""
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(BUCKETS[index], self.max) if index < len(BUCKETS) else self.max  # Mai oltre il massimo osservato
+        return 0.0
+
+    def snapshot(self):
+        with self.lock:
+            if not self.count:
+                return {"count": 0}
+            return {
+                "count": self.count,
+                "mean_ms": round(self.total / self.count * 1000, 3),
+                "p50_ms": round(self.percentile(0.50) * 1000, 3),
+                "p95_ms": round(self.percentile(0.95) * 1000, 3),
+                "p99_ms": round(self.percentile(0.99) * 1000, 3),
+                "max_ms": round(self.max * 1000, 3),
+            }
+
+
+class Metrics:
+    """Registro di contatori, istogrammi e traffico per peer."""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.counters = {}
+        self.histograms = {}
+        self.traffic = {}  # {"host:porta": [byte inviati, byte ricevuti]}, in ordine di creazione
+        self.lock = threading.Lock()
+        self.started = time.time()
+
+    def inc(self, name, value=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        """Registra una durata (in secondi) nell'istogramma name."""
+        if not self.enabled:
+            return
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(name, Histogram())
+        histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def meter(self, peer):
+        """Funzione meter(inviati, ricevuti) da assegnare a Connection.meter per contare i byte di un peer.
+
+        Il contatore del peer resta nel registro finché forget non lo rimuove
+        (peer uscito) o finché non è tra i più vecchi oltre MAX_TRAFFIC_PEERS.
+        """
+        label = self.label(peer)
+        with self.lock:
+            totals = self.traffic.get(label)
+            if totals is None:
+                totals = self.traffic[label] = [0, 0]
+                while len(self.traffic) > MAX_TRAFFIC_PEERS:
+                    del self.traffic[next(iter(self.traffic))]
+
+        def count(sent, received):
+            if not self.enabled:
+                return
+            with self.lock:  # Dopo forget i byte finiscono in un contatore non più visibile
+                totals[0] += sent
+                totals[1] += received
+        return count
+
+    def forget(self, peer):
+        """Rimuove il contatore di traffico di un peer uscito (server con molti peer che vanno e vengono)."""
+        with self.lock:
+            self.traffic.pop(self.label(peer), None)
+
+    @staticmethod
+    def label(peer):
+        return f"{peer[0]}:{peer[1]}" if isinstance(peer, tuple) else str(peer)
+
+    def snapshot(self):
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = dict(self.histograms)
+            traffic = {label: {"sent": sent, "received": received} for label, (sent, received) in self.traffic.items()}
+        return {
+            "time": time.time(),
+            "uptime_sec": round(time.time() - self.started, 3),
+            "counters": counters,
+            "latency": {name: histogram.snapshot() for name, histogram in sorted(histograms.items())},
+            "traffic": traffic,
+        }
+
+    def dump(self, path):
+        """Scrive lo snapshot in JSON sostituendo il file in modo atomico."""
+        temporary = path + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(temporary, path)
+
+
+METRICS = Metrics()
+
+
+def serve(port=0, host="127.0.0.1", metrics=METRICS):
+    """Avvia l'endpoint GET /metrics in un thread; restituisce il server HTTP (porta in server_address)."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") not in ("", "/metrics"):
+                self.send_error(404)
+                return
+            body = json.dumps(metrics.snapshot()).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            get_logger("metrics").debug(format, *args)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    get_logger("metrics").info("Metriche disponibili su http://%s:%d/metrics", *server.server_address[:2])
+    return server
+
+
+def start_dump(path, interval=10.0, metrics=METRICS):
+    """Riscrive periodicamente lo snapshot delle metriche in path; restituisce l'Event per fermarlo."""
+    stopped = threading.Event()
+
+    def run():
+        while not stopped.wait(interval):
+            try:
+                metrics.dump(path)
+            except OSError as e:
+                get_logger("metrics").warning("Impossibile scrivere le metriche in %s: %s", path, e)
+
+    threading.Thread(target=run, daemon=True).start()
+    return stopped
+
+
+_listener = None
+
+
+def setup_logging(level=None, stream=None):
+    """Configura i log del gioco: i record vanno in coda e un thread li scrive su stream.
+
+    Senza level si usa la variabile d'ambiente QUIZ_LOG (DEBUG, INFO, WARNING, ...; default INFO).
+    """
+    global _listener
+    if level is None:
+        level = os.environ.get("QUIZ_LOG", "INFO").upper()
+    if _listener is not None:
+        _listener.stop()
+    root = logging.getLogger("quiz")
+    root.setLevel(level)
+    root.propagate = False
+    log_queue = queue.SimpleQueue()
+    root.handlers[:] = [logging.handlers.QueueHandler(log_queue)]
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    _listener = logging.handlers.QueueListener(log_queue, handler)
+    _listener.start()
+    return _listener
+
+
+def get_logger(name):
+    """Logger del modulo name; i log si configurano esplicitamente con setup_logging dai punti di ingresso.
+
+    Finché nessuno chiama setup_logging vale la configurazione di logging (avvisi ed errori su stderr).
+    """
+    return logging.getLogger(f"quiz.{name}")
@@ -1,28 +1,119 @@
+import queue
 import socket
 import threading
-import json
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from protocol import TO_ALL, TO_OTHERS, Connection, ProtocolError, encode_message, route_frame
+from pool import PeerConnectionPool
+from broadcast import Broadcaster, SendReport
+from arbiter import BuzzArbiter
+from scoreboard import Scoreboard
+from question_bank import QuestionBank
+from answer_matching import AnswerMatcher
+from collector import AnswerCollector
+from codec import ENCODINGS, NOTICES, MessageCodec
+from hub import RelayChannel
+from liveness import CONNECT_TIMEOUT, Heartbeat
+from sessions import RESUME_GRACE
+from assets import AssetClient, AssetError
+from metrics import METRICS, get_logger, setup_logging
+
+log = get_logger("peer")
+
+DECISIONS = ("BUZZ", "WRONG_ANSWER", "CORRECT_ANSWER")  # Decisioni dell'arbitro, applicate in ordine
+ASSET_WORKERS = 2  # Thread per upload, download e prefetch degli asset (una connessione, una richiesta alla volta)
+START_GRACE = 5.0  # Attesa massima dello START per un evento arrivato da un altro peer prima di esso
+
+class ServerLink:
+    """Connessione al server vista dai canali dell'hub: segue le riprese della sessione."""
+
+    def __init__(self, peer):
+        self.peer = peer
+
+    def send_frame(self, frame):
+        self.peer.send_to_server(frame)
+
 
 class QuizPeer:
-    def __init__(self, server_host='localhost', server_port=12345, winning_score=3):
+    def __init__(self, server_host='localhost', server_port=12345, winning_score=3, broadcast_workers=16, broadcast_timeout=2.0, encoding="compact", relay=False, event_log=None, asset_cache=None):
         self.server_host = server_host
         self.server_port = server_port
         self.peer_host = 'localhost'
         self.peer_port = None  # Sarà impostata dinamicamente
+        self.advertised_port = None  # Porta annunciata agli altri peer se diversa da peer_port (es. un fault_proxy davanti)
+        self.address = None  # Indirizzo con cui il server e gli altri peer ci identificano
         self.presenter = None
+        self.room = None  # Stanza assegnata dal server
         self.peers = []
         self.role = None
         self.listener_thread = None
-        self.scores = {}  # Dizionario {peer: punteggio}
+        # Modalità hub: eventi pubblicati sulla connessione al server, nessuna porta in ascolto.
+        # Con relay=False la decide il server nello START.
+        self.relay = relay
+        self.server_thread = None  # Legge dal server gli eventi dell'hub e i PEER_LEFT
+        self.heartbeat = None
+        self.session = None  # Token rilasciato dal server al REGISTER, per riprendere la partita con RESUME
+        self.left = False  # Uscita volontaria: niente tentativi di ripresa
+        self.link = ServerLink(self)  # Connessione al server per i canali dell'hub, anche dopo una ripresa
+        self.link_lock = threading.Lock()
+        self.unsent = None  # Frame per il server accodati durante la ripresa della sessione
+        self.on_event = None  # Callback della GUI per gli eventi ricevuti
+        self.scores = Scoreboard()  # Classifica incrementale dei giocatori
         self.winning_score = winning_score  # Punteggio necessario per vincere
-        
-
-    def start_peer_server(self, callback):
+        # Codifiche proposte al server; quella scelta per la partita arriva con lo START
+        self.encodings = ENCODINGS if encoding == "compact" else ("json",)
+        self.codec = MessageCodec()
+        self.pool = PeerConnectionPool()  # Connessioni persistenti verso gli altri peer
+        self.broadcaster = Broadcaster(self.pool, max_workers=broadcast_workers, timeout=broadcast_timeout)
+        # Eventi su cui GUI e giocatori headless possono attendere senza polling
+        self.role_assigned = threading.Event()
+        self.game_over = threading.Event()
+        self.question_received = threading.Condition()
+        self.question_seq = 0  # Numero di domande ricevute finora
+        self.current_question = None  # (dati, connessione) dell'ultima domanda
+        self.question_frame = None  # Presentatore in modalità hub: frame dell'ultima domanda inviata
+        self.ending = None  # Presentatore in modalità hub: (vincitore, frame dell'END), ripetuto dopo una ripresa
+        # Stato del presentatore: arbitro dei buzz e raccolta delle risposte in un solo thread
+        self.arbiter = BuzzArbiter()
+        self.question_id = 0
+        # Il ciclo di raccolta legge soltanto: valutazione, FEEDBACK e broadcast passano a un thread delle decisioni
+        self.collector = AnswerCollector(self.queue_answer, self.on_channel_closed, codec=self.codec)
+        self.decisions = queue.SimpleQueue()  # (funzione, argomenti) eseguiti in ordine di arrivo
+        self.decision_thread = None
+        self.decision_lock = threading.Lock()
+        self.decision_seq = 0  # Presentatore: numero dell'ultima decisione inviata (BUZZ, WRONG_ANSWER, CORRECT_ANSWER)
+        self.last_decision = (None, None, 0)  # Giocatore: (presentatore, domanda, numero) dell'ultima decisione applicata
+        self.round_matcher = None  # Risposta della domanda aperta; None quando il round è chiuso
+        self.round_over = threading.Event()
+        self.answer_sent_at = None  # Istante dell'ultima risposta inviata, per misurare l'attesa del FEEDBACK
+        self.question_bank = None  # Banco di domande opzionale da cui il presentatore può pescare
+        self.prefetched = None  # Domanda estratta in anticipo all'avvio della partita
+        self.ready_at = None  # Istante (lato server) in cui la stanza si è completata
+        self.first_seq = 1  # Numero (question_seq) della prima domanda della partita in corso
+        # Tornei: il server invia un nuovo START per ogni partita sulla stessa connessione
+        self.game = 0  # Numero della partita in corso (1 fuori dai tornei)
+        self.tournament = None  # Fase e classifica del torneo dall'ultimo START; None fuori dai tornei
+        self.game_started = threading.Condition()
+        self.eliminated = False
+        self.tournament_over = threading.Event()
+        self.event_log = event_log  # EventLog opzionale: il presentatore registra domande, buzz, risposte e fine
+        # Immagini e audio delle domande: upload e download su una connessione dedicata verso il server
+        self.assets = AssetClient((server_host, server_port), asset_cache)
+        # Trasferimenti degli asset su un pool proprio: un file lento non occupa i thread dei broadcast
+        self.transfers = ThreadPoolExecutor(max_workers=ASSET_WORKERS, thread_name_prefix="assets")
+
+
+    def start_peer_server(self, callback=None):
         """Avvia un socket server per ricevere domande."""
+        self.on_event = callback
+        if self.relay:
+            log.info("Modalità relay: gli eventi arrivano dalla connessione al server")
+            return
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server_socket.bind((self.peer_host, 0))  # Usa una porta disponibile
         self.peer_port = self.server_socket.getsockname()[1]
-        print(f"Peer in ascolto su {self.peer_host}:{self.peer_port}")
+        log.info("Peer in ascolto su %s:%s", self.peer_host, self.peer_port)
         self.server_socket.listen(5)
 
         # Thread per accettare connessioni in ingresso
@@ -30,67 +121,228 @@ class QuizPeer:
         self.listener_thread.start()
 
     def listen_for_questions(self, on_question_received):
-        """Ascolta le domande inviate dal presentatore e notifica la GUI."""
+        """Accetta le connessioni in ingresso e le affida a un thread di lettura dedicato."""
         while True:
             try:
-                conn, addr = self.server_socket.accept()
-                message = conn.recv(1024).decode().strip()  # Decodifica il messaggio e rimuove spazi bianchi
-                if not message:
-                    print(f"Messaggio vuoto ricevuto da {addr}.")
-                    conn.close()
-                    continue
-                
-                try:
-                    data = json.loads(message)  # Prova a caricare il JSON
-                except json.JSONDecodeError as e:
-                    print(f"Errore nel parsing del JSON: {e}. Messaggio ricevuto: {message}")
-                    conn.close()
-                    continue
-
-                if data["type"] == "QUESTION":
-                    question = data["question"]
-                    print(f"Domanda ricevuta: {question}")
-                    on_question_received(data, conn)
-                elif data["type"] == "CORRECT_ANSWER":
-                    notification = data["message"]
-                    print(f"Notifica ricevuta: {notification}")
-                    on_question_received(data, None)  # Passa il messaggio alla GUI
-                elif data["type"] == "END":
-                    on_question_received(data, None)
-                    conn.close()
-                    break
-                elif data["type"] == "BUZZ":
-                    on_question_received(data, None)
-                    # Puoi notificare tutti gli altri peer che un giocatore si è prenotato
-                    #self.notify_all_peers(notification)
-                elif data["type"] == "WRONG_ANSWER":
-                    on_question_received(data,None)
+                sock, addr = self.server_socket.accept()
+                threading.Thread(target=self.serve_connection, args=(Connection(sock, self.codec), addr, on_question_received), daemon=True).start()
             except Exception as e:
-                print(f"Errore nella ricezione del messaggio: {e}")
-
-
-
-
+                log.error("Errore nell'accettare una connessione: %s", e)
 
+    def serve_connection(self, conn, addr, on_question_received):
+        """Legge in sequenza tutti i messaggi framed di una connessione e notifica la GUI."""
+        conn.meter = METRICS.meter(addr)
+        try:
+            while True:
+                try:
+                    data = conn.recv()
+                except ProtocolError as e:
+                    log.warning("Messaggio non valido da %s: %s", addr, e)
+                    break
+                if data is None:
+                    break  # Il mittente ha chiuso la connessione
+                if not self.role_assigned.is_set():
+                    # Un altro peer ha già ricevuto lo START e può precederlo: il nostro è in arrivo dal server
+                    self.role_assigned.wait(START_GRACE)
 
-    def connect_to_server(self):
-        """Connetti al server centrale e registrati."""
-        print("Connettendo al server centrale...")
+                self.dispatch(data, conn, on_question_received)
+        except Exception as e:
+            log.error("Errore nella ricezione del messaggio da %s: %s", addr, e)
+        conn.close()
+
+    def dispatch(self, data, conn, on_question_received):
+        """Smista un messaggio ricevuto da un altro peer (direttamente o tramite l'hub)."""
+        METRICS.inc("peer.received." + data["type"])
+        if data["type"] == "QUESTION":
+            log.debug("Domanda ricevuta: %s", data["question"])
+            if data.get("assets"):
+                # Download fuori dal thread di lettura: FEEDBACK e decisioni dell'arbitro non restano in coda dietro un file
+                self.transfers.submit(self.deliver_assets, data, on_question_received)
+            # Il canale resta aperto: le risposte partono da qui e gli esiti arrivano come FEEDBACK
+            self.handle_event(data, conn, on_question_received)
+        elif data["type"] == "FEEDBACK":
+            self.handle_event(data, conn, on_question_received)
+        elif data["type"] == "ANSWER":
+            self.queue_answer(conn.addr, conn, data)  # Solo in modalità hub: altrimenti arriva al collector
+        elif data["type"] == "CORRECT_ANSWER":
+            log.debug("Notifica ricevuta: %s", data["message"])
+            self.handle_event(data, None, on_question_received)  # Passa il messaggio alla GUI
+        elif data["type"] == "END":
+            if not self.game_over.is_set():  # Un END ripetuto dal presentatore dopo una ripresa è già stato gestito
+                self.handle_event(data, None, on_question_received)
+        elif data["type"] == "BUZZ":
+            self.handle_event(data, None, on_question_received)
+        elif data["type"] == "WRONG_ANSWER":
+            self.handle_event(data, None, on_question_received)
+        elif data["type"] in ("BUZZ_REQUEST", "BUZZ_TIMEOUT"):
+            self.handle_event(data, None, on_question_received)
+        elif data["type"] in ("PEER_LEFT", "ELIMINATED", "TOURNAMENT_END"):
+            self.handle_event(data, None, on_question_received)
+        elif data["type"] == "PREFETCH":
+            self.transfers.submit(self.assets.prefetch, data["assets"])  # In background, durante il round in corso
+        elif data["type"] == "START":
+            self.begin_game(data)  # Partita successiva di un torneo
+
+    def read_server(self):
+        """Legge dalla connessione al server PEER_LEFT, messaggi del torneo e, in modalità hub, gli eventi inoltrati dagli altri peer.
+
+        Se la connessione cade prova a riprendere la sessione (resume) prima di arrendersi.
+        """
+        while True:
+            try:
+                data = self.server_conn.recv()
+            except (OSError, ProtocolError) as e:
+                log.warning("Connessione al server interrotta: %s", e)
+                data = None
+            if data is None:
+                if not self.left and self.resume():
+                    continue
+                log.warning("Connessione al server persa.")
+                break
+            self.dispatch_server(data)
+
+    def dispatch_server(self, data):
+        sender = data.pop("sender", None)
+        # Le risposte tornano al mittente attraverso l'hub
+        channel = RelayChannel(self.link, self.codec, sender) if sender else None
+        try:
+            self.dispatch(data, channel, self.on_event)
+        except Exception as e:
+            log.exception("Errore nella gestione del messaggio da %s: %s", sender, e)
+
+    def handle_event(self, data, conn, on_question_received):
+        """Aggiorna lo stato del peer, sveglia chi è in attesa dell'evento e lo inoltra alla GUI."""
+        if data["type"] == "BUZZ_REQUEST":
+            self.decide(self.arbitrate_buzz, data)
+            return  # Messaggi per l'arbitro: la GUI vede solo la decisione
+        elif data["type"] == "BUZZ_TIMEOUT":
+            self.decide(self.expire_buzz, data)
+            return
+        elif data["type"] in DECISIONS and self.stale_decision(data):
+            METRICS.inc("peer.stale_decisions")
+            return
+        elif data["type"] == "QUESTION":
+            if self.current_question is not None and data.get("sent_at") and data["sent_at"] == self.current_question[0].get("sent_at"):
+                return  # Domanda ripetuta dal presentatore dopo una ripresa: già ricevuta
+            if data.get("sent_at"):
+                METRICS.observe("question", max(0.0, time.time() - data["sent_at"]))  # Consegna della domanda
+            with self.question_received:
+                self.question_seq += 1
+                self.current_question = (data, conn)
+                self.question_received.notify_all()
+            if self.question_seq == self.first_seq and self.ready_at:
+                METRICS.observe("first_question", max(0.0, time.time() - self.ready_at))  # Dall'ultima registrazione
+        elif data["type"] == "BUZZ":
+            if data.get("sent_at"):
+                METRICS.observe("buzz", max(0.0, time.time() - data["sent_at"]))  # Dalla richiesta alla decisione
+        elif data["type"] == "FEEDBACK":
+            if self.answer_sent_at is not None:
+                METRICS.observe("answer", time.perf_counter() - self.answer_sent_at)
+                self.answer_sent_at = None
+        elif data["type"] == "END":
+            if self.tournament is not None:
+                self.role_assigned.clear()  # Gli eventi della prossima partita attendono il suo START
+            self.game_over.set()
+            self.round_over.set()
+        elif data["type"] == "PEER_LEFT":
+            self.remove_peer((data["peer"]["host"], data["peer"]["port"]))
+        elif data["type"] == "ELIMINATED":
+            self.eliminated = True
+            self.tournament = data.get("tournament")
+        elif data["type"] == "TOURNAMENT_END":
+            self.tournament = data.get("tournament")
+            self.tournament_over.set()
+            self.game_over.set()
+            with self.game_started:
+                self.game_started.notify_all()
+        if on_question_received:
+            on_question_received(data, conn)
+
+    def stale_decision(self, data):
+        """True se è già stata applicata una decisione successiva sulla stessa domanda.
+
+        Il presentatore le invia una alla volta, ma un invio scaduto prosegue in
+        background e può arrivare dopo quello seguente: la decisione vecchia
+        (ad esempio il WRONG_ANSWER di chi aveva il buzz, arrivato dopo il BUZZ
+        del giocatore successivo) non deve annullare quella nuova.
+        """
+        decision = data.get("decision")
+        if decision is None:
+            return False
+        with self.decision_lock:
+            # Ogni presentatore numera domande e decisioni per conto proprio: nei tornei si ripetono tra le partite
+            presenter, question_id, last = self.last_decision
+            if presenter == self.presenter and data.get("question_id") == question_id and decision < last:
+                return True
+            self.last_decision = (self.presenter, data.get("question_id"), decision)
+            return False
+
+    def wait_for_role(self, timeout=None):
+        """Blocca senza consumare CPU finché il server non assegna un ruolo; None allo scadere del timeout."""
+        self.role_assigned.wait(timeout)
+        return self.role
+
+    def wait_for_question(self, after_seq=0, timeout=None):
+        """Attende una domanda successiva alla numero after_seq; restituisce (seq, dati, connessione) o None."""
+        with self.question_received:
+            if not self.question_received.wait_for(lambda: self.question_seq > after_seq, timeout):
+                return None
+            data, conn = self.current_question
+            return self.question_seq, data, conn
+
+    def wait_for_end(self, timeout=None):
+        """Attende la fine della partita; restituisce False allo scadere del timeout."""
+        return self.game_over.wait(timeout)
+
+    def wait_for_game(self, after_game=0, timeout=None):
+        """Attende lo START di una partita successiva alla numero after_game; None a torneo finito o allo scadere del timeout."""
+        with self.game_started:
+            started = self.game_started.wait_for(lambda: self.game > after_game or self.tournament_over.is_set(), timeout)
+            if not started or self.game <= after_game:
+                return None
+            return self.game
+
+
+
+
+
+
+    def connect_to_server(self, room=None):
+        """Connetti al server centrale, registrati e attendi l'inizio della partita."""
+        self.register(room)
+        self.listen_for_game()
+
+    def register(self, room=None):
+        """Connetti al server centrale e registrati (in una stanza specifica o tramite matchmaking)."""
+        log.info("Connettendo al server centrale...")
+        started = time.perf_counter()
         try:
-            self.server_conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.server_conn.connect((self.server_host, self.server_port))
+            self.server_conn = self.open_server_connection()
+            self.server_conn.sock.settimeout(None)  # L'attesa dello START non ha scadenza: il server ci sa vivi dagli heartbeat
             registration_message = {
                 "type": "REGISTER",
-                "port": self.peer_port  # Invia il numero di porta su cui il peer è in ascolto
+                "port": self.advertised_port or self.peer_port,  # Porta su cui il peer è raggiungibile (None in modalità relay)
+                "encodings": list(self.encodings)
             }
-            self.server_conn.sendall(json.dumps(registration_message).encode())
-            response = self.server_conn.recv(1024).decode()
-            if response == "REGISTERED":
-                print("Registrato al server centrale. In attesa della partita...")
-                self.listen_for_game()
+            if room is not None:
+                registration_message["room"] = room
+            self.server_conn.send(registration_message)
+            response = self.server_conn.recv()
+            if response and response["type"] == "REGISTERED":
+                self.room = response.get("room")
+                self.session = response.get("session")
+                self.assets.session = self.session  # Anche la connessione degli asset si presenta con il token
+                self.address = tuple(response.get("address") or ("127.0.0.1", self.peer_port))
+                if self.peer_port is None:
+                    self.peer_port = self.address[1]  # Senza porta in ascolto ci identifica la connessione all'hub
+                METRICS.observe("register", time.perf_counter() - started)
+                if response.get("heartbeat"):
+                    self.heartbeat = Heartbeat(self.server_conn, response["heartbeat"])
+                    self.heartbeat.start()
+                log.info("Registrato al server centrale nella stanza %s. In attesa della partita...", self.room)
             else:
-                print(f"Registrazione fallita: {response}")
-                raise Exception("Risposta di registrazione non valida: " + response)  # Se la risposta non è "REGISTERED", solleva un'eccezione
+                log.error("Registrazione fallita: %s", response)
+                raise Exception(f"Risposta di registrazione non valida: {response}")  # Se la risposta non è "REGISTERED", solleva un'eccezione
         except socket.error as e:
             # Gestisce gli errori di connessione (ad esempio, server non raggiungibile)
             raise Exception(f"Errore di connessione al server: {e}")
@@ -98,145 +350,619 @@ class QuizPeer:
             # Gestisce altri errori generici, come una risposta errata dal server
             raise Exception(f"Errore durante la registrazione al server: {e}")
 
+    def open_server_connection(self):
+        conn = Connection.connect((self.server_host, self.server_port), timeout=CONNECT_TIMEOUT, codec=self.codec)  # Anche gli eventi inoltrati dall'hub
+        # Heartbeat, STATE per gli spettatori ed eventi per l'hub sono piccoli: niente attese di Nagle tra due scritture
+        conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn.meter = METRICS.meter((self.server_host, self.server_port))
+        return conn
+
+    def resume(self, timeout=RESUME_GRACE):
+        """Riconnette al server con il token di sessione e riprende la partita; False se non è più possibile.
+
+        I messaggi inoltrati dall'hub che arrivano prima del RESUMED sono più
+        vecchi dello stato che contiene: vengono gestiti prima di applicarlo.
+        """
+        if self.session is None or self.left:
+            return False
+        if self.heartbeat:
+            self.heartbeat.stop()
+        with self.link_lock:
+            if self.unsent is None:
+                self.unsent = []  # Da qui le scritture verso il server attendono la nuova connessione
+        started = time.perf_counter()
+        delay = 0.05
+        while time.perf_counter() - started < timeout:
+            early = []
+            conn = None
+            try:
+                conn = self.open_server_connection()
+                conn.send_frame(encode_message({"type": "RESUME", "session": self.session, "game": self.game}))  # JSON: è per il server
+                response = conn.recv()
+                while response is not None and response["type"] not in ("RESUMED", "ERROR"):
+                    early.append(response)
+                    response = conn.recv()
+            except (OSError, ProtocolError) as e:
+                log.info("Ripresa della sessione non riuscita, nuovo tentativo: %s", e)
+                if conn is not None:
+                    conn.close()
+                time.sleep(delay)
+                delay = min(delay * 2, 1.0)
+                continue
+            if response is None or response["type"] == "ERROR":
+                log.warning("Sessione non ripresa: %s", response)
+                conn.close()
+                break
+            conn.sock.settimeout(None)
+            with self.link_lock:
+                self.server_conn = conn
+                unsent, self.unsent = self.unsent, None
+                for sent, frame in enumerate(unsent):
+                    try:
+                        conn.send_frame(frame)  # Scritti durante la disconnessione, prima di ogni altro frame
+                    except OSError:
+                        self.unsent = unsent[sent:]  # Caduta anche la nuova connessione: partiranno alla prossima ripresa
+                        break
+            if response.get("heartbeat"):
+                self.heartbeat = Heartbeat(conn, response["heartbeat"])
+                self.heartbeat.start()
+            for data in early:
+                self.dispatch_server(data)
+            self.apply_resume(response)
+            METRICS.inc("peer.resumed")
+            METRICS.observe("resume", time.perf_counter() - started)
+            log.info("Sessione ripresa nella stanza %s dopo %.0f ms", self.room, (time.perf_counter() - started) * 1000)
+            return True
+        with self.link_lock:
+            self.session = self.unsent = None  # Le prossime scritture falliscono come prima della ripresa
+        return False
+
+    def send_to_server(self, frame):
+        """Scrive un frame verso il server; se la connessione è caduta lo accoda fino alla ripresa della sessione."""
+        with self.link_lock:
+            if self.unsent is None:
+                try:
+                    self.server_conn.send_frame(frame)
+                    return
+                except OSError:
+                    if self.session is None or self.left:
+                        raise
+                    self.unsent = []  # Il thread di lettura se ne accorgerà e riprenderà la sessione
+            self.unsent.append(frame)
+
+    def apply_resume(self, response):
+        """Allinea lo stato locale con lo stato compatto del RESUMED e segnala gli eventi persi."""
+        start = response.get("start")
+        if start is not None and start.get("game", 1) != self.game:
+            if self.address not in [tuple(peer) for peer in start["peers"]]:
+                self.eliminated = True  # Il torneo è andato avanti senza di noi
+            else:
+                self.begin_game(start)  # Partita del torneo avviata durante la disconnessione
+        state = response.get("state") or {}
+        if "peers" in state:
+            current = {tuple(peer) for peer in state["peers"]}
+            for peer in [peer for peer in self.peers if peer not in current]:
+                self.remove_peer(peer)  # PEER_LEFT perso
+        if self.role == "PRESENTER":
+            # Il presentatore ha i punti veri: li ripubblica per gli STATE persi durante la disconnessione
+            self.publish_state(scores=[[host, port, score] for (host, port), score in self.scores.top()])
+            if self.relay and self.ending is not None and not self.game_over.is_set():
+                # Il nostro END non è tornato dall'hub: può essersi perso con la vecchia connessione
+                winner, frame = self.ending
+                self.publish_state(winner=winner, question=None, buzz=None)
+                self.send_to_server(route_frame(frame, TO_ALL))
+            elif self.relay and self.question_frame is not None and not self.round_over.is_set():
+                # La domanda può essersi persa con la vecchia connessione: i giocatori ignorano i doppioni
+                self.send_to_server(route_frame(self.question_frame, TO_OTHERS))
+        else:
+            for host, port, points in state.get("scores", []):
+                missed = (points or 0) - self.scores.get((host, port))
+                if points is not None and missed:
+                    self.scores.increment((host, port), missed)  # CORRECT_ANSWER perso
+        if self.on_event:
+            self.on_event(dict(response, type="RESUMED"), None)
+        question = state.get("question")
+        current = self.current_question[0].get("question_id") if self.current_question else None
+        if self.relay and self.role == "PLAYER" and question and question["id"] > (current or 0) and not state.get("winner"):
+            # Domanda inoltrata dall'hub mentre eravamo disconnessi (lo stato può essere più vecchio di quella che abbiamo)
+            channel = RelayChannel(self.link, self.codec, self.presenter)
+            self.handle_event({"type": "QUESTION", "question": question["text"], "question_id": question["id"]}, channel, self.on_event)
+        winner = state.get("winner")
+        if winner and state.get("game", self.game) == self.game and not self.game_over.is_set():
+            self.handle_event({
+                "type": "END",
+                "message": NOTICES["END"][0].format(port=winner[1]),
+                "peer": {"host": winner[0], "port": winner[1]},
+            }, None, self.on_event)
+        if state.get("closed") and self.tournament is not None and not self.tournament_over.is_set():
+            self.handle_event({
+                "type": "TOURNAMENT_END",
+                "message": f"FINE TORNEO: Il player {winner[1]} ha vinto!" if winner else "FINE TORNEO",
+                "winner": {"host": winner[0], "port": winner[1]} if winner else None,
+                "tournament": state.get("tournament"),
+            }, None, self.on_event)
+
+    def leave(self):
+        """Esce dalla partita: il server toglie subito il peer senza attendere una ripresa."""
+        self.left = True
+        if self.heartbeat:
+            self.heartbeat.stop()
+        try:
+            self.server_conn.send_frame(encode_message({"type": "LEAVE"}))
+            self.server_conn.close()
+        except OSError:
+            pass
+        self.transfers.shutdown(wait=False, cancel_futures=True)  # Niente download verso una cache che sta per essere rimossa
+        self.assets.close()
+
     def listen_for_game(self):
         """Attende il messaggio di inizio partita dal server."""
         while True:
             try:
-                message = self.server_conn.recv(1024).decode()
-                if not message:
-                    print("Connessione al server persa.")
+                data = self.server_conn.recv()
+                if data is None:
+                    log.warning("Connessione al server persa.")
                     break
-                data = json.loads(message)
                 if data["type"] == "START":
-                    self.presenter = tuple(data["presenter"])
-                    self.peers = [tuple(peer) for peer in data["peers"]]
-                    self.scores = {peer: 0 for peer in self.peers}
-                    self.winning_score = data.get("winning_score")  # Imposta il punteggio di vittoria
-                    if self.presenter == ("127.0.0.1", self.peer_port):
-                        self.role = "PRESENTER"
-                    else:
-                        self.role = "PLAYER"
-                    print(f"Ruolo assegnato: {self.role}")  # Log per debug
+                    self.begin_game(data)
+                    if self.server_thread is None:
+                        self.server_thread = threading.Thread(target=self.read_server, daemon=True)
+                        self.server_thread.start()
                     break
+            except ProtocolError as e:
+                log.warning("Errore nel ricevere il messaggio di avvio: %s", e)
+            except OSError as e:
+                log.warning("Connessione al server persa: %s", e)
+                break
+
+
+    def begin_game(self, data):
+        """Applica uno START: ruolo, peer e classifica di una nuova partita (la prima o la successiva di un torneo)."""
+        self.presenter = tuple(data["presenter"])
+        with self.decision_lock:
+            self.last_decision = (None, None, 0)  # Le decisioni della nuova partita non sono confrontabili con le precedenti
+        self.peers = [tuple(peer) for peer in data["peers"]]
+        self.scores = Scoreboard(peer for peer in self.peers if peer != self.presenter)
+        self.winning_score = data.get("winning_score")  # Imposta il punteggio di vittoria
+        self.codec.configure(data.get("encoding", "json"), self.peers)  # I peer diventano indici della lista
+        if self.presenter == self.address:
+            self.role = "PRESENTER"
+        else:
+            self.role = "PLAYER"
+        self.relay = bool(data.get("relay"))
+        if not self.relay:
+            self.pool.start_health_checks()
+        self.ready_at = data.get("ready_at")
+        self.first_seq = self.question_seq + 1
+        self.round_matcher = None
+        self.question_frame = self.ending = None
+        self.tournament = data.get("tournament")
+        self.game_over.clear()
+        self.broadcaster.executor.submit(self.prepare_role)  # In background: lo START non aspetta
+        with self.game_started:
+            self.game = data.get("game", 1)
+            self.game_started.notify_all()
+        self.role_assigned.set()
+        log.info("Ruolo assegnato: %s (partita %s)", self.role, self.game)
+        if self.on_event:
+            self.on_event(data, None)
+
+    def prepare_role(self):
+        """Appena ricevuto il ruolo apre solo le connessioni che il ruolo userà.
+
+        I giocatori parlano solo con il presentatore (buzz); il presentatore apre i
+        canali delle domande e, se ha un banco, ne estrae già la prima domanda.
+        """
+        started = time.perf_counter()
+        if self.role == "PRESENTER":
+            if not self.relay:
+                self.collector.warm([p for p in self.peers if p != self.presenter])
+            if self.question_bank is not None and self.prefetched is None:
+                self.prefetched = self.question_bank.draw()
+                if self.prefetched is not None and self.prefetched.assets:
+                    self.announce_assets(self.prefetched.assets)
+        elif not self.relay:
+            self.pool.warm([self.presenter])
+        METRICS.observe("prepare." + self.role.lower(), time.perf_counter() - started)
+
+    def decide(self, handler, *args):
+        """Accoda una decisione del presentatore al suo thread, avviato alla prima chiamata."""
+        if self.decision_thread is None:
+            with self.decision_lock:
+                if self.decision_thread is None:
+                    self.decision_thread = threading.Thread(target=self.run_decisions, name="decisions", daemon=True)
+                    self.decision_thread.start()
+        self.decisions.put((handler, args))
+
+    def run_decisions(self):
+        """Esegue le decisioni una alla volta: un broadcast lento ritarda solo le decisioni successive, non la lettura."""
+        while True:
+            handler, args = self.decisions.get()
+            try:
+                handler(*args)
             except Exception as e:
-                print(f"Errore nel ricevere il messaggio di avvio: {e}")
-
-
-    def send_question_to_peer(self, peer, question, correct_answer):
-        """Invia la domanda a un singolo peer e verifica le risposte."""
+                log.exception("Errore nella decisione %s: %s", handler.__name__, e)
+
+    def next_decision(self):
+        """Numero d'ordine della prossima decisione (solo nel thread delle decisioni)."""
+        self.decision_seq += 1
+        return self.decision_seq
+
+    def queue_answer(self, peer, conn, message):
+        """Risposta letta dal ciclo di raccolta (o dall'hub): la valuta il thread delle decisioni."""
+        if message.get("type") == "ANSWER":
+            self.decide(self.handle_answer, peer, conn, message)
+
+    def handle_answer(self, peer, conn, message):
+        """Valuta una risposta arrivata sul canale di un giocatore (gira nel thread delle decisioni)."""
+        if message.get("type") != "ANSWER":
+            return
+        question_id = message.get("question_id", self.question_id)
+        matcher = self.round_matcher
+        if matcher is None or question_id != self.question_id:
+            return  # Risposta tardiva a una domanda già chiusa
+        response = message.get("answer", "")
+        log.debug("Risposta ricevuta da %s: %s", peer, response)
+
+        started = time.perf_counter()
         try:
-            conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            conn.connect(peer)  # Connessione al peer
-            print(f"Connessione al peer {peer} per inviare la domanda...")
-            
-            # Invia la domanda iniziale
-            question_message = json.dumps({"type": "QUESTION", "question": question})
-            conn.sendall(question_message.encode())
-
-            # Ciclo per ricevere le risposte finché non è corretta
-            while True:
-                try:
-                    response = conn.recv(1024).decode().strip()
-                    if not response:  # Peer ha chiuso la connessione
-                        continue
-                    
-                    print(f"Risposta ricevuta da {peer}: {response}")
-                    
-                    if response.strip().lower() == correct_answer.strip().lower():
-                        self.scores[peer] += 1
-                        feedback_message = json.dumps({"type": "CORRECT_ANSWER", "score": self.scores[peer]})
-                        conn.sendall(feedback_message.encode())
-
-                        # Notifica tutti gli altri peer
-                        notification = {
-                            "type": "CORRECT_ANSWER",
-                            "message": f"Il player {peer[1]} ha risposto correttamente!"
-                        }
-                        self.notify_all_peers(json.dumps(notification))
-
-                        # Controlla la vittoria
-                        if self.scores[peer] >= self.winning_score:
-                            print(f"Player {peer[1]} ha vinto la partita con {self.scores[peer]} punti!")
-                            self.notify_end_game(peer)
-                        break  # Termina il ciclo per questo peer
-                    else:
-
-                        # Notifica tutti gli altri peer
-                        notification = {
-                            "type": "WRONG_ANSWER",
-                            "message": f"Il player {peer[1]} ha risposto in maniera errata!",
-                            "peer": {
-                                "port": peer[1],  # Usa solo informazioni serializzabili
-                                "host": peer[0]  # Se necessario, aggiungi altre proprietà
-                            }
-                        }
-                        self.notify_all_peers(json.dumps(notification))
-                        feedback_message = json.dumps({"type": "WRONG_ANSWER"})
-                        conn.sendall(feedback_message.encode())
-
-                except socket.error as e:
-                    print(f"Errore nella comunicazione con il peer {peer}: {e}")
-                    break
-        finally:
-            conn.close()
-
-
-
-
-
-
+            if matcher.matches(response):
+                METRICS.inc("answers.correct")
+                self.round_matcher = None  # Le risposte successive vengono ignorate
+                self.arbiter.close(question_id)  # Domanda vinta: niente più prenotazioni
+                score = self.scores.increment(peer)
+                self.record("ANSWER", question_id=question_id, peer=peer, correct=True, score=score)
+                self.publish_state(buzz=None, scores=[[peer[0], peer[1], score]])
+                conn.send({"type": "FEEDBACK", "question_id": question_id, "correct": True, "score": score})
+
+                # Notifica tutti gli altri peer
+                notification = {
+                    "type": "CORRECT_ANSWER",
+                    "question_id": question_id,
+                    "decision": self.next_decision(),
+                    "message": NOTICES["CORRECT_ANSWER"][0].format(port=peer[1]),
+                    "peer": {"host": peer[0], "port": peer[1]}
+                }
+                self.notify_all_peers(notification)
+
+                # Controlla la vittoria
+                if score >= self.winning_score:
+                    log.info("Player %s ha vinto la partita con %s punti!", peer[1], score)
+                    self.notify_end_game(peer)
+                self.round_over.set()
+            else:
+                METRICS.inc("answers.wrong")
+                self.record("ANSWER", question_id=question_id, peer=peer, correct=False, score=self.scores.get(peer))
+                self.arbiter.release(question_id, peer)  # Il buzz torna disponibile
+                self.publish_state(buzz=None)
+
+                # Notifica tutti gli altri peer
+                notification = {
+                    "type": "WRONG_ANSWER",
+                    "question_id": question_id,
+                    "decision": self.next_decision(),
+                    "message": NOTICES["WRONG_ANSWER"][0].format(port=peer[1]),
+                    "peer": {
+                        "port": peer[1],  # Usa solo informazioni serializzabili
+                        "host": peer[0]  # Se necessario, aggiungi altre proprietà
+                    }
+                }
+                self.notify_all_peers(notification)
+                conn.send({"type": "FEEDBACK", "question_id": question_id, "correct": False, "score": self.scores.get(peer)})
+        except (OSError, ProtocolError) as e:
+            log.warning("Errore nella comunicazione con il peer %s: %s", peer, e)
+        METRICS.observe("answer.handle", time.perf_counter() - started)  # Verifica, punteggio e notifiche
+
+    def remove_peer(self, peer):
+        """Il server ha rimosso un peer morto o uscito: lo toglie da lista, classifica, connessioni e buzz."""
+        if peer not in self.peers:
+            return
+        log.info("Il peer %s ha lasciato la partita", peer)
+        self.peers = [p for p in self.peers if p != peer]
+        self.scores.remove(peer)
+        self.pool.discard(peer)
+        METRICS.forget(peer)
+        if peer == self.presenter:
+            # Senza presentatore nessuno può fare domande né decidere i buzz
+            self.game_over.set()
+            self.round_over.set()
+            return
+        if self.role == "PRESENTER":
+            self.collector.drop(peer)
+            self.decide(self.expire_buzz, {"question_id": self.question_id, "peer": {"host": peer[0], "port": peer[1]}})
+            if not [p for p in self.peers if p != self.presenter] and not self.round_over.is_set():
+                self.round_matcher = None  # Nessun giocatore rimasto: il round non può più finire
+                self.round_over.set()
+
+    def on_channel_closed(self, peer):
+        """Un giocatore ha chiuso il suo canale: se non ne resta nessuno il round non può finire."""
+        if not self.collector.channels and not self.round_over.is_set():
+            self.round_matcher = None
+            self.round_over.set()
+
+
+    def arbitrate_buzz(self, data):
+        """Decide una prenotazione (nel thread delle decisioni) e comunica il detentore a tutti con un solo broadcast."""
+        peer = (data["peer"]["host"], data["peer"]["port"])
+        granted, holder, arrival = self.arbiter.request(data.get("question_id"), peer)
+        if granted:
+            METRICS.inc("buzz.granted")
+            self.record("BUZZ", question_id=data.get("question_id"), peer=peer, sent_at=data.get("sent_at"))
+            self.publish_state(buzz=peer)
+            log.debug("Buzz concesso a %s", peer)
+        elif holder == peer:
+            METRICS.inc("buzz.repeated")  # Il detentore non ha ricevuto la decisione (connessione caduta): si ripete
+        else:
+            METRICS.inc("buzz.rejected")
+            return
+        self.notify_all_peers({
+            "type": "BUZZ",
+            "question_id": data.get("question_id"),
+            "decision": self.next_decision(),
+            "message": NOTICES["BUZZ"][0].format(port=peer[1]),
+            "peer": data["peer"],
+            "sent_at": data.get("sent_at"),
+        })
 
-    def notify_all_peers(self, message):
-        """Invia un messaggio a tutti i peer."""
-        for peer in self.peers :
-            try:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as conn:
-                    conn.connect(peer)
-                    conn.sendall(message.encode())
-            except Exception as e:
-                print(f"Errore nel notificare il peer {peer}: {e}")
+    def expire_buzz(self, data):
+        """Il detentore non ha risposto in tempo: il buzz viene liberato per gli altri."""
+        peer = (data["peer"]["host"], data["peer"]["port"])
+        if self.arbiter.release(data.get("question_id"), peer):
+            self.record("BUZZ_TIMEOUT", question_id=data.get("question_id"), peer=peer)
+            self.publish_state(buzz=None)
+            self.notify_all_peers({
+                "type": "WRONG_ANSWER",
+                "question_id": data.get("question_id"),
+                "decision": self.next_decision(),
+                "message": NOTICES["WRONG_ANSWER"][1].format(port=peer[1]),
+                "peer": data["peer"],
+            })
+
+    def request_buzz(self):
+        """Chiede al presentatore di prenotarsi per la domanda corrente."""
+        data, _ = self.current_question
+        self.send_to_peer(self.presenter, self.codec.encode({
+            "type": "BUZZ_REQUEST",
+            "question_id": data.get("question_id"),
+            "peer": {"host": self.address[0], "port": self.address[1]},
+            "sent_at": time.time(),
+        }))
+
+    def send_answer(self, answer):
+        """Invia una risposta sul canale della domanda corrente; l'esito arriva come FEEDBACK."""
+        data, conn = self.current_question
+        self.answer_sent_at = time.perf_counter()
+        conn.send({"type": "ANSWER", "answer": answer, "question_id": data.get("question_id")})
+
+    def report_buzz_timeout(self):
+        """Segnala al presentatore che il tempo per rispondere è scaduto."""
+        data, _ = self.current_question
+        self.send_to_peer(self.presenter, self.codec.encode({
+            "type": "BUZZ_TIMEOUT",
+            "question_id": data.get("question_id"),
+            "peer": {"host": self.address[0], "port": self.address[1]},
+        }))
+
+
+    def send_to_peer(self, peer, frame):
+        """Invia un frame a un solo peer: direttamente o attraverso l'hub."""
+        if self.relay:
+            RelayChannel(self.link, self.codec, peer).send_frame(frame)
+        else:
+            self.pool.send_frame(peer, frame)
+
+    def broadcast_frame(self, frame, timeout=None):
+        """Invia un frame a tutti i peer; in modalità hub basta una sola scrittura verso il server."""
+        if not self.relay:
+            return self.broadcaster.broadcast(self.peers, frame, timeout)
+        started = time.perf_counter()
+        try:
+            self.send_to_server(route_frame(frame, TO_ALL))
+            error = None
+        except OSError as e:
+            error = e
+        hub = (self.server_host, self.server_port)
+        return [SendReport(hub, error is None, time.perf_counter() - started, error)]
+
+    def notify_all_peers(self, message, timeout=None):
+        """Invia un messaggio a tutti i peer in parallelo e restituisce l'esito per ciascuno."""
+        frame = self.codec.encode(message)  # Codificato una sola volta per tutti i destinatari
+        reports = self.broadcast_frame(frame, timeout)
+        for report in reports:
+            if not report.ok:
+                log.warning("Errore nel notificare il peer %s: %s (%.1f ms)", report.peer, report.error, report.elapsed * 1000)
+        return reports
 
 
     def notify_end_game(self, winner):
         """Notifica a tutti i peer che il gioco è terminato."""
-        message = json.dumps({
+        frame = self.codec.encode({
             "type": "END",
-            "message": f"FINE GIOCO: Il player {winner[1]} ha vinto!"
+            "message": NOTICES["END"][0].format(port=winner[1]),
+            "peer": {"host": winner[0], "port": winner[1]}
         })
-        for peer in self.peers:
-            try:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as conn:
-                    conn.connect(peer)
-                    conn.sendall(message.encode())
-            except Exception as e:
-                print(f"Errore nel notificare il peer {peer} della fine del gioco: {e}")
-        print("Il gioco è terminato.")
-
-
-
-
-    def start_presenter(self, question, correct_answer):
-        """Gestisce il ruolo del presentatore."""
-        threads = []
-        for peer in [p for p in self.peers if p != self.presenter]:
-            thread = threading.Thread(target=self.send_question_to_peer, args=(peer, question, correct_answer))
-            thread.start()
-            threads.append(thread)
+        self.record("END", winner=winner)
+        self.publish_state(winner=winner, question=None, buzz=None)
+        self.ending = (winner, frame)
+        started = time.perf_counter()
+        reports = self.broadcast_frame(frame)
+        METRICS.observe("end", time.perf_counter() - started)
+        for report in reports:
+            if not report.ok:
+                log.warning("Errore nel notificare il peer %s della fine del gioco: %s", report.peer, report.error)
+        self.collector.drop_all()  # I canali delle domande non servono più
+        if self.tournament is not None:
+            self.report_result()
+        log.info("Il gioco è terminato.")
+
+    def record(self, event, **fields):
+        """Registra un evento della partita nel registro su file, se configurato."""
+        if self.event_log is not None:
+            self.event_log.record(event, room=self.room, game=self.game, **fields)
+
+    def publish_state(self, **fields):
+        """Presentatore: comunica al server un cambiamento della partita per gli spettatori (vedi spectators.py).
+
+        Parte prima dell'evento corrispondente verso i giocatori, così il server
+        riceve i cambiamenti nell'ordine in cui sono avvenuti: è una scrittura
+        piccola su una connessione già aperta, senza attendere risposta.
+        """
+        try:
+            self.send_to_server(encode_message(dict(fields, type="STATE")))
+        except OSError as e:
+            log.debug("Stato per gli spettatori non inviato: %s", e)
 
-        for thread in threads:
-            thread.join()
+    def report_result(self):
+        """Torneo: il presentatore comunica al server i punti della partita, che avvia la successiva."""
+        try:
+            self.send_to_server(encode_message({  # JSON senza busta: è per il server, non per i peer
+                "type": "RESULT",
+                "game": self.game,
+                "scores": [[host, port, score] for (host, port), score in self.scores.top()],
+            }))
+        except OSError as e:
+            log.warning("Risultato della partita non inviato al server: %s", e)
+
+
+
+
+    def load_question_bank(self, path):
+        """Carica (o ricarica) il banco di domande del presentatore; restituisce il numero di domande."""
+        if self.question_bank:
+            self.question_bank.close()
+        self.prefetched = None
+        self.question_bank = QuestionBank(path)
+        return len(self.question_bank)
+
+    def draw_question(self, category=None, difficulty=None):
+        """Estrae dal banco una domanda non ancora usata; None se non ce ne sono più."""
+        if self.question_bank is None:
+            raise ValueError("Nessun banco di domande caricato")
+        if self.prefetched is not None and category is None and difficulty is None:
+            drawn, self.prefetched = self.prefetched, None
+            return drawn
+        return self.question_bank.draw(category, difficulty)
+
+    def start_presenter(self, question=None, correct_answer=None, category=None, difficulty=None, assets=(), upcoming=None):
+        """Gestisce il ruolo del presentatore; senza domanda ne pesca una dal banco.
+
+        assets sono i percorsi di immagini o audio della domanda: vengono caricati
+        sul server (solo la prima volta) e i giocatori li ricevono per hash. Con
+        upcoming la prossima domanda del banco viene estratta durante il round e i
+        suoi asset annunciati (automatico se la domanda viene dal banco senza filtri).
+        """
+        if question is None:
+            drawn = self.draw_question(category, difficulty)
+            if drawn is None:
+                log.warning("Il banco non ha più domande disponibili.")
+                return None
+            question, correct_answer, assets = drawn.question, drawn.answer, drawn.assets
+            if upcoming is None:
+                upcoming = category is None and difficulty is None  # La prossima domanda si può estrarre già ora
+        described = self.upload_assets(assets)
+        self.question_id += 1
+        self.arbiter.open(self.question_id)
+        self.round_over.clear()
+        self.round_matcher = AnswerMatcher(correct_answer)  # Normalizzazione della risposta fatta una volta sola
+        # Un solo frame per tutti i giocatori, inviato sui canali già aperti dai round precedenti
+        message = {"type": "QUESTION", "question": question, "question_id": self.question_id, "sent_at": time.time()}
+        if described:
+            message["assets"] = described  # Campo extra: la domanda viaggia in JSON
+        frame = self.codec.encode(message)
+        players = [p for p in self.peers if p != self.presenter]
+        self.record("QUESTION", question_id=self.question_id, question=question, players=len(players))
+        self.publish_state(question={"id": self.question_id, "text": question}, buzz=None)
+        started = time.perf_counter()
+        if self.relay and players:
+            self.question_frame = frame  # Ripetuta se la connessione cade prima che il round si chiuda
+            try:
+                self.send_to_server(route_frame(frame, TO_OTHERS))  # L'hub la consegna a tutti i giocatori
+            except OSError as e:
+                log.warning("Domanda non inviata, verrà ripetuta alla ripresa della sessione: %s", e)
+            if upcoming:
+                self.transfers.submit(self.prefetch_next)  # Gli asset della prossima arrivano durante il round
+            self.round_over.wait()
+        elif not self.relay and self.collector.send_all(players, frame):
+            if upcoming:
+                self.transfers.submit(self.prefetch_next)
+            self.round_over.wait()  # Il ciclo di raccolta chiude il round alla risposta corretta
+        else:
+            log.warning("Nessun giocatore raggiungibile.")
+            self.round_matcher = None
+            return question, correct_answer
+        METRICS.observe("question.round", time.perf_counter() - started)
+        return question, correct_answer
+
+    def upload_assets(self, paths):
+        """Carica sul server gli asset non ancora caricati; restituisce le descrizioni di quelli disponibili."""
+        described = []
+        for path in paths:
+            try:
+                described.append(self.assets.upload(path))
+            except (OSError, ProtocolError, AssetError) as e:
+                log.warning("Asset %s non caricato: %s", path, e)
+        return described
+
+    def prefetch_next(self):
+        """Estrae in anticipo la prossima domanda del banco e ne annuncia gli asset."""
+        if self.prefetched is None and self.question_bank is not None:
+            self.prefetched = self.question_bank.draw()
+        if self.prefetched is not None and self.prefetched.assets:
+            self.announce_assets(self.prefetched.assets)
+
+    def announce_assets(self, paths):
+        """PREFETCH: i giocatori scaricano subito gli asset di una domanda futura."""
+        described = self.upload_assets(paths)
+        if not described:
+            return
+        frame = self.codec.encode({"type": "PREFETCH", "assets": described})
+        players = [p for p in self.peers if p != self.presenter]
+        try:
+            if self.relay:
+                self.send_to_server(route_frame(frame, TO_OTHERS))
+            else:
+                self.collector.send_all(players, frame)
+        except OSError as e:
+            log.warning("PREFETCH non inviato: %s", e)
+
+    def deliver_assets(self, data, on_question_received):
+        """Scarica gli asset di una QUESTION già consegnata e li passa alla GUI con ASSETS_LOADED."""
+        paths = self.load_assets(data["assets"])
+        self.handle_event({
+            "type": "ASSETS_LOADED",
+            "question_id": data.get("question_id"),
+            "assets": data["assets"],
+            "asset_paths": paths,
+        }, None, on_question_received)
+
+    def load_assets(self, assets):
+        """Percorsi locali degli asset di una domanda (None se non disponibile); quelli non in cache vengono scaricati ora."""
+        started = time.perf_counter()
+        paths = []
+        for asset in assets:
+            if asset["id"] not in self.assets:
+                METRICS.inc("assets.question_misses")  # Né ripetuto né annunciato in anticipo (o non ancora arrivato)
+            try:
+                paths.append(self.assets.fetch(asset))
+            except (OSError, ProtocolError, AssetError) as e:
+                log.warning("Asset %s della domanda non disponibile: %s", asset.get("name", asset["id"][:12]), e)
+                paths.append(None)
+        METRICS.observe("question_assets", time.perf_counter() - started)
+        return paths
 
 
 
 
     def start_player(self):
         """Gestisce il ruolo del partecipante."""
-        print("Sei un partecipante. Attendi una domanda dal presentatore...")
-        # Mantieni il peer in ascolto
-        while True:
-            pass  # Ascolto infinito fino a quando non arriva una domanda
+        log.info("Sei un partecipante. Attendi una domanda dal presentatore...")
+        # Il thread listener gestisce le domande: qui si attende la fine della partita senza consumare CPU
+        self.wait_for_end()
 
 if __name__ == "__main__":
+    setup_logging()
     peer = QuizPeer()
     peer.start_peer_server()
-    peer.connect_to_server() 
\ No newline at end of file
+    peer.connect_to_server()
+    if peer.role == "PLAYER":
+        peer.start_player()
\ No newline at end of file
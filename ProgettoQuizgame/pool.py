@@ -0,0 +1,125 @@
+import select
+import socket
+import threading
+from protocol import Connection, encode_message
+from metrics import METRICS, get_logger
+
+log = get_logger("pool")
+
+
+class PeerConnectionPool:
+    """Connessioni persistenti verso gli altri peer, indicizzate per indirizzo.
+
+    Ogni notifica riusa la connessione già aperta verso il peer invece di fare
+    un nuovo handshake TCP; se la connessione risulta chiusa viene riaperta.
+    """
+
+    def __init__(self, connect_timeout=3.0, health_interval=5.0):
+        self.connect_timeout = connect_timeout
+        self.health_interval = health_interval
+        self.connections = {}  # {(host, port): Connection}
+        self.lock = threading.Lock()
+        self.connect_locks = {}  # Un lock per indirizzo: evita connessioni doppie verso lo stesso peer
+        self.stopped = threading.Event()
+        self.health_thread = None
+
+    def get(self, addr, timeout=None):
+        """Restituisce una connessione valida verso addr, aprendola se necessario."""
+        with self.lock:
+            conn = self.connections.get(addr)
+            connect_lock = self.connect_locks.setdefault(addr, threading.Lock())
+        if conn is not None and self.is_alive(conn):
+            return conn
+        with connect_lock:
+            with self.lock:
+                conn = self.connections.get(addr)
+            if conn is not None:
+                if self.is_alive(conn):
+                    return conn  # Riaperta nel frattempo da un altro thread
+                self.discard(addr)
+            connect_timeout = self.connect_timeout if timeout is None else min(timeout, self.connect_timeout)
+            conn = Connection.connect(addr, timeout=connect_timeout)
+            conn.sock.settimeout(None)
+            conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # Le notifiche sono piccole e urgenti
+            conn.meter = METRICS.meter(addr)
+            METRICS.inc("pool.connects")
+            with self.lock:
+                self.connections[addr] = conn
+            return conn
+
+    def warm(self, addrs):
+        """Apre in anticipo le connessioni verso addrs (ad esempio mentre la stanza si riempie)."""
+        for addr in addrs:
+            try:
+                self.get(addr)
+            except OSError as e:
+                log.debug("Connessione verso %s non aperta in anticipo: %s", addr, e)
+
+    def send_frame(self, addr, frame, retries=1, timeout=None):
+        """Invia un frame già codificato; in caso di errore riconnette e riprova.
+
+        Con timeout l'invio (connessione compresa) non blocca oltre la scadenza:
+        una connessione scaduta a metà frame viene scartata e non si riprova.
+        """
+        for attempt in range(retries + 1):
+            try:
+                conn = self.get(addr, timeout)
+                conn.send_frame(frame, timeout)  # Scadenza del solo invio: il socket resta condiviso
+                return
+            except TimeoutError:
+                self.discard(addr)
+                raise
+            except OSError:
+                self.discard(addr)
+                if attempt == retries:
+                    raise
+
+    def send(self, addr, message):
+        self.send_frame(addr, encode_message(message))
+
+    def discard(self, addr):
+        with self.lock:
+            conn = self.connections.pop(addr, None)
+        if conn:
+            conn.close()
+
+    @staticmethod
+    def is_alive(conn):
+        """Controlla senza bloccare se il peer remoto ha chiuso la connessione."""
+        try:
+            poller = select.poll()  # poll e non recv(MSG_DONTWAIT): con un timeout impostato recv attenderebbe
+            poller.register(conn.sock, select.POLLIN)
+            if not poller.poll(0):
+                return True  # Nessun dato né EOF in arrivo: connessione aperta
+            return bool(conn.sock.recv(1, socket.MSG_PEEK))  # b"" significa EOF: il peer ha chiuso
+        except (OSError, ValueError):
+            return False
+
+    def health_check(self):
+        """Chiude e rimuove le connessioni che il peer remoto ha abbandonato."""
+        with self.lock:
+            snapshot = list(self.connections.items())
+        for addr, conn in snapshot:
+            if not self.is_alive(conn):
+                log.debug("Connessione verso %s non più attiva, verrà riaperta al prossimo invio.", addr)
+                with self.lock:
+                    if self.connections.get(addr) is conn:
+                        del self.connections[addr]
+                conn.close()
+
+    def start_health_checks(self):
+        if self.health_thread is None:
+            self.health_thread = threading.Thread(target=self._health_loop, daemon=True)
+            self.health_thread.start()
+
+    def _health_loop(self):
+        while not self.stopped.wait(self.health_interval):
+            self.health_check()
+
+    def close(self):
+        self.stopped.set()
+        with self.lock:
+            connections = list(self.connections.values())
+            self.connections.clear()
+        for conn in connections:
+            conn.close()
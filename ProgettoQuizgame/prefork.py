@@ -0,0 +1,261 @@
+"""Modalità pre-fork: più processi QuizServer sulla stessa porta (SO_REUSEPORT).
+
+Ogni worker apre il proprio socket in ascolto sulla stessa porta e il kernel
+distribuisce tra loro le nuove connessioni: accept e lettura del REGISTER
+avvengono in parallelo su più core, senza un GIL condiviso. Le stanze restano
+coerenti grazie al coordinatore, nel processo padre, che tiene l'unico registro
+globale (matchmaking, peer già registrati, giocatori per stanza) e assegna ogni
+stanza al worker che la apre. Se un peer viene collocato in una stanza di un
+altro worker, il suo socket gli viene passato insieme al REGISTER (SCM_RIGHTS
+su un socket Unix): tutti i peer di una partita finiscono sullo stesso processo,
+che invia lo START e gestisce la partita come in modalità singola.
+
+Le richieste di un worker al coordinatore sono in pipeline: ognuna porta un id
+e più registrazioni dello stesso worker restano in volo insieme, invece di
+attendere una alla volta la risposta della precedente. Il coordinatore risponde
+a tutte le richieste arrivate con una stessa lettura in un'unica scrittura; le
+uscite (LEAVE) non attendono risposta.
+
+Uso: python prefork.py 4 [asyncio] [relay] [assets]   (numero di worker)
+"""
+import itertools
+import json
+import multiprocessing
+import selectors
+import signal
+import socket
+import sys
+import threading
+from assets import AssetStore
+from protocol import Connection, ProtocolError, encode_message
+from rooms import Room, RoomRegistry, RegistrationError
+from metrics import METRICS, get_logger, setup_logging
+
+log = get_logger("prefork")
+
+HANDOFF_SIZE = 64 * 1024  # Dimensione massima del REGISTER passato insieme al socket
+
+
+class Coordinator:
+    """Registro globale delle stanze nel processo padre; risponde alle richieste dei worker."""
+
+    def __init__(self, channels, players, winning_score, max_rooms=None):
+        self.rooms = RoomRegistry(players, winning_score, max_rooms)
+        self.owners = {}  # {room_id: indice del worker che ospita la stanza}
+        self.selector = selectors.DefaultSelector()
+        for index, sock in enumerate(channels):
+            self.selector.register(sock, selectors.EVENT_READ, (index, Connection(sock)))
+
+    def handle(self, worker, message):
+        if message["type"] == "LOCATE":
+            return {"type": "LOCATED", "owner": self.owners.get(message.get("room"))}  # Per gli spettatori
+        peer = tuple(message["peer"])
+        if message["type"] == "JOIN":
+            try:
+                room, _ = self.rooms.join(None, peer, message.get("room"))
+            except RegistrationError as e:
+                return {"type": "ERROR", "message": str(e)}
+            owner = self.owners.setdefault(room.room_id, worker)  # Chi apre la stanza la ospita
+            return {"type": "PLACED", "room": room.room_id, "owner": owner}
+        if message["type"] == "LEAVE":
+            room = self.rooms.leave(peer)
+            if room is not None and not room.peers:
+                self.rooms.close(room)
+                self.owners.pop(room.room_id, None)
+            elif room is not None and not message.get("registered", True):
+                self.rooms.reopen(room)  # Il peer non è mai arrivato al worker: la stanza non è completa
+            return {"type": "OK"}
+        return {"type": "ERROR", "message": f"Richiesta sconosciuta: {message['type']}"}
+
+    def run(self):
+        while self.selector.get_map():
+            for key, _ in self.selector.select():
+                worker, conn = key.data
+                try:
+                    messages = conn.recv_ready()
+                except (OSError, ProtocolError) as e:
+                    log.error("Canale con il worker %s interrotto: %s", worker, e)
+                    messages = None
+                if messages is None:
+                    self.selector.unregister(key.fileobj)
+                    continue
+                # Una sola scrittura per tutte le risposte della lettura; LEAVE (senza id) non ne ha
+                replies = []
+                for message in messages:
+                    reply = self.handle(worker, message)
+                    if "id" in message:
+                        replies.append(encode_message(dict(reply, id=message["id"])))
+                if replies:
+                    try:
+                        conn.send_frame(b"".join(replies))
+                    except OSError as e:
+                        log.error("Risposte al worker %s non inviate: %s", worker, e)
+
+
+class Shard:
+    """Lato worker: canale verso il coordinatore e passaggio dei socket tra worker."""
+
+    def __init__(self, index, channel, inbox, outboxes):
+        self.index = index
+        self.channel = Connection(channel)
+        self.lock = threading.Lock()  # Scritture sul canale e tabella delle richieste in volo
+        self.ids = itertools.count(1)
+        self.waiting = {}  # {id: [Event, risposta]} delle richieste in attesa di risposta
+        self.closed = False  # Canale interrotto: le richieste falliscono subito
+        self.inbox = inbox  # Socket ricevuti dagli altri worker
+        self.outboxes = outboxes  # {indice del worker: socket Unix verso il suo inbox}
+        self.reader = threading.Thread(target=self.read_replies, name="shard-replies", daemon=True)
+        self.reader.start()
+
+    def registry(self, players, winning_score, max_rooms=None):
+        return ShardRegistry(self, players, winning_score)
+
+    def request(self, message):
+        """Invia una richiesta al coordinatore e ne attende la risposta; altre richieste possono partire nel frattempo."""
+        waiter = [threading.Event(), None]
+        with self.lock:
+            if self.closed:
+                return {"type": "ERROR", "message": "Coordinator unavailable"}
+            request_id = next(self.ids)
+            self.waiting[request_id] = waiter
+            self.channel.send(dict(message, id=request_id))
+        waiter[0].wait()
+        return waiter[1]
+
+    def notify(self, message):
+        """Richiesta senza risposta: parte in ordine con le altre ma nessuno la attende."""
+        with self.lock:
+            self.channel.send(message)
+
+    def read_replies(self):
+        """Consegna le risposte del coordinatore a chi le attende, nell'ordine in cui arrivano."""
+        try:
+            while True:
+                reply = self.channel.recv()
+                if reply is None:
+                    break
+                with self.lock:
+                    waiter = self.waiting.pop(reply.pop("id", None), None)
+                if waiter is not None:
+                    waiter[1] = reply
+                    waiter[0].set()
+        except (OSError, ProtocolError) as e:
+            log.error("Canale con il coordinatore interrotto: %s", e)
+        with self.lock:
+            self.closed = True
+            waiting, self.waiting = self.waiting, {}
+        for waiter in waiting.values():
+            waiter[1] = {"type": "ERROR", "message": "Coordinator unavailable"}
+            waiter[0].set()
+
+    def place(self, peer_addr, room_id=None):
+        """Colloca il peer in una stanza globale; restituisce (room_id, indice del worker che la ospita)."""
+        reply = self.request({"type": "JOIN", "peer": peer_addr, "room": room_id})
+        if reply["type"] == "ERROR":
+            raise RegistrationError(reply["message"])
+        return reply["room"], reply["owner"]
+
+    def locate(self, room_id):
+        """Indice del worker che ospita la stanza; None se la stanza non esiste."""
+        return self.request({"type": "LOCATE", "room": room_id}).get("owner")
+
+    def leave(self, peer_addr, registered=True):
+        self.notify({"type": "LEAVE", "peer": peer_addr, "registered": registered})
+
+    def hand_off(self, owner, sock, addr, peer_addr, registration):
+        """Passa il socket di un peer (con il suo REGISTER o SPECTATE) al worker che ospita la sua stanza."""
+        payload = json.dumps({"addr": addr, "registration": registration}).encode()
+        try:
+            socket.send_fds(self.outboxes[owner], [payload], [sock.fileno()])
+        except OSError:
+            if peer_addr is not None:  # None: uno spettatore, che non occupa posti nella stanza
+                self.leave(peer_addr, registered=False)
+            raise
+        METRICS.inc("prefork.handoffs")
+
+    def receive(self):
+        """Prossimo socket passato da un altro worker: (socket, indirizzo, REGISTER)."""
+        payload, fds, _, _ = socket.recv_fds(self.inbox, HANDOFF_SIZE, 1)
+        data = json.loads(payload)
+        return socket.socket(fileno=fds[0]), tuple(data["addr"]), data["registration"]
+
+
+class ShardRegistry(RoomRegistry):
+    """Registro locale di un worker: le stanze e i loro id arrivano dal coordinatore."""
+
+    def __init__(self, shard, players, winning_score):
+        super().__init__(players, winning_score)
+        self.shard = shard
+
+    def join(self, conn, peer_addr, room_id=None, encodings=None):
+        with self.lock:
+            if room_id not in self.rooms:
+                room = Room(room_id, self.players, self.winning_score)
+                self.rooms[room_id] = room
+                self.waiting.append(room)
+        try:
+            return super().join(conn, peer_addr, room_id, encodings)
+        except Exception:
+            self.shard.leave(peer_addr, registered=False)  # Il posto assegnato dal coordinatore si libera
+            raise
+
+    def leave(self, peer_addr):
+        room = super().leave(peer_addr)
+        if room is not None:
+            self.shard.leave(peer_addr)
+        return room
+
+    def cancel(self, peer_addr):
+        room = RoomRegistry.leave(self, peer_addr)
+        if room is not None:
+            self.reopen(room)
+            self.shard.leave(peer_addr, registered=False)  # Anche il coordinatore riapre la stanza
+        return room
+
+
+def run_worker(index, channel, inbox, outboxes, options):
+    # Import qui: il processo padre non ha bisogno del server
+    from server import QuizServer
+    setup_logging()  # Il thread dei log del padre non sopravvive al fork: ogni worker avvia il proprio
+    server = QuizServer(reuse_port=True, shard=Shard(index, channel, inbox, outboxes), **options)
+    server.run()
+
+
+def run_prefork(workers, host="localhost", port=12345, players=3, winning_score=3, max_rooms=None, ready=None, **options):
+    """Avvia workers processi QuizServer sulla stessa porta e il coordinatore nel processo corrente."""
+    context = multiprocessing.get_context("fork")  # I socket dei canali passano ai figli per ereditarietà
+    channels = [socket.socketpair() for _ in range(workers)]
+    inboxes = [socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM) for _ in range(workers)]
+    outboxes = {index: outbox for index, (_, outbox) in enumerate(inboxes)}
+    options = dict(options, host=host, port=port, players=players, winning_score=winning_score)
+    processes = []
+    for index in range(workers):
+        process = context.Process(target=run_worker, name=f"quiz-worker-{index}", daemon=True,
+                                  args=(index, channels[index][1], inboxes[index][0], outboxes, options))
+        process.start()
+        processes.append(process)
+    log.info("Avviati %s worker sulla porta %s", workers, port)
+    coordinator = Coordinator([parent for parent, _ in channels], players, winning_score, max_rooms)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))  # Con il padre terminano anche i worker
+    if ready is not None:
+        ready.set()
+    try:
+        coordinator.run()
+    finally:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    setup_logging()
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else multiprocessing.cpu_count()
+    mode = "asyncio" if "asyncio" in sys.argv[2:] else "thread"
+    players = int(input("Inserisci il numero di giocatori: "))
+    if players < 3:
+        players = 3
+    winning_score = int(input("Inserisci il punteggio necessario per vincere: "))
+    if winning_score < 0:
+        winning_score = 3
+    # Fork: ogni worker eredita il proprio AssetStore sulla stessa cartella
+    assets = AssetStore() if "assets" in sys.argv[2:] else None
+    run_prefork(workers, players=players, winning_score=winning_score, mode=mode, relay="relay" in sys.argv[2:], assets=assets)
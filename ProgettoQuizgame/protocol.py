@@ -0,0 +1,191 @@
+import asyncio
+import json
+import select
+import socket
+import struct
+import threading
+import time
+from collections import deque
+
+# Ogni messaggio è un oggetto JSON preceduto dalla sua lunghezza in byte (4 byte, big-endian).
+# Tra i peer di una partita il payload può essere anche nel formato compatto di codec.py.
+HEADER = struct.Struct("!I")
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024  # Limite di sicurezza contro header corrotti
+RECV_SIZE = 65536
+# Busta dei frame inoltrati dall'hub del server: marcatore 0 e indice del peer
+# (destinatario verso il server, mittente verso i peer), seguiti dal payload originale.
+ROUTE = struct.Struct("!BH")
+ROUTE_MARKER = 0
+TO_ALL = 0xFFFF  # Tutti i peer della stanza, mittente compreso
+TO_OTHERS = 0xFFFE  # Tutti tranne il mittente
+
+
+class ProtocolError(Exception):
+    """Frame non valido ricevuto sulla connessione."""
+
+
+def encode_message(message):
+    """Serializza un messaggio e lo prefissa con la sua lunghezza."""
+    payload = json.dumps(message).encode()
+    if len(payload) > MAX_MESSAGE_SIZE:
+        raise ProtocolError(f"Messaggio troppo grande: {len(payload)} byte")
+    return HEADER.pack(len(payload)) + payload
+
+
+def decode_payload(payload):
+    try:
+        return json.loads(payload)
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ProtocolError(f"Payload non valido: {e}") from e
+
+
+def route_frame(frame, target):
+    """Imbusta un frame già codificato per l'hub, indirizzandolo a un peer (indice) o a TO_ALL/TO_OTHERS."""
+    payload = ROUTE.pack(ROUTE_MARKER, target) + frame[HEADER.size:]
+    return HEADER.pack(len(payload)) + payload
+
+
+class FrameDecoder:
+    """Decoder incrementale: accumula i byte letti e restituisce i messaggi completi."""
+
+    def __init__(self, decode=decode_payload):
+        self.buffer = bytearray()
+        self.decode = decode  # Decodifica di un payload completo (JSON o quella negoziata dal codec)
+
+    def feed(self, data):
+        return [self.decode(payload) for payload in self.split(data)]
+
+    def split(self, data):
+        """Accumula i byte letti e restituisce i payload completi, ancora da decodificare."""
+        self.buffer += data
+        payloads = []
+        offset = 0
+        while len(self.buffer) - offset >= HEADER.size:
+            (size,) = HEADER.unpack_from(self.buffer, offset)
+            if size > MAX_MESSAGE_SIZE:
+                raise ProtocolError(f"Frame troppo grande: {size} byte")
+            end = offset + HEADER.size + size
+            if len(self.buffer) < end:
+                break  # Frame incompleto: aspetta altri byte
+            payloads.append(bytes(self.buffer[offset + HEADER.size:end]))
+            offset = end
+        if offset:
+            del self.buffer[:offset]
+        return payloads
+
+
+class Connection:
+    """Socket TCP con lettura bufferizzata e invio di messaggi framed.
+
+    Più messaggi possono viaggiare sulla stessa connessione (pipelining): quelli
+    arrivati nello stesso recv restano in coda per le letture successive. Sono
+    decodificati solo quando vengono restituiti: un messaggio (ad esempio lo
+    START) può cambiare la codifica di quelli che lo seguono nello stesso recv.
+    """
+
+    def __init__(self, sock, codec=None):
+        self.sock = sock
+        self.codec = codec  # MessageCodec della partita; None: solo JSON (es. verso il server)
+        self.decoder = FrameDecoder(codec.decode if codec else decode_payload)
+        self.pending = deque()  # Payload completi non ancora decodificati
+        self.send_lock = threading.Lock()  # Evita che invii concorrenti si mescolino
+        self.meter = None  # Opzionale: meter(inviati, ricevuti) conta i byte (vedi Metrics.meter)
+
+    @classmethod
+    def connect(cls, addr, timeout=None, codec=None):
+        return cls(socket.create_connection(addr, timeout=timeout), codec)
+
+    def send(self, message):
+        self.send_frame(self.codec.encode(message) if self.codec else encode_message(message))
+
+    def send_frame(self, frame, timeout=None):
+        """Invia un frame già codificato (utile per codificare una sola volta nei broadcast).
+
+        Con timeout l'invio (attesa del lock compresa) termina entro la scadenza o
+        solleva TimeoutError, senza cambiare il timeout del socket condiviso con
+        gli altri mittenti e con chi legge. Un frame interrotto a metà lascia la
+        connessione inutilizzabile: va chiusa.
+        """
+        if timeout is None:
+            with self.send_lock:
+                self.sock.sendall(frame)
+        else:
+            deadline = time.monotonic() + timeout
+            if not self.send_lock.acquire(timeout=max(0.0, timeout)):
+                raise TimeoutError("Invio scaduto in attesa degli altri mittenti")
+            try:
+                self._send_before(frame, deadline)
+            finally:
+                self.send_lock.release()
+        if self.meter:
+            self.meter(len(frame), 0)
+
+    def _send_before(self, frame, deadline):
+        view = memoryview(frame)
+        poller = select.poll()
+        poller.register(self.sock, select.POLLOUT)
+        while view:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not poller.poll(remaining * 1000):
+                raise TimeoutError("Invio scaduto: il peer non legge")
+            try:
+                sent = self.sock.send(view, socket.MSG_DONTWAIT)
+            except BlockingIOError:
+                continue
+            view = view[sent:]
+
+    def recv(self):
+        """Restituisce il prossimo messaggio, oppure None se il peer ha chiuso la connessione."""
+        while not self.pending:
+            data = self.sock.recv(RECV_SIZE)
+            if not data:
+                return None
+            if self.meter:
+                self.meter(0, len(data))
+            self.pending.extend(self.decoder.split(data))
+        return self.decoder.decode(self.pending.popleft())
+
+    def recv_ready(self):
+        """Una sola lettura su un socket già pronto (selectors): messaggi completi, None se chiusa."""
+        if not self.pending:
+            data = self.sock.recv(RECV_SIZE)
+            if not data:
+                return None
+            if self.meter:
+                self.meter(0, len(data))
+            self.pending.extend(self.decoder.split(data))
+        payloads = list(self.pending)
+        self.pending.clear()
+        return [self.decoder.decode(payload) for payload in payloads]
+
+    def getpeername(self):
+        return self.sock.getpeername()
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def close(self):
+        self.sock.close()
+
+
+async def read_payload_async(reader):
+    """Legge il payload grezzo del prossimo frame da uno StreamReader; None se la connessione è chiusa."""
+    try:
+        header = await reader.readexactly(HEADER.size)
+        (size,) = HEADER.unpack(header)
+        if size > MAX_MESSAGE_SIZE:
+            raise ProtocolError(f"Frame troppo grande: {size} byte")
+        return await reader.readexactly(size)
+    except asyncio.IncompleteReadError:
+        return None
+
+
+async def read_message_async(reader):
+    """Legge un messaggio da uno StreamReader asyncio; None se la connessione è chiusa."""
+    payload = await read_payload_async(reader)
+    return None if payload is None else decode_payload(payload)
+
+
+def write_message_async(writer, message):
+    """Accoda un messaggio framed su uno StreamWriter asyncio."""
+    writer.write(encode_message(message))
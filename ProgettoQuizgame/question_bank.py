@@ -0,0 +1,200 @@
+"""Banco di domande su file, indicizzato per categoria e difficoltà.
+
+Formato del file (UTF-8, una domanda per riga, campi separati da TAB):
+
+    categoria<TAB>difficoltà<TAB>domanda<TAB>risposta[<TAB>asset,asset...]
+
+L'ultimo campo, facoltativo, elenca immagini o audio della domanda (percorsi
+relativi alla cartella del banco, separati da virgole): vedi assets.py.
+Le righe vuote o che iniziano con '#' sono ignorate, come quelle con meno di
+quattro campi (contate in skipped e segnalate nel log). Il file viene mappato in
+memoria e l'indice contiene solo gli offset delle righe: il testo di una domanda
+viene letto solo quando viene estratta. L'indice è salvato accanto al file
+(<file>.idx), così gli avvii successivi non devono riscandire il banco.
+
+Uso: python question_bank.py genera <file> <numero>   (banco sintetico di prova)
+     python question_bank.py info <file>
+"""
+import json
+import mmap
+import os
+import random
+import sys
+import threading
+import time
+from array import array
+from collections import namedtuple
+from metrics import get_logger, setup_logging
+
+log = get_logger("question_bank")
+
+Question = namedtuple("Question", ["category", "difficulty", "question", "answer", "assets"], defaults=((),))
+
+INDEX_SUFFIX = ".idx"
+INDEX_VERSION = 2
+
+
+class QuestionBank:
+    """Estrae domande casuali senza ripetizioni in O(1) per estrazione."""
+
+    def __init__(self, path, use_index_cache=True, rng=None):
+        self.path = path
+        self.rng = rng or random.Random()
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.buckets = {}  # {(categoria, difficoltà): array di offset delle righe}
+        self.skipped = 0  # Righe malformate escluse dall'indice
+        if not (use_index_cache and self._load_index()):
+            self._build_index()
+            if use_index_cache:
+                self._save_index()
+        self.remaining = {}  # {(categoria, difficoltà): domande non ancora estratte}
+        self.lock = threading.Lock()
+        self.reset()
+
+    def _build_index(self):
+        data = self.data
+        buckets = {}
+        skipped = 0
+        offset, end = 0, len(data)
+        while offset < end:
+            line_end = data.find(b"\n", offset)
+            if line_end < 0:
+                line_end = end
+            if data[offset:offset + 1] == b"#" or not data[offset:line_end].strip():
+                offset = line_end + 1
+                continue
+            first_tab = data.find(b"\t", offset, line_end)
+            second_tab = data.find(b"\t", first_tab + 1, line_end) if first_tab >= 0 else -1
+            third_tab = data.find(b"\t", second_tab + 1, line_end) if second_tab >= 0 else -1
+            if third_tab >= 0:
+                key = (data[offset:first_tab].decode(), data[first_tab + 1:second_tab].decode())
+                offsets = buckets.get(key)
+                if offsets is None:
+                    offsets = buckets[key] = array("Q")
+                offsets.append(offset)
+            else:
+                skipped += 1  # Meno di quattro campi: la riga non potrebbe essere estratta
+            offset = line_end + 1
+        self.buckets = buckets
+        self.skipped = skipped
+        if skipped:
+            log.warning("%s: %s righe senza i quattro campi richiesti ignorate", self.path, skipped)
+
+    def _index_signature(self):
+        stat = os.fstat(self.file.fileno())
+        return {"version": INDEX_VERSION, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def _load_index(self):
+        """Carica l'indice salvato se corrisponde ancora al file; False altrimenti."""
+        try:
+            with open(self.path + INDEX_SUFFIX, "rb") as f:
+                header = json.loads(f.readline())
+                if header.get("signature") != self._index_signature():
+                    return False
+                buckets = {}
+                skipped = header.get("skipped", 0)
+                for category, difficulty, count in header["buckets"]:
+                    offsets = array("Q")
+                    offsets.fromfile(f, count)
+                    buckets[(category, difficulty)] = offsets
+        except (OSError, ValueError, EOFError, KeyError):
+            return False
+        self.buckets = buckets
+        self.skipped = skipped
+        return True
+
+    def _save_index(self):
+        header = {
+            "signature": self._index_signature(),
+            "skipped": self.skipped,
+            "buckets": [[category, difficulty, len(offsets)] for (category, difficulty), offsets in self.buckets.items()],
+        }
+        try:
+            with open(self.path + INDEX_SUFFIX, "wb") as f:
+                f.write(json.dumps(header).encode() + b"\n")
+                for offsets in self.buckets.values():
+                    offsets.tofile(f)
+        except OSError as e:
+            log.warning("Impossibile salvare l'indice del banco di domande: %s", e)
+
+    def reset(self):
+        """Rimette in gioco tutte le domande."""
+        with self.lock:
+            self.remaining = {key: len(offsets) for key, offsets in self.buckets.items()}
+
+    def __len__(self):
+        return sum(len(offsets) for offsets in self.buckets.values())
+
+    def available(self):
+        return sum(self.remaining.values())
+
+    def categories(self):
+        return sorted({category for category, _ in self.buckets})
+
+    def difficulties(self):
+        return sorted({difficulty for _, difficulty in self.buckets})
+
+    def draw(self, category=None, difficulty=None):
+        """Estrae una domanda non ancora uscita; None se il filtro non ha più domande."""
+        with self.lock:
+            keys = [key for key, left in self.remaining.items()
+                    if left and (category is None or key[0] == category) and (difficulty is None or key[1] == difficulty)]
+            if not keys:
+                return None
+            # Il gruppo è scelto in proporzione alle domande rimaste: l'estrazione resta uniforme
+            if len(keys) == 1:
+                key = keys[0]
+            else:
+                key = self.rng.choices(keys, weights=[self.remaining[k] for k in keys])[0]
+            offsets = self.buckets[key]
+            left = self.remaining[key]
+            # Scambio con l'ultima domanda rimasta: le estratte finiscono in coda, senza ripetizioni
+            index = self.rng.randrange(left)
+            offsets[index], offsets[left - 1] = offsets[left - 1], offsets[index]
+            self.remaining[key] = left - 1
+            offset = offsets[left - 1]
+        return self._read(offset)
+
+    def _read(self, offset):
+        line_end = self.data.find(b"\n", offset)
+        line = self.data[offset:line_end if line_end >= 0 else len(self.data)].decode().rstrip("\r")
+        category, difficulty, question, answer, *assets = line.split("\t", 4)
+        if assets:
+            folder = os.path.dirname(os.path.abspath(self.path))
+            assets = tuple(os.path.join(folder, name.strip()) for name in assets[0].split(",") if name.strip())
+        return Question(category, difficulty, question, answer, tuple(assets))
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+
+def generate(path, count, seed=1):
+    """Scrive un banco sintetico di domande aritmetiche, utile per prove di carico."""
+    rng = random.Random(seed)
+    categories = ("matematica", "logica", "calcolo")
+    difficulties = ("facile", "media", "difficile")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("# categoria\tdifficoltà\tdomanda\trisposta\n")
+        for _ in range(count):
+            level = rng.randrange(3)
+            a, b = rng.randint(1, 10 ** (level + 1)), rng.randint(1, 10 ** (level + 1))
+            f.write(f"{rng.choice(categories)}\t{difficulties[level]}\tQuanto fa {a} + {b}?\t{a + b}\n")
+
+
+if __name__ == "__main__":
+    setup_logging()
+    if len(sys.argv) == 4 and sys.argv[1] == "genera":
+        generate(sys.argv[2], int(sys.argv[3]))
+    elif len(sys.argv) == 3 and sys.argv[1] == "info":
+        started = time.perf_counter()
+        bank = QuestionBank(sys.argv[2])
+        print(f"{len(bank)} domande caricate in {(time.perf_counter() - started) * 1000:.1f} ms ({bank.skipped} righe malformate ignorate)")
+        print(f"Categorie: {', '.join(bank.categories())}")
+        print(f"Difficoltà: {', '.join(bank.difficulties())}")
+        print(f"Esempio: {bank.draw()}")
+    else:
+        print(__doc__)
@@ -1,22 +1,39 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, filedialog
+import queue
 import threading
-import json
+import sys
 import time
 from peer import QuizPeer
+from metrics import METRICS, get_logger, setup_logging
+
+log = get_logger("gui")
+
+LEADERBOARD_SIZE = 20  # Giocatori mostrati nella finestra della classifica
+EVENT_QUEUE_SIZE = 1000  # Eventi in attesa oltre i quali le semplici notifiche vengono scartate
+POLL_MS = 30  # Ogni quanto il ciclo di Tk svuota la coda degli eventi
+BATCH_SIZE = 100  # Eventi applicati per giro: il resto al giro successivo, la GUI resta reattiva
+FEED_SIZE = 50  # Notifiche conservate nel riquadro
 
 class QuizPeerGUI:
-    def __init__(self):
+    def __init__(self, relay=False):
+        self.relay = relay  # Nessuna porta in ascolto: gli eventi passano dall'hub del server
         self.peer = None
         self.server_connected = False
         self.active_timer = None
         self.current_buzzer = None
-        self.lock = threading.Lock()
+        self.current_connection = None
+        # I thread di rete non toccano mai i widget: accodano (funzione, argomenti)
+        # e il ciclo di Tk li esegue a blocchi in poll_events
+        self.events = queue.Queue()  # Senza limite: le transizioni di stato non si scartano mai
+        self.pending_notices = []  # Notifiche del blocco corrente, unite prima di mostrarle
+        self.overflowing = False
 
         # Crea la finestra principale
         self.root = tk.Tk()
         self.root.title("Quiz Game")
-        self.root.geometry("600x400")
+        self.root.geometry("600x520")
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
 
         # Tema scuro
         self.root.configure(bg="#2e2e2e")
@@ -53,7 +70,7 @@ class QuizPeerGUI:
         self.question_entry.grid(row=1, column=0, columnspan=2, sticky="ew", padx=5, pady=5)
 
         # Label e campo per la risposta corretta
-        ttk.Label(self.presenter_frame, text="Risposta Corretta:").grid(row=2, column=0, sticky="w", padx=5, pady=5)
+        ttk.Label(self.presenter_frame, text="Risposta Corretta (alternative separate da |):").grid(row=2, column=0, sticky="w", padx=5, pady=5)
         self.answer_entry = ttk.Entry(self.presenter_frame, width=40)
         self.answer_entry.grid(row=3, column=0, columnspan=2, sticky="ew", padx=5, pady=5)
 
@@ -64,6 +81,14 @@ class QuizPeerGUI:
         self.leaderboard_button = ttk.Button(self.presenter_frame, text="Classifica", command=self.show_leaderboard)
         self.leaderboard_button.grid(row=4, column=1, padx=5, pady=5)
 
+        # Pulsanti per il banco di domande
+        self.load_bank_button = ttk.Button(self.presenter_frame, text="Carica domande", command=self.load_question_bank)
+        self.load_bank_button.grid(row=5, column=0, padx=5, pady=5)
+
+        self.random_question_button = ttk.Button(self.presenter_frame, text="Domanda casuale", command=self.send_random_question)
+        self.random_question_button.grid(row=5, column=1, padx=5, pady=5)
+        self.random_question_button.config(state=tk.DISABLED)
+
         # Configurazione per il ridimensionamento
         self.presenter_frame.grid_columnconfigure(0, weight=1)
         self.presenter_frame.grid_columnconfigure(1, weight=1)
@@ -82,6 +107,10 @@ class QuizPeerGUI:
 
         self.question_text = ttk.Label(self.player_frame, text="Nessuna domanda ricevuta", wraplength=400, justify="center")
         self.question_text.pack(pady=5)
+        self.asset_label = ttk.Label(self.player_frame, text="", justify="center")  # Immagine o allegato della domanda
+        self.asset_label.pack(pady=5)
+        self.asset_image = None  # Riferimento alla PhotoImage mostrata: senza, Tk la libera
+        self.question_id = None  # Domanda mostrata: gli asset scaricati dopo si applicano solo a lei
 
         # Campo per la risposta
         self.player_answer_entry = ttk.Entry(self.player_frame, width=30)
@@ -101,15 +130,78 @@ class QuizPeerGUI:
 
 
         
+        # Notifiche: sostituiscono le finestre modali, che bloccherebbero il ciclo di Tk
+        self.feed = tk.Listbox(self.main_frame, height=6, bg="#1e1e1e", fg="#ffffff",
+                               highlightthickness=0, borderwidth=0, activestyle="none")
+        self.feed.pack(side=tk.BOTTOM, fill=tk.X, pady=5)
+
         # Nascondi entrambi i frame all'inizio
         self.presenter_frame.pack_forget()
         self.player_frame.pack_forget()
 
+        self.root.after(POLL_MS, self.poll_events)
+
+    def post(self, handler, *args, notice=False):
+        """Accoda handler(*args) per il thread della GUI; non blocca mai il chiamante.
+
+        Domande, START, buzz, esiti e fine partita cambiano lo stato dei widget e
+        vengono sempre accodati; le semplici notifiche (notice=True) si scartano
+        se in coda ci sono già EVENT_QUEUE_SIZE eventi.
+        """
+        if notice and self.events.qsize() >= EVENT_QUEUE_SIZE:
+            METRICS.inc("gui.dropped")
+            if not self.overflowing:  # Un solo avviso per raffica, non uno per evento
+                self.overflowing = True
+                log.warning("Coda della GUI piena: notifiche scartate fino al prossimo svuotamento")
+            return
+        self.events.put_nowait((handler, args))
+
+    def poll_events(self):
+        """Applica un blocco di eventi accodati, poi mostra le notifiche del blocco in una volta."""
+        started = time.perf_counter()
+        try:
+            for _ in range(BATCH_SIZE):
+                try:
+                    handler, args = self.events.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    handler(*args)
+                except Exception as e:
+                    log.exception("Errore nell'aggiornamento della GUI: %s", e)
+            self.flush_notices()
+            self.overflowing = False
+        finally:
+            METRICS.observe("gui.batch", time.perf_counter() - started)
+            self.root.after(POLL_MS, self.poll_events)
+
+    def notify(self, text):
+        """Aggiunge una notifica al riquadro (dal thread della GUI)."""
+        self.pending_notices.append(text)
+
+    def flush_notices(self):
+        if not self.pending_notices:
+            return
+        # Notifiche uguali e consecutive diventano una sola riga con il numero di ripetizioni
+        lines = []
+        for text in self.pending_notices:
+            if lines and lines[-1][0] == text:
+                lines[-1][1] += 1
+            else:
+                lines.append([text, 1])
+        self.pending_notices = []
+        for text, count in lines:
+            self.feed.insert(tk.END, text if count == 1 else f"{text} (x{count})")
+        overflow = self.feed.size() - FEED_SIZE
+        if overflow > 0:
+            self.feed.delete(0, overflow - 1)
+        self.feed.see(tk.END)
+
     def start_peer(self):
         """Avvia il peer e tenta la connessione al server."""
         if not self.peer:
-            self.peer = QuizPeer(server_host='localhost', server_port=12345)
-            threading.Thread(target=lambda: self.peer.start_peer_server(self.update_question_gui), daemon=True).start()
+            self.peer = QuizPeer(server_host='localhost', server_port=12345, relay=self.relay)
+            threading.Thread(target=lambda: self.peer.start_peer_server(self.on_network_event), daemon=True).start()
             threading.Thread(target=self.connect_to_server_with_status, daemon=True).start()
             self.start_button.config(state="disabled")  # Disabilita il bottone per evitare clic multipli
 
@@ -118,28 +210,30 @@ class QuizPeerGUI:
         try:
             self.peer.connect_to_server()
             self.server_connected = True
-            self.update_status("Connesso")
+            self.post(self.update_status, "Connesso")
             threading.Thread(target=self.monitor_role, daemon=True).start()
         except Exception as e:
             self.server_connected = False
-            self.update_status("Connessione al server fallita")
-            messagebox.showerror("Errore di Connessione", f"Impossibile connettersi al server: {e}")
-            self.start_button.config(state="normal")  # Riabilita il bottone se la connessione fallisce
+            self.post(self.connection_failed, e)
+
+    def connection_failed(self, error):
+        self.update_status("Connessione al server fallita")
+        self.notify(f"Impossibile connettersi al server: {error}")
+        self.start_button.config(state="normal")  # Riabilita il bottone se la connessione fallisce
 
     def update_status(self, status):
         """Aggiorna il testo dello stato nella GUI."""
         self.status_label.config(text=f"Stato: {status}")
 
     def monitor_role(self):
-        """Monitora il ruolo del peer e aggiorna la GUI appena viene assegnato."""
-        while not self.peer.role:
-            time.sleep(0.1)  # Aspetta per evitare un loop continuo
-        self.root.after(0, lambda: self.update_role(self.peer.role))  # Aggiorna la GUI dal thread principale
+        """Attende l'assegnazione del ruolo (senza polling) e aggiorna subito la GUI."""
+        role = self.peer.wait_for_role()
+        self.post(self.update_role, role)  # Aggiorna la GUI dal thread principale
 
     def update_role(self, role):
         """Aggiorna il ruolo nella GUI."""
-        print(f"Ruolo assegnato: {role}")  # Debug: mostra il ruolo assegnato
-        self.role_label.config(text=f"Ruolo: {role.capitalize()} {self.peer.peer_port}")
+        log.debug("Ruolo assegnato: %s", role)
+        self.role_label.config(text=f"Ruolo: {role.capitalize()} {self.peer.address[1]}")
         if role == "PRESENTER":
             self.show_presenter_gui()
         elif role == "PLAYER":
@@ -163,9 +257,48 @@ class QuizPeerGUI:
             self.question_entry.delete(0, tk.END)
             self.answer_entry.delete(0, tk.END)
         else:
-            messagebox.showwarning("Errore", "Inserisci sia la domanda che la risposta corretta!")
+            self.notify("Inserisci sia la domanda che la risposta corretta!")
             self.send_question_button.config(state=tk.NORMAL)
 
+    def load_question_bank(self):
+        """Carica un banco di domande (file TSV) da cui pescare senza doverle digitare."""
+        path = filedialog.askopenfilename(title="Banco di domande", filetypes=[("Domande", "*.tsv *.txt"), ("Tutti i file", "*")])
+        if not path:
+            return
+        # L'indice di un banco grande richiede tempo: lo costruisce un thread, la finestra resta reattiva
+        self.load_bank_button.config(state=tk.DISABLED)
+        self.random_question_button.config(state=tk.DISABLED)
+        self.update_status("Caricamento del banco di domande...")
+        threading.Thread(target=self.read_question_bank, args=(path,), daemon=True).start()
+
+    def read_question_bank(self, path):
+        try:
+            count = self.peer.load_question_bank(path)
+        except (OSError, ValueError) as e:
+            self.post(self.question_bank_loaded, None, e)
+        else:
+            self.post(self.question_bank_loaded, count, None)
+
+    def question_bank_loaded(self, count, error):
+        self.load_bank_button.config(state=tk.NORMAL)
+        if error is not None:
+            self.update_status("Banco di domande non caricato")
+            self.notify(f"Impossibile caricare il banco di domande: {error}")
+            return
+        self.update_status(f"Banco caricato: {count} domande")
+        self.random_question_button.config(state=tk.NORMAL)
+
+    def send_random_question(self):
+        """Pesca una domanda dal banco e la invia subito ai giocatori."""
+        drawn = self.peer.draw_question()
+        if drawn is None:
+            self.notify("Il banco non ha più domande disponibili!")
+            return
+        self.send_question_button.config(state=tk.DISABLED)
+        self.update_status(f"Domanda: {drawn.question} ({drawn.answer})")
+        threading.Thread(target=self.peer.start_presenter, args=(drawn.question, drawn.answer),
+                         kwargs={"assets": drawn.assets, "upcoming": True}, daemon=True).start()
+
     def show_leaderboard(self):
         if self.peer:
             leaderboard_window = tk.Toplevel(self.root)
@@ -173,175 +306,221 @@ class QuizPeerGUI:
 
             ttk.Label(leaderboard_window, text="Classifica Giocatori", font=("Arial", 16)).pack(pady=10)
 
-            presenter = self.peer.presenter
-            scores = {player: score for player, score in self.peer.scores.items() if player != presenter}
-
-            for player, score in sorted(scores.items(), key=lambda x: x[1], reverse=True):
+            # La classifica è già ordinata (il presentatore non ne fa parte): basta leggere i primi
+            for player, score in self.peer.scores.top(LEADERBOARD_SIZE):
                 ttk.Label(leaderboard_window, text=f"Player {player[1]}: {score} punti").pack(pady=2)
 
+            if self.peer.tournament:
+                # Punti sommati su tutte le partite del torneo, aggiornati a ogni START
+                ttk.Label(leaderboard_window, text="Classifica del torneo", font=("Arial", 14)).pack(pady=10)
+                for _, port, score in self.peer.tournament["standings"][:LEADERBOARD_SIZE]:
+                    ttk.Label(leaderboard_window, text=f"Player {port}: {score} punti").pack(pady=2)
+
             ttk.Button(leaderboard_window, text="Chiudi", command=leaderboard_window.destroy).pack(pady=10)
 
 
 
+    def on_network_event(self, message, connection):
+        """Chiamata dai thread di rete: accoda l'evento per il thread della GUI e ritorna subito."""
+        self.post(self.update_question_gui, message, connection)
+
     def update_question_gui(self, message, connection):
-        """Aggiorna la GUI con la domanda o la notifica ricevuta."""
-        print(message)
+        """Aggiorna la GUI con la domanda o la notifica ricevuta (dal thread della GUI)."""
+        log.debug("Evento ricevuto: %s", message)
         if message["type"] == "END":
-            self.root.after(0, lambda: messagebox.showinfo("Notifica", message["message"]))
+            self.notify(message["message"])
             self.submit_button.config(state=tk.DISABLED)  # Disabilita il pulsante
             self.update_status("Fine")
             self.send_question_button.config(state=tk.DISABLED)  # Disabilita il pulsante
  
         elif message["type"] == "CORRECT_ANSWER":
             # Notifica di un vincitore
-            self.root.after(0, lambda: messagebox.showinfo("Notifica", message["message"]))
+            self.notify(message["message"])
             self.submit_button.config(state=tk.DISABLED)  # Disabilita il pulsante
             self.buzz_button.config(state=tk.DISABLED)
             self.send_question_button.config(state=tk.NORMAL)  # Riabilita il bottone
-            if self.active_timer is not None:
-                self.root.after_cancel(self.active_timer)
-                self.active_timer=None
+            self.cancel_timer()
             self.current_buzzer=None
         elif message["type"] == "WRONG_ANSWER":
-            self.root.after(0, lambda: messagebox.showinfo("Notifica", message["message"]))
+            self.notify(message["message"])
             self.current_buzzer=None
-            print("risposta sbagliata libero il buzz, current holder",self.current_buzzer)
+            log.debug("Risposta sbagliata, buzz libero (detentore: %s)", self.current_buzzer)
             mess=message["peer"]["port"]
-            if self.peer.peer_port != mess:
-                #print("ci entro")
+            if self.peer.address[1] != mess:
                 self.buzz_button.config(state=tk.NORMAL)
-                print("il bottone di", self.peer.peer_port)
+                log.debug("Pulsante di prenotazione riabilitato per %s", self.peer.address[1])
+
+        elif message["type"] == "PEER_LEFT":
+            self.notify(message["message"])
+            if (message["peer"]["host"], message["peer"]["port"]) == self.peer.presenter:
+                # Senza presentatore la partita non può continuare
+                self.cancel_timer()
+                self.buzz_button.config(state=tk.DISABLED)
+                self.submit_button.config(state=tk.DISABLED)
+                self.update_status("Fine: il presentatore ha lasciato la partita")
+
+        elif message["type"] == "START":
+            # Nuova partita (nei tornei anche con un altro presentatore): si riparte da zero
+            self.cancel_timer()
+            self.current_buzzer = None
+            self.question_text.config(text="")
+            self.show_assets({})
+            self.buzz_button.config(state=tk.DISABLED)
+            self.submit_button.config(state=tk.DISABLED)
+            self.send_question_button.config(state=tk.NORMAL)
+            self.update_role(self.peer.role)
+            tournament = message.get("tournament")
+            if tournament:
+                self.update_status(f"Torneo: fase {tournament['stage']}/{tournament['stages']}, partita {tournament['game']}")
+
+        elif message["type"] == "ELIMINATED":
+            self.notify("Sei stato eliminato dal torneo: resti collegato fino alla finale")
+            self.update_status("Eliminato")
+
+        elif message["type"] == "TOURNAMENT_END":
+            self.notify(message["message"])
+            self.update_status("Fine torneo")
+            self.buzz_button.config(state=tk.DISABLED)
+            self.submit_button.config(state=tk.DISABLED)
+            self.send_question_button.config(state=tk.DISABLED)
+
+        elif message["type"] == "RESUMED":
+            # Connessione al server ripresa: la partita continua dallo stato ricevuto
+            self.notify("Connessione al server ripristinata")
+            buzz = (message.get("state") or {}).get("buzz")
+            self.current_buzzer = buzz[1] if buzz else None
+            if self.current_buzzer is not None and self.current_buzzer != self.peer.address[1]:
+                self.buzz_button.config(state=tk.DISABLED)
+
+        elif message["type"] == "FEEDBACK":
+            # Esito della nostra risposta, arrivato sul canale della domanda
+            self.cancel_timer()
+            self._handle_feedback(message)
+
+        elif message["type"] == "ASSETS_LOADED":
+            # Asset della domanda scaricati dopo la sua consegna
+            if message.get("question_id") == self.question_id:
+                self.show_assets(message)
 
         elif message["type"] == "BUZZ":
-            self.root.after(0, lambda: messagebox.showinfo("Notifica", message["message"]))
+            # Decisione dell'arbitro del presentatore: il buzz è di un solo giocatore
+            self.notify(message["message"])
             self.current_buzzer=message["peer"]["port"]
-            print("entro e aggiorno current holder",self.current_buzzer)
+            log.debug("Nuovo detentore del buzz: %s", self.current_buzzer)
             self.buzz_button.config(state=tk.DISABLED)
-            #self.submit_button.config(state=tk.NORMAL)
+            self.cancel_timer()
+            if self.current_buzzer == self.peer.address[1]:
+                # Abilita il pulsante invia risposta
+                self.submit_button.config(state=tk.NORMAL)
+                self.active_timer = self.root.after(10000, lambda: self.disable_answer("Tempo scaduto"))
         else:
             # Mostra la domanda e abilita il pulsante
             self.current_connection = connection
             self.question_text.config(text=message["question"])
+            self.question_id = message.get("question_id")
+            self.show_assets({})  # Gli asset arrivano con ASSETS_LOADED
             self.buzz_button.config(state=tk.NORMAL)
 
-
-
-    
+    def show_assets(self, message):
+        """Mostra la prima immagine della domanda (PNG o GIF, i formati di Tk); gli altri asset come allegati."""
+        self.asset_image = None
+        notes = []
+        for asset, path in zip(message.get("assets", []), message.get("asset_paths", [])):
+            if path is None:
+                notes.append(f"{asset.get('name', 'allegato')}: non disponibile")
+            elif self.asset_image is None and asset.get("mime") in ("image/png", "image/gif"):
+                try:
+                    self.asset_image = tk.PhotoImage(file=path)
+                except tk.TclError as e:
+                    notes.append(f"{asset.get('name', 'immagine')}: {e}")
+            else:
+                notes.append(f"Allegato {asset.get('name', '')} ({asset.get('mime')}): {path}")
+        self.asset_label.config(image=self.asset_image or "", text="\n".join(notes), compound="top")
+
+    def cancel_timer(self):
+        if self.active_timer is not None:
+            self.root.after_cancel(self.active_timer)
+            self.active_timer = None
 
     def end_game(self):
         """Termina il gioco e invia un messaggio ai giocatori."""
         if self.peer:
             threading.Thread(target=self.peer.notify_end_game, daemon=True).start()
-            messagebox.showinfo("Gioco Terminato", "Il gioco è stato terminato dal presentatore.")
-
-
+            self.notify("Il gioco è stato terminato dal presentatore.")
 
     def submit_answer(self):
         """Invia la risposta alla domanda corrente."""
-        if hasattr(self, 'current_connection') and self.current_connection:
+        if self.current_connection:
             answer = self.player_answer_entry.get()
             if not answer:
-                messagebox.showwarning("Errore", "Inserisci una risposta prima di inviare!")
+                self.notify("Inserisci una risposta prima di inviare!")
                 return
 
             threading.Thread(target=self._process_answer, args=(answer,), daemon=True).start()
         else:
-            messagebox.showwarning("Errore", "Nessuna domanda ricevuta a cui rispondere!")
+            self.notify("Nessuna domanda ricevuta a cui rispondere!")
 
     def _process_answer(self, answer):
-        """Gestisce l'invio della risposta e il feedback dal server."""
+        """Invia la risposta: l'esito arriva come FEEDBACK in update_question_gui."""
         try:
-            self.current_connection.sendall(answer.encode())
-            feedback = self.current_connection.recv(1024).decode()
-            print("feedback",feedback)
-            if feedback:
-                if self.active_timer:
-                    print(self.active_timer)
-                    self.root.after_cancel(self.active_timer)
-                    self.active_timer = None
-                    print("timer cancellato")
-                self.root.after(0, lambda: self._handle_feedback(feedback))
+            self.peer.send_answer(answer)
         except Exception as e:
-            print(f"Errore nell'invio della risposta: {e}")
-            self.root.after(0, lambda: messagebox.showerror("Errore", "Errore di comunicazione con il server."))
-
-
-    def disable_answer(self,mess):
-        with self.lock:
-            """Disabilita il campo risposta dopo 10 secondi."""
-            buzz_message = json.dumps({
-                "type": "WRONG_ANSWER",
-                "message": f"Il peer {self.peer.peer_port} ha impiegato troppo tempo a rispondere!",
-                "peer": {
-                    "port": self.peer.peer_port,  # Usa solo informazioni serializzabili
-                    "host": self.peer.server_host  # Se necessario, aggiungi altre proprietà
-                }
-            })
-            self.peer.notify_all_peers(buzz_message)
-            messagebox.showinfo(mess)
-            self.buzz_button.config(state=tk.DISABLED)
-            self.submit_button.config(state=tk.DISABLED)
-            self.active_timer=self.root.after(10000, self.handle_timeout)
+            log.error("Errore nell'invio della risposta: %s", e)
+            self.post(self.notify, "Errore di comunicazione con il server.", notice=True)
+
+    def disable_answer(self, mess):
+        """Disabilita il campo risposta dopo 10 secondi."""
+        # L'arbitro libera il buzz e avvisa tutti i peer (senza bloccare la GUI)
+        threading.Thread(target=self.peer.report_buzz_timeout, daemon=True).start()
+        self.notify(mess)
+        self.buzz_button.config(state=tk.DISABLED)
+        self.submit_button.config(state=tk.DISABLED)
+        self.active_timer=self.root.after(10000, self.handle_timeout)
 
     def handle_timeout(self):
-            print("il atto", self.current_buzzer)
-            if self.current_buzzer is None:
-                self.buzz_button.config(state=tk.NORMAL)
-        
-        
+        self.active_timer = None
+        log.debug("Tempo scaduto, detentore attuale: %s", self.current_buzzer)
+        if self.current_buzzer is None:
+            self.buzz_button.config(state=tk.NORMAL)
 
     def handle_buzz(self):
         """Gestisce la prenotazione del giocatore."""
-        if hasattr(self, 'current_connection') and self.current_connection:
-            with self.lock:
-                print("verifico il current_buzzer",self.current_buzzer)
-                if self.current_buzzer is None:
-                    #self.current_buzzer=self.peer.peer_port
-            # Notifica il server che il giocatore si è prenotato
-                    buzz_message = json.dumps({
-                        "type": "BUZZ", 
-                        "message": f"Il peer {self.peer.peer_port} si è prenotato!, ha 10 secondi per rispondere",
-                        "peer": {
-                                "port": self.peer.peer_port,  # Usa solo informazioni serializzabili
-                                "host": self.peer.server_host  # Se necessario, aggiungi altre proprietà
-                                }
-                            })
-                    threading.Thread(target=self.peer.notify_all_peers, args=(buzz_message,), daemon=True).start()
-
-            # Abilita il pulsante invia risposta
-                    self.submit_button.config(state=tk.NORMAL)
-                    self.buzz_button.config(state=tk.DISABLED)
-                    self.active_timer = self.root.after(10000, lambda: self.disable_answer("tempo scaduto"))
-                else:
-                    print("buzzer_holder",self.current_buzzer)
-                    messagebox.showwarning("Errore", "Aspetta il tuo turno!")
+        if self.current_connection:
+            log.debug("Detentore del buzz: %s", self.current_buzzer)
+            if self.current_buzzer is None:
+                # Chiede il buzz all'arbitro del presentatore: la risposta si abilita solo se concesso
+                threading.Thread(target=self.peer.request_buzz, daemon=True).start()
+                self.buzz_button.config(state=tk.DISABLED)
+            else:
+                log.debug("Buzz già assegnato a %s", self.current_buzzer)
+                self.notify("Aspetta il tuo turno!")
         else:
-            messagebox.showwarning("Errore", "Nessuna domanda ricevuta a cui prenotarsi!")
-
+            self.notify("Nessuna domanda ricevuta a cui prenotarsi!")
 
-    def _handle_feedback(self, feedback):
+    def _handle_feedback(self, feedback_data):
         try:
-            feedback_data = json.loads(feedback)
-            if feedback_data['type'] == "CORRECT_ANSWER":
+            if feedback_data['correct']:
                 score = feedback_data['score']
                 self.player_score_label.config(text=f"Punteggio: {score}")
-                self.current_connection.close()
-                self.current_connection = None
-            elif feedback_data['type'] == "WRONG_ANSWER":
+                self.current_connection = None  # Il canale resta aperto per la prossima domanda
+            else:
                 self.buzz_button.config(state=tk.DISABLED)
                 self.submit_button.config(state=tk.DISABLED)
                 self.active_timer=self.root.after(10000, self.handle_timeout)
-        except json.JSONDecodeError:
-            print("Errore nel parsing del feedback:", feedback)
-
-
-
+        except KeyError:
+            log.warning("Feedback non valido: %s", feedback_data)
 
+    def close(self):
+        """Chiusura della finestra: il server toglie subito il peer invece di attendere una ripresa della sessione."""
+        if self.peer and self.peer.session:
+            self.peer.leave()
+        self.root.destroy()
 
     def run(self):
         """Avvia il ciclo principale della GUI."""
         self.root.mainloop()
 
 if __name__ == "__main__":
-    gui = QuizPeerGUI()
+    setup_logging()
+    gui = QuizPeerGUI(relay="relay" in sys.argv[1:])  # Es.: python quiz_game_gui.py relay
     gui.run()
\ No newline at end of file
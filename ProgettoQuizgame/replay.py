@@ -0,0 +1,173 @@
+"""Replay del registro degli eventi: ricostruisce classifiche e latenze dai file di event_log.
+
+Gli eventi vengono letti uno alla volta: la memoria dipende dal numero di
+partite e di giocatori, non dalla lunghezza dei file. Più file (ad esempio quello
+del server e quelli dei presentatori) vengono fusi in ordine di tempo. Le
+classifiche ricostruite dalle risposte corrette sono confrontate con i RESULT
+registrati dal server nei tornei.
+
+Uso: python replay.py eventi_server.jsonl eventi_peer.jsonl --mmap
+     python replay.py genera <file> <partite>   (registro sintetico di prova)
+"""
+import argparse
+import heapq
+import json
+import random
+import sys
+import time
+
+from event_log import EventLog, EventReader
+from scoreboard import Scoreboard
+from metrics import Histogram, setup_logging
+
+LATENCIES = ("first_question", "buzz", "question_to_buzz", "answer", "game")
+
+
+class GameReplay:
+    """Stato ricostruito di una partita: si tiene solo la domanda aperta."""
+
+    __slots__ = ("started_at", "question_id", "question_at", "buzz_at", "asked", "scores")
+
+    def __init__(self, started_at=None):
+        self.started_at = started_at
+        self.question_id = None
+        self.question_at = None
+        self.buzz_at = {}  # {peer: istante del buzz concesso} per la domanda aperta
+        self.asked = 0
+        self.scores = {}  # {peer: punti}: basta per il confronto con il RESULT
+
+
+class Replay:
+    """Applica gli eventi in ordine e accumula classifiche e latenze."""
+
+    def __init__(self):
+        self.games = {}  # {(stanza, partita): GameReplay}
+        self.standings = Scoreboard()  # Punti di tutte le partite
+        self.latencies = {name: Histogram() for name in LATENCIES}  # Bucket fissi: memoria costante anche su registri enormi
+        self.counts = {}
+        self.results = 0
+        self.mismatches = []  # Partite in cui il RESULT non coincide con le risposte registrate
+
+    def game(self, event):
+        key = (event.get("room"), event.get("game"))
+        game = self.games.get(key)
+        if game is None:
+            game = self.games[key] = GameReplay()
+        return game
+
+    def feed(self, event):
+        kind = event.get("event")
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+        t = event["t"]
+        if kind == "START":
+            self.game(event).started_at = t
+        elif kind == "QUESTION":
+            game = self.game(event)
+            if not game.asked and game.started_at is not None:
+                self.latencies["first_question"].observe(t - game.started_at)
+            game.asked += 1
+            game.question_id, game.question_at = event.get("question_id"), t
+            game.buzz_at.clear()
+        elif kind == "BUZZ":
+            game = self.game(event)
+            peer = tuple(event["peer"])
+            if event.get("sent_at"):
+                self.latencies["buzz"].observe(t - event["sent_at"])
+            if game.question_id == event.get("question_id"):
+                if not game.buzz_at:
+                    self.latencies["question_to_buzz"].observe(t - game.question_at)  # Primo buzz della domanda
+                game.buzz_at[peer] = t
+        elif kind == "ANSWER":
+            game = self.game(event)
+            peer = tuple(event["peer"])
+            buzz_at = game.buzz_at.pop(peer, None)
+            if buzz_at is not None and game.question_id == event.get("question_id"):
+                self.latencies["answer"].observe(t - buzz_at)
+            if event.get("correct"):
+                game.scores[peer] = game.scores.get(peer, 0) + 1
+                self.standings.increment(peer)
+        elif kind == "END":
+            game = self.game(event)
+            if game.started_at is not None:
+                self.latencies["game"].observe(t - game.started_at)
+        elif kind == "RESULT":
+            self.results += 1
+            game = self.game(event)
+            reported = {(host, port): points for host, port, points in event.get("scores", []) if points}
+            if reported != game.scores:
+                self.mismatches.append([event.get("room"), event.get("game")])
+
+    def report(self, top=10):
+        return {
+            "events": sum(self.counts.values()),
+            "by_event": dict(sorted(self.counts.items(), key=lambda item: str(item[0]))),
+            "games": sum(1 for game in self.games.values() if game.started_at is not None or game.asked),
+            "questions": sum(game.asked for game in self.games.values()),
+            "results_checked": self.results,
+            "mismatches": self.mismatches[:top],
+            "standings": [[host, port, points] for (host, port), points in self.standings.top(top)],
+            "latency_ms": {name: histogram.snapshot() for name, histogram in self.latencies.items()},
+        }
+
+
+def read_all(paths, use_mmap=False):
+    """Eventi di uno o più file in ordine di tempo; ogni file è già ordinato perché scritto in sola aggiunta."""
+    readers = [EventReader(path, use_mmap) for path in paths]
+    events = readers[0] if len(readers) == 1 else heapq.merge(*readers, key=lambda event: event["t"])
+    return readers, events
+
+
+def generate(path, games, players=4, questions=10, seed=1):
+    """Scrive un registro sintetico di partite complete, per misurare la velocità del replay."""
+    rng = random.Random(seed)
+    log = EventLog(path, sync="never", batch_size=4096)
+    t = time.time()
+    for room in range(1, games + 1):
+        peers = [("127.0.0.1", 20000 + room * players + i) for i in range(players)]
+        presenter, others = peers[0], peers[1:]
+        for peer in peers:
+            log.append({"t": t, "event": "REGISTER", "room": room, "peer": peer})
+        log.append({"t": t, "event": "START", "room": room, "game": 1, "presenter": presenter, "peers": peers})
+        for question_id in range(1, questions + 1):
+            t += rng.uniform(0.01, 0.1)
+            log.append({"t": t, "event": "QUESTION", "room": room, "game": 1, "question_id": question_id, "question": "Quanto fa 1 + 1?", "players": len(others)})
+            winner = rng.choice(others)
+            for peer in rng.sample(others, len(others)):
+                sent_at, t = t + rng.uniform(0.05, 0.5), t + rng.uniform(0.5, 0.6)
+                log.append({"t": t, "event": "BUZZ", "room": room, "game": 1, "question_id": question_id, "peer": peer, "sent_at": sent_at})
+                t += rng.uniform(0.1, 1.0)
+                correct = peer == winner
+                log.append({"t": t, "event": "ANSWER", "room": room, "game": 1, "question_id": question_id, "peer": peer, "correct": correct, "score": 0})
+                if correct:
+                    break
+        log.append({"t": t, "event": "END", "room": room, "game": 1, "winner": presenter})
+    log.close()
+
+
+def main():
+    setup_logging()
+    if len(sys.argv) == 4 and sys.argv[1] == "genera":
+        generate(sys.argv[2], int(sys.argv[3]))
+        return
+    parser = argparse.ArgumentParser(description="Ricostruisce classifiche e latenze dal registro degli eventi.")
+    parser.add_argument("files", nargs="+", help="file scritti da EventLog (più file vengono fusi in ordine di tempo)")
+    parser.add_argument("--mmap", action="store_true", help="legge i file da un mmap invece che riga per riga")
+    parser.add_argument("--top", type=int, default=10, help="giocatori in classifica e partite discordanti da mostrare")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    replay = Replay()
+    readers, events = read_all(args.files, args.mmap)
+    for event in events:
+        replay.feed(event)
+    elapsed = time.perf_counter() - started
+    result = replay.report(args.top)
+    result["corrupted_lines"] = sum(reader.corrupted for reader in readers)
+    result["duration_sec"] = round(elapsed, 3)
+    result["events_per_sec"] = round(result["events"] / elapsed) if elapsed else None
+    print(json.dumps(result, indent=2))
+    sys.exit(1 if replay.mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
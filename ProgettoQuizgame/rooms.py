@@ -0,0 +1,159 @@
+import itertools
+import random
+import threading
+from collections import deque
+
+
+class RegistrationError(Exception):
+    """Registrazione rifiutata: il messaggio viene inoltrato al peer."""
+
+
+class Room:
+    """Una partita: i peer che vi partecipano, il presentatore e lo stato di avvio."""
+
+    def __init__(self, room_id, capacity, winning_score):
+        self.room_id = room_id
+        self.capacity = capacity
+        self.winning_score = winning_score
+        self.peers = []  # [(connessione, indirizzo del peer)] in ordine di registrazione
+        self.encodings = {}  # {indirizzo del peer: codifiche dichiarate nel REGISTER}
+        self.presenter = None
+        self.started = False  # Stanza completa: non accetta altri peer
+        self.pending = set()  # Peer con il posto riservato ma senza REGISTERED ancora inviato
+        self.launched = False  # Tutti confermati: lo START è partito (o sta per partire)
+        self.start = None  # Ultimo START inviato, per i peer che riprendono la sessione durante un torneo
+
+    def is_full(self):
+        return len(self.peers) >= self.capacity
+
+    def addresses(self):
+        return [peer_addr for _, peer_addr in self.peers]
+
+    def choose_presenter(self):
+        self.presenter = random.choice(self.peers)[1]
+        return self.presenter
+
+
+class RoomRegistry:
+    """Registro delle stanze con coda di matchmaking e indice peer -> stanza.
+
+    I nuovi peer entrano nella stanza aperta più vecchia (join-or-create), così
+    ogni stanza si riempie prima di aprirne un'altra; tutte le operazioni sono O(1).
+    """
+
+    def __init__(self, players, winning_score, max_rooms=None):
+        self.players = players  # Giocatori per stanza
+        self.winning_score = winning_score
+        self.max_rooms = max_rooms  # None: nessun limite al numero di partite contemporanee
+        self.rooms = {}  # {room_id: Room}
+        self.waiting = deque()  # Stanze non ancora piene, in ordine di creazione
+        self.peer_index = {}  # {(host, port): Room}
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def join(self, conn, peer_addr, room_id=None, encodings=None):
+        """Riserva al peer un posto in una stanza; restituisce (stanza, True se la stanza è ora completa).
+
+        Il posto resta in attesa di conferma (confirm) finché il REGISTERED non è
+        partito: l'invio avviene fuori dal lock, così un client lento non blocca le
+        registrazioni degli altri.
+        """
+        with self.lock:
+            if peer_addr in self.peer_index:
+                raise RegistrationError("Peer already registered")
+            if room_id is not None:
+                room = self.rooms.get(room_id)
+                if room is None or room.started or room.is_full():
+                    raise RegistrationError("Room not available")
+            else:
+                room = self._open_room()
+            room.peers.append((conn, peer_addr))
+            room.pending.add(peer_addr)
+            room.encodings[peer_addr] = encodings
+            self.peer_index[peer_addr] = room
+            lobby_full = room.is_full()
+            if lobby_full:
+                room.started = True
+                if room in self.waiting:
+                    self.waiting.remove(room)  # Normalmente è in testa alla coda
+            return room, lobby_full
+
+    def confirm(self, room, peer_addr):
+        """Il REGISTERED del peer è partito; True per la conferma che rende avviabile la stanza.
+
+        Lo START parte solo dopo l'ultima conferma: ogni peer riceve il proprio
+        REGISTERED prima dello START.
+        """
+        with self.lock:
+            room.pending.discard(peer_addr)
+            if room.started and room.is_full() and not room.pending and not room.launched:
+                room.launched = True
+                return True
+            return False
+
+    def cancel(self, peer_addr):
+        """Annulla una registrazione non confermata (REGISTERED non inviato): il posto torna libero."""
+        room = RoomRegistry.leave(self, peer_addr)
+        if room is not None:
+            self.reopen(room)
+        return room
+
+    def _open_room(self):
+        if self.waiting:
+            return self.waiting[0]
+        if self.max_rooms is not None and len(self.rooms) >= self.max_rooms:
+            raise RegistrationError("Player limit reached")
+        room = Room(next(self.ids), self.players, self.winning_score)
+        self.rooms[room.room_id] = room
+        self.waiting.append(room)
+        return room
+
+    def reopen(self, room):
+        """Rimette in testa alla coda una stanza segnata come completa la cui partita non è partita."""
+        with self.lock:
+            if room.room_id in self.rooms and room.started and not room.launched and not room.is_full():
+                room.started = False
+                self.waiting.appendleft(room)
+
+    def replace(self, peer_addr, conn):
+        """Ripresa di una sessione: il peer resta nella stanza con una nuova connessione."""
+        with self.lock:
+            room = self.peer_index.get(peer_addr)
+            if room is not None:
+                room.peers = [(conn if addr == peer_addr else old, addr) for old, addr in room.peers]
+            return room
+
+    def room_of(self, peer_addr):
+        return self.peer_index.get(peer_addr)
+
+    def leave(self, peer_addr):
+        """Rimuove il peer dal registro; una stanza in attesa rimasta vuota viene chiusa."""
+        with self.lock:
+            room = self.peer_index.pop(peer_addr, None)
+            if room is None:
+                return None
+            room.peers = [peer for peer in room.peers if peer[1] != peer_addr]
+            room.encodings.pop(peer_addr, None)
+            room.pending.discard(peer_addr)
+            if not room.peers and not room.started:
+                self.waiting.remove(room)
+                del self.rooms[room.room_id]
+            return room
+
+    def close(self, room):
+        """Elimina una stanza terminata e libera i suoi peer."""
+        with self.lock:
+            self.rooms.pop(room.room_id, None)
+            for _, peer_addr in room.peers:
+                if self.peer_index.get(peer_addr) is room:
+                    del self.peer_index[peer_addr]
+            if room in self.waiting:
+                self.waiting.remove(room)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "rooms": len(self.rooms),
+                "waiting": len(self.waiting),
+                "peers": len(self.peer_index),
+            }
@@ -0,0 +1,120 @@
+import bisect
+import itertools
+import threading
+from collections import namedtuple
+
+# Fotografia immutabile della classifica: entries è una tupla di (host, port, punteggio) in ordine di rango.
+ScoreSnapshot = namedtuple("ScoreSnapshot", ["version", "entries"])
+
+
+class PlayerRecord:
+    """Punteggio di un giocatore; __slots__ per occupare poca memoria anche con migliaia di giocatori."""
+
+    __slots__ = ("host", "port", "score", "stamp")
+
+    def __init__(self, host, port, score=0, stamp=0):
+        self.host = host
+        self.port = port
+        self.score = score
+        self.stamp = stamp  # Ordine in cui il punteggio è stato raggiunto: spareggia i pari merito
+
+    @property
+    def address(self):
+        return (self.host, self.port)
+
+    def key(self):
+        return (-self.score, self.stamp, self.port, self.host)
+
+
+class Scoreboard:
+    """Classifica aggiornata in modo incrementale a ogni risposta corretta.
+
+    Le chiavi (-punteggio, ordine, porta, host) sono mantenute ordinate: rango e
+    posizione si trovano con una ricerca binaria in O(log n) e la top-K è una
+    slice O(K), senza riordinare tutti i punteggi a ogni richiesta.
+    """
+
+    def __init__(self, players=()):
+        self.records = {}  # {(host, port): PlayerRecord}
+        self.ranking = []  # Chiavi ordinate dei giocatori, la prima è il leader
+        self.clock = itertools.count()
+        self.version = 0  # Incrementata a ogni modifica, identifica gli snapshot
+        self.lock = threading.Lock()
+        for peer in players:
+            self.add(peer)
+
+    def add(self, peer, score=0):
+        with self.lock:
+            if peer in self.records:
+                return
+            record = PlayerRecord(peer[0], peer[1], score, next(self.clock))
+            self.records[peer] = record
+            bisect.insort(self.ranking, record.key())
+            self.version += 1
+
+    def remove(self, peer):
+        with self.lock:
+            record = self.records.pop(peer, None)
+            if record is None:
+                return
+            del self.ranking[bisect.bisect_left(self.ranking, record.key())]
+            self.version += 1
+
+    def increment(self, peer, points=1):
+        """Aggiunge punti al giocatore e ne aggiorna la posizione; restituisce il nuovo punteggio."""
+        with self.lock:
+            record = self.records.get(peer)
+            if record is None:
+                record = PlayerRecord(peer[0], peer[1], 0, next(self.clock))
+                self.records[peer] = record
+            else:
+                del self.ranking[bisect.bisect_left(self.ranking, record.key())]
+            record.score += points
+            record.stamp = next(self.clock)
+            bisect.insort(self.ranking, record.key())
+            self.version += 1
+            return record.score
+
+    def __getitem__(self, peer):
+        return self.records[peer].score
+
+    def get(self, peer, default=0):
+        record = self.records.get(peer)
+        return default if record is None else record.score
+
+    def __contains__(self, peer):
+        return peer in self.records
+
+    def __len__(self):
+        return len(self.records)
+
+    def rank(self, peer):
+        """Posizione in classifica (1 = primo) in O(log n)."""
+        with self.lock:
+            return bisect.bisect_left(self.ranking, self.records[peer].key()) + 1
+
+    def top(self, k=None):
+        """I primi k giocatori come lista di ((host, port), punteggio)."""
+        with self.lock:
+            keys = self.ranking if k is None else self.ranking[:k]
+            return [((host, port), -negative_score) for negative_score, _, port, host in keys]
+
+    def items(self):
+        return self.top()
+
+    def leader(self):
+        top = self.top(1)
+        return top[0][0] if top else None
+
+    def snapshot(self):
+        """Fotografia immutabile, utile per replay e per confrontare lo stato nel tempo."""
+        with self.lock:
+            return ScoreSnapshot(self.version, tuple((host, port, -score) for score, _, port, host in self.ranking))
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        scoreboard = cls()
+        for host, port, score in snapshot.entries:  # In ordine di rango: l'ordine di inserimento preserva gli spareggi
+            scoreboard.add((host, port), score)
+        scoreboard.version = snapshot.version
+        return scoreboard
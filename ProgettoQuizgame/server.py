@@ -1,99 +1,786 @@
 import socket
 import threading
-import json
-import random
+import asyncio
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from protocol import Connection, ProtocolError, decode_payload, encode_message, read_message_async, read_payload_async, write_message_async
+from rooms import RoomRegistry, RegistrationError
+from codec import negotiate
+from hub import RelayHub
+from liveness import HEARTBEAT_FRAME, HEARTBEAT_PAYLOAD, Liveness, peer_left
+from spectators import Spectators
+from sessions import SessionRegistry, room_of_token
+from assets import AssetStore
+from tournament import Tournament, TournamentRules
+from event_log import EventLog
+from metrics import METRICS, get_logger, serve, setup_logging
+
+log = get_logger("server")
+
+MODES = ("thread", "asyncio")
+METRICS_PORT = 9100  # Endpoint locale delle metriche: python server.py metrics
+EVENT_LOG_PATH = "eventi_server.jsonl"  # Registro degli eventi: python server.py eventi
 
 class QuizServer:
-    def __init__(self, host='localhost', port=12345, players=3, winning_score=3):
+    def __init__(self, host='localhost', port=12345, players=3, winning_score=3, mode="thread", backlog=128, max_rooms=None, relay=False, liveness=None, tournament=None, event_log=None, reuse_port=False, shard=None, spectators=None, sessions=None, assets=None):
+        if mode not in MODES:
+            raise ValueError(f"Modalità del server non valida: {mode} (valori ammessi: {', '.join(MODES)})")
+        self.mode = mode  # "thread": un thread per connessione, "asyncio": un unico event loop
         self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)  # Riutilizzo della porta
+        if reuse_port:
+            self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)  # Più processi sulla stessa porta (prefork.py)
         try:
             self.server.bind((host, port))
         except OSError as e:
-            print(f"Errore durante il binding: {e}")
+            log.error("Errore durante il binding: %s", e)
             self.server.close()
             raise
-        self.server.listen(5)
-        self.peers = []
-        self.players = players
+        self.server.listen(backlog)  # Backlog ampio per sostenere molte registrazioni simultanee
+        self.players = players  # Giocatori per partita
         self.winning_score = winning_score
-        self.lock = threading.Lock()
+        # Più partite contemporanee sullo stesso processo; con uno shard le stanze le assegna il coordinatore di prefork.py
+        self.shard = shard
+        self.rooms = shard.registry(players, winning_score, max_rooms) if shard else RoomRegistry(players, winning_score, max_rooms)
+        self.relay = relay  # Modalità hub: gli eventi della partita passano dal server invece che tra i peer
+        self.hub = RelayHub() if relay else None
+        self.liveness = liveness or Liveness()  # Scadenze di registrazione e heartbeat
+        # Invii verso più peer (START, PEER_LEFT) in parallelo e fuori dal thread che li prepara:
+        # un peer lento non ritarda gli altri. In modalità asyncio le scritture non bloccano già
+        self.sender = ThreadPoolExecutor(max_workers=16, thread_name_prefix="server-send") if mode == "thread" else None
+        # Tornei: con delle TournamentRules ogni stanza gioca più partite di fila sulle stesse connessioni
+        self.tournament = tournament
+        self.tournaments = {}  # {room_id: Tournament}
+        self.tournament_lock = threading.Lock()  # RESULT, uscite dei peer e avvii delle partite
+        self.loop = None  # Event loop in modalità asyncio, per programmare la partita successiva
+        self.event_log = event_log  # EventLog opzionale: registrazioni, START, uscite e risultati
+        self.spectators = spectators or Spectators()  # Stato delle partite per gli spettatori in sola lettura
+        self.sessions = sessions or SessionRegistry()  # Token per riprendere la partita dopo una disconnessione
+        self.assets = assets  # AssetStore opzionale: immagini e audio delle domande, per hash (cartella condivisa tra i worker)
 
 
-    def handle_client(self, conn, addr):
-        print(f"Connessione ricevuta da {addr}")  # Indirizzo e porta effimera della connessione iniziale
+    def handle_client(self, sock, addr, registration=None):
+        """Gestisce una connessione; registration è il REGISTER già letto da un altro worker (prefork)."""
+        log.debug("Connessione ricevuta da %s", addr)  # Indirizzo e porta effimera della connessione iniziale
+        METRICS.inc("server.connections")
+        started = time.perf_counter()
+        sock.settimeout(self.liveness.register_timeout)  # Una connessione muta non trattiene il thread
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # Frame piccoli inoltrati uno dopo l'altro (asyncio lo imposta già)
+        conn = Connection(sock)
         try:
-            # Controlla se il numero massimo di peer è già stato raggiunto
-            with self.lock:
-                if len(self.peers) >= self.players:
-                    print(f"Numero massimo di giocatori raggiunto. Rifiutata connessione da {addr}.")
-                    conn.sendall(b"ERROR: Player limit reached")
-                    conn.close()
-                    return
-
             # Riceve il messaggio di registrazione con il numero di porta del peer
-            message = conn.recv(1024).decode()
-            data = json.loads(message)
+            data = registration or conn.recv()
+            if data is None:
+                log.debug("Connessione chiusa da %s prima della registrazione.", addr)
+                return
 
             if data["type"] == "REGISTER":
                 peer_host = addr[0]  # Usa l'indirizzo IP dal socket
-                peer_port = data["port"]  # Ottieni il numero di porta dal peer
+                peer_port = data.get("port")  # Ottieni il numero di porta dal peer
+                if peer_port is None and self.relay:
+                    peer_port = addr[1]  # Peer senza porta in ascolto: lo identifica la connessione verso l'hub
                 if not peer_port or not isinstance(peer_port, int):
-                    print(f"Errore: Porta non valida ricevuta da {addr}")
-                    conn.sendall(b"ERROR: Invalid port")
-                    return               
+                    log.warning("Porta non valida ricevuta da %s", addr)
+                    METRICS.inc("server.rejected")
+                    conn.send({"type": "ERROR", "message": "Invalid port"})
+                    return
                 peer_addr = (peer_host, peer_port)  # Usa l'indirizzo effettivo inviato dal peer
 
-                with self.lock:
-                    self.peers.append((conn, peer_addr))  # Salva connessione e indirizzo reale
-                print(f"Peer registrato: {peer_addr}")  # Stampa l'indirizzo reale registrato
-
-                conn.sendall(b"REGISTERED")
+                try:
+                    room_id = data.get("room")
+                    if self.shard is not None and registration is None:
+                        room_id, owner = self.shard.place(peer_addr, room_id)
+                        if owner != self.shard.index:
+                            self.shard.hand_off(owner, sock, addr, peer_addr, dict(data, room=room_id))
+                            conn.close()  # Il worker della stanza ha ricevuto una copia del socket
+                            return
+                    room, ready = self.register_peer(conn, peer_addr, room_id, data.get("encodings"))
+                except RegistrationError as e:
+                    log.warning("Registrazione rifiutata per %s: %s", addr, e)
+                    METRICS.inc("server.rejected")
+                    conn.send({"type": "ERROR", "message": str(e)})
+                    conn.close()
+                    return
+                conn.meter = METRICS.meter(peer_addr)
+                METRICS.observe("server.register", time.perf_counter() - started)
+                # Da qui il peer deve farsi sentire (heartbeat) entro dead_after; la stessa
+                # scadenza limita gli invii verso un peer che non legge più
+                sock.settimeout(self.liveness.dead_after)
 
-                # Avvia il gioco se ci sono abbastanza peer registrati
-                if len(self.peers) >= self.players:
-                    self.start_game()
+                # Avvia il gioco se tutti i peer della stanza sono registrati e confermati
+                if ready:
+                    self.start_game(room)
+                self.serve_peer(conn, room, peer_addr)
+            elif data["type"] == "RESUME":
+                if self.shard is not None and registration is None:
+                    owner = self.shard.locate(room_of_token(data.get("session")))
+                    if owner is not None and owner != self.shard.index:
+                        self.shard.hand_off(owner, sock, addr, None, data)
+                        conn.close()
+                        return
+                try:
+                    room, peer_addr = self.resume_peer(conn, data)
+                except RegistrationError as e:
+                    log.warning("Ripresa rifiutata per %s: %s", addr, e)
+                    conn.send({"type": "ERROR", "message": str(e)})
+                    conn.close()
+                    return
+                conn.meter = METRICS.meter(peer_addr)
+                sock.settimeout(self.liveness.dead_after)
+                self.serve_peer(conn, room, peer_addr)
+            elif data["type"] == "SPECTATE":
+                if self.shard is not None and registration is None:
+                    owner = self.shard.locate(data.get("room"))
+                    if owner is not None and owner != self.shard.index:
+                        self.shard.hand_off(owner, sock, addr, None, data)
+                        conn.close()
+                        return
+                self.serve_spectator(conn, addr, data)
+            elif data["type"] == "ASSETS":
+                # Connessione dedicata ai trasferimenti: la sessione è nota al worker della stanza del peer
+                if self.shard is not None and registration is None:
+                    owner = self.shard.locate(room_of_token(data.get("session")))
+                    if owner is not None and owner != self.shard.index:
+                        self.shard.hand_off(owner, sock, addr, None, data)
+                        conn.close()
+                        return
+                error = self.check_assets(data)
+                if error:
+                    log.warning("Connessione degli asset rifiutata per %s: %s", addr, error)
+                    conn.send({"type": "ERROR", "message": error})
+                    conn.close()
+                    return
+                conn.send({"type": "ASSETS_READY"})
+                self.assets.serve(sock, addr, self.liveness.dead_after)
             else:
-                print(f"Messaggio sconosciuto da {addr}: {message}")
+                log.warning("Messaggio sconosciuto da %s: %s", addr, data)
+        except TimeoutError:
+            log.warning("Nessun REGISTER da %s entro %.1f s: connessione chiusa", addr, self.liveness.register_timeout)
+            conn.close()
         except Exception as e:
-            print(f"Errore nella gestione del peer {addr}: {e}")
+            log.error("Errore nella gestione del peer %s: %s", addr, e)
 
 
+    async def handle_client_async(self, reader, writer, registration=None):
+        """Versione asyncio di handle_client: stesso protocollo REGISTER/START, nessun thread dedicato."""
+        addr = writer.get_extra_info("peername")
+        log.debug("Connessione ricevuta da %s", addr)
+        METRICS.inc("server.connections")
+        started = time.perf_counter()
+        try:
+            data = registration or await asyncio.wait_for(read_message_async(reader), self.liveness.register_timeout)
+            if data is None:
+                log.debug("Connessione chiusa da %s prima della registrazione.", addr)
+                return
 
+            if data["type"] == "REGISTER":
+                peer_port = data.get("port")
+                if peer_port is None and self.relay:
+                    peer_port = addr[1]
+                if not peer_port or not isinstance(peer_port, int):
+                    log.warning("Porta non valida ricevuta da %s", addr)
+                    METRICS.inc("server.rejected")
+                    write_message_async(writer, {"type": "ERROR", "message": "Invalid port"})
+                    await writer.drain()
+                    return
+                peer_addr = (addr[0], peer_port)
 
-    def start_game(self):
-        print("Avvio del gioco!")
-        with self.lock:
-            # Seleziona un presentatore dalla lista dei peer registrati
-            presenter_conn, presenter_addr = random.choice(self.peers)
+                try:
+                    room_id = data.get("room")
+                    if self.shard is not None and registration is None:
+                        # Richiesta bloccante al coordinatore: fuori dall'event loop
+                        room_id, owner = await asyncio.get_running_loop().run_in_executor(None, self.shard.place, peer_addr, room_id)
+                        if owner != self.shard.index:
+                            self.shard.hand_off(owner, writer.get_extra_info("socket"), addr, peer_addr, dict(data, room=room_id))
+                            writer.close()
+                            return
+                    room, ready = self.register_peer(writer, peer_addr, room_id, data.get("encodings"))
+                except RegistrationError as e:
+                    log.warning("Registrazione rifiutata per %s: %s", addr, e)
+                    METRICS.inc("server.rejected")
+                    write_message_async(writer, {"type": "ERROR", "message": str(e)})
+                    await writer.drain()
+                    writer.close()
+                    return
+                await writer.drain()
+                METRICS.observe("server.register", time.perf_counter() - started)
 
-            # Notifica tutti i peer dell'inizio della partita
-            for conn, addr in self.peers:
+                if ready:
+                    self.start_game(room)
+                await self.serve_peer_async(reader, writer, room, peer_addr)
+            elif data["type"] == "RESUME":
+                if self.shard is not None and registration is None:
+                    owner = await asyncio.get_running_loop().run_in_executor(None, self.shard.locate, room_of_token(data.get("session")))
+                    if owner is not None and owner != self.shard.index:
+                        self.shard.hand_off(owner, writer.get_extra_info("socket"), addr, None, data)
+                        writer.close()
+                        return
                 try:
-                    conn.sendall(json.dumps({
-                        "type": "START",
-                        "presenter": presenter_addr,  # Fornisce l'indirizzo del presentatore
-                        "peers": [peer[1] for peer in self.peers],
-                        "winning_score": self.winning_score
-                    }).encode())
-                except Exception as e:
-                    print(f"Errore nell'invio del messaggio a {addr}: {e}")
+                    room, peer_addr = self.resume_peer(writer, data)
+                except RegistrationError as e:
+                    log.warning("Ripresa rifiutata per %s: %s", addr, e)
+                    write_message_async(writer, {"type": "ERROR", "message": str(e)})
+                    await writer.drain()
+                    writer.close()
+                    return
+                await writer.drain()
+                await self.serve_peer_async(reader, writer, room, peer_addr)
+            elif data["type"] == "SPECTATE":
+                if self.shard is not None and registration is None:
+                    owner = await asyncio.get_running_loop().run_in_executor(None, self.shard.locate, data.get("room"))
+                    if owner is not None and owner != self.shard.index:
+                        self.shard.hand_off(owner, writer.get_extra_info("socket"), addr, None, data)
+                        writer.close()
+                        return
+                await self.serve_spectator_async(writer, addr, data)
+            elif data["type"] == "ASSETS":
+                if self.shard is not None and registration is None:
+                    owner = await asyncio.get_running_loop().run_in_executor(None, self.shard.locate, room_of_token(data.get("session")))
+                    if owner is not None and owner != self.shard.index:
+                        self.shard.hand_off(owner, writer.get_extra_info("socket"), addr, None, data)
+                        writer.close()
+                        return
+                error = self.check_assets(data)
+                if error:
+                    log.warning("Connessione degli asset rifiutata per %s: %s", addr, error)
+                    write_message_async(writer, {"type": "ERROR", "message": error})
+                    await writer.drain()
+                    writer.close()
+                    return
+                write_message_async(writer, {"type": "ASSETS_READY"})
+                await writer.drain()
+                await self.assets.serve_async(reader, writer, addr, self.liveness.dead_after)
+            else:
+                log.warning("Messaggio sconosciuto da %s: %s", addr, data)
+        except asyncio.TimeoutError:
+            log.warning("Nessun REGISTER da %s entro %.1f s: connessione chiusa", addr, self.liveness.register_timeout)
+            writer.close()
+        except Exception as e:
+            log.error("Errore nella gestione del peer %s: %s", addr, e)
+
+
+    def relay_frames(self, conn, room, peer_addr):
+        """Modalità hub: inoltra agli altri peer della stanza i frame pubblicati dal peer."""
+        conn.decoder.decode = bytes  # I payload vengono inoltrati senza decodificarli
+        try:
+            while True:
+                payload = conn.recv()
+                if payload is None:
+                    break
+                if payload == HEARTBEAT_PAYLOAD:
+                    continue  # Basta averlo ricevuto entro la scadenza
+                if payload[:1] == b"{":
+                    self.handle_control(room, peer_addr, decode_payload(payload))  # Senza busta: è per il server
+                elif room.started:
+                    self.hub.publish(room, peer_addr, payload)
+        except TimeoutError:
+            log.warning("Peer %s silenzioso da %.1f s: considerato morto", peer_addr, self.liveness.dead_after)
+        except (OSError, ProtocolError) as e:
+            log.info("Inoltro interrotto per %s: %s", peer_addr, e)
+        finally:
+            self.release(room, peer_addr, conn)
+            conn.close()
+
+    async def relay_frames_async(self, reader, writer, room, peer_addr):
+        """Versione asyncio di relay_frames."""
+        meter = METRICS.meter(peer_addr)  # Gli StreamReader non hanno Connection.meter
+        try:
+            while True:
+                payload = await asyncio.wait_for(read_payload_async(reader), self.liveness.dead_after)
+                if payload is None:
+                    break
+                meter(0, len(payload))
+                if payload == HEARTBEAT_PAYLOAD:
+                    continue
+                if payload[:1] == b"{":
+                    self.handle_control(room, peer_addr, decode_payload(payload))
+                elif room.started:
+                    self.hub.publish(room, peer_addr, payload)
+        except asyncio.TimeoutError:
+            log.warning("Peer %s silenzioso da %.1f s: considerato morto", peer_addr, self.liveness.dead_after)
+        except (OSError, ProtocolError) as e:
+            log.info("Inoltro interrotto per %s: %s", peer_addr, e)
+        finally:
+            self.release(room, peer_addr, writer)
+
+    def release(self, room, peer_addr, conn):
+        """Fine dell'inoltro per una connessione: a partita in corso i frame per il peer attendono la ripresa."""
+        if room.started and self.sessions.grace:
+            self.hub.park(room, peer_addr, conn)
+        else:
+            self.hub.unsubscribe(room, peer_addr, conn)
+
+    def serve_peer(self, conn, room, peer_addr):
+        """Segue un peer registrato (o ripreso) finché la sua connessione resta viva."""
+        if self.relay:
+            self.relay_frames(conn, room, peer_addr)
+        else:
+            self.watch_peer(conn, room, peer_addr)
+        self.drop(peer_addr, conn)
+
+    async def serve_peer_async(self, reader, writer, room, peer_addr):
+        if self.relay:
+            await self.relay_frames_async(reader, writer, room, peer_addr)
+        else:
+            await self.watch_peer_async(reader, room, peer_addr)
+        self.drop(peer_addr, writer)
+        writer.close()
+
+    def drop(self, peer_addr, conn):
+        """Connessione del peer persa: a partita in corso gli si lascia il tempo di riprendere la sessione."""
+        room = self.rooms.room_of(peer_addr)
+        if room is None:
+            return  # Già rimosso (LEAVE o stanza chiusa)
+        generation = self.sessions.drop(peer_addr, conn)
+        if generation is None:
+            return  # Sessione già ripresa su un'altra connessione
+        if not room.started or not self.sessions.grace:
+            self.evict(peer_addr)
+            return
+        METRICS.inc("server.dropped")
+        log.info("Peer %s disconnesso: %.1f s per riprendere la sessione", peer_addr, self.sessions.grace)
+        self.schedule(self.sessions.grace, self.expire_session, peer_addr, generation)
+
+    def expire_session(self, peer_addr, generation):
+        if self.sessions.expire(peer_addr, generation):
+            log.info("Sessione di %s scaduta", peer_addr)
+            self.evict(peer_addr)
+
+    def check_assets(self, data):
+        """Motivo del rifiuto di una connessione degli asset; None se il peer può usarla."""
+        if self.assets is None:
+            return "Assets not enabled"
+        if not self.sessions.valid(data.get("session")):
+            return "Unknown session"
+        return None
+
+    def resume_peer(self, conn, data):
+        """RESUME: riprende la sessione sulla nuova connessione e invia lo stato compatto della partita.
+
+        Il RESUMED contiene lo stato della stanza (domanda corrente, buzz, punti,
+        peer rimasti) e, se nel frattempo è partita un'altra partita del torneo,
+        il suo START. Restituisce (stanza, indirizzo del peer).
+        """
+        session, previous = self.sessions.resume(data.get("session"), conn)
+        peer_addr = session.peer_addr
+        room = self.rooms.replace(peer_addr, conn)
+        if room is None:
+            self.sessions.discard(peer_addr)
+            raise RegistrationError("Session expired")
+        if previous is not None:
+            self.close_peer(previous)  # Il server non si era ancora accorto della caduta
+        if self.relay and room.started:
+            self.hub.replace(room, peer_addr, conn)
+        feed = self.spectators.get(room.room_id)
+        message = {
+            "type": "RESUMED",
+            "room": room.room_id,
+            "address": peer_addr,
+            "heartbeat": self.liveness.interval,
+            "state": feed.snapshot() if feed is not None else None,
+        }
+        if room.start is not None and room.start.get("game", 1) != data.get("game"):
+            message["start"] = room.start
+        if room.started:
+            self.notify(room, [peer_addr], message)  # In modalità hub passa dalla coda del peer, come gli altri messaggi del server
+        else:
+            self.send_to_peer(conn, encode_message(message))
+        METRICS.inc("server.resumed")
+        self.record("RESUME", room=room.room_id, peer=peer_addr)
+        log.info("Peer %s ha ripreso la sessione nella stanza %s", peer_addr, room.room_id)
+        return room, peer_addr
+
+    def close_peer(self, conn):
+        """Chiude una connessione di un peer sbloccando il thread (o il task) che la legge."""
+        try:
+            if isinstance(conn, asyncio.StreamWriter):
+                conn.close()
+            else:
+                conn.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
 
-            print(f"Presentatore scelto: {presenter_addr}")
+    def watch_peer(self, conn, room, peer_addr):
+        """Rete tra peer: il server legge heartbeat e RESULT; ritorna quando il peer è morto o se n'è andato."""
+        try:
+            while True:
+                message = conn.recv()  # Ogni messaggio ricevuto entro la scadenza conferma che il peer è vivo
+                if message is None:
+                    break
+                self.handle_control(room, peer_addr, message)
+        except TimeoutError:
+            log.warning("Peer %s silenzioso da %.1f s: considerato morto", peer_addr, self.liveness.dead_after)
+        except (OSError, ProtocolError) as e:
+            log.info("Connessione con %s interrotta: %s", peer_addr, e)
+        finally:
+            conn.close()
+
+    async def watch_peer_async(self, reader, room, peer_addr):
+        """Versione asyncio di watch_peer."""
+        try:
+            while True:
+                message = await asyncio.wait_for(read_message_async(reader), self.liveness.dead_after)
+                if message is None:
+                    break
+                self.handle_control(room, peer_addr, message)
+        except asyncio.TimeoutError:
+            log.warning("Peer %s silenzioso da %.1f s: considerato morto", peer_addr, self.liveness.dead_after)
+        except (OSError, ProtocolError) as e:
+            log.info("Connessione con %s interrotta: %s", peer_addr, e)
+
+    def evict(self, peer_addr):
+        """Toglie dalla stanza un peer morto o disconnesso e lo comunica agli altri peer della partita."""
+        self.sessions.discard(peer_addr)
+        room = self.rooms.leave(peer_addr)
+        if room is None:
+            return
+        if self.relay:
+            self.hub.unsubscribe(room, peer_addr)  # Anche il Backlog di una sessione scaduta
+        METRICS.inc("server.evicted")
+        METRICS.forget(peer_addr)
+        self.record("LEFT", room=room.room_id, peer=peer_addr)
+        log.info("Peer %s rimosso dalla stanza %s", peer_addr, room.room_id)
+        if not room.peers:
+            self.spectators.close(room.room_id)
+        if not room.started:
+            return  # In attesa della partita nessuno conosce ancora la lista dei peer
+        if not room.peers:
+            self.rooms.close(room)
+            self.tournaments.pop(room.room_id, None)
+            if self.relay:
+                self.hub.detach(room)
+            return
+        self.notify(room, room.addresses(), peer_left(peer_addr))
+        feed = self.spectators.get(room.room_id)
+        if feed is not None:
+            feed.update({"peers": room.addresses()}, [(peer_addr, None)])
+        tournament = self.tournaments.get(room.room_id)
+        if tournament is not None:
+            with self.tournament_lock:
+                presenting = tournament.presenter == peer_addr
+                tournament.remove(peer_addr)
+                if presenting:
+                    tournament.presenter = None  # La partita non avrà un RESULT: si passa alla successiva
+            if presenting:
+                self.schedule(self.tournament.pause, self.next_game, room)
+
+
+    def join_spectator(self, room_id):
+        """Feed della stanza per un nuovo spettatore; RegistrationError se la stanza non c'è o è al completo."""
+        if room_id not in self.rooms.rooms:
+            raise RegistrationError("Room not available")
+        feed = self.spectators.feed(room_id)
+        if not self.spectators.join(feed):
+            raise RegistrationError("Spectator limit reached")
+        return feed
+
+    def serve_spectator(self, conn, addr, data):
+        """Spettatore: stato completo, poi solo differenze al ritmo richiesto, finché la stanza non si chiude.
+
+        Nessun messaggio viene accodato: dopo ogni invio lo spettatore riceve i
+        cambiamenti accumulati nel frattempo, fusi in un solo STATE_DELTA.
+        """
+        try:
+            feed = self.join_spectator(data.get("room"))
+        except RegistrationError as e:
+            conn.send({"type": "ERROR", "message": str(e)})
+            conn.close()
+            return
+        interval = self.spectators.interval(data.get("rate"))
+        sent = 0
+        try:
+            conn.send({"type": "SPECTATING", "room": feed.room_id, "rate": round(1 / interval, 3)})
+            conn.sock.settimeout(self.spectators.send_timeout)  # Chi non legge in tempo viene scollegato
+            # Buffer del kernel limitato: migliaia di spettatori non occupano memoria e un lettore lento si nota presto
+            conn.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.spectators.limit_bytes)
+            while True:
+                if not feed.wait(sent, self.liveness.interval):
+                    conn.send_frame(HEARTBEAT_FRAME)  # Nessun cambiamento: la connessione resta viva
+                    continue
+                sent, closed, frame = feed.frame(sent)
+                conn.send_frame(frame)
+                METRICS.inc("spectators.updates")
+                if closed:
+                    break
+                time.sleep(interval)
+        except TimeoutError:
+            log.info("Spettatore %s troppo lento: disconnesso", addr)
+            METRICS.inc("spectators.dropped")
+        except OSError as e:
+            log.debug("Spettatore %s disconnesso: %s", addr, e)
+        finally:
+            self.spectators.leave(feed)
+            conn.close()
+
+    async def serve_spectator_async(self, writer, addr, data):
+        """Versione asyncio di serve_spectator: il limite sugli invii lenti è il buffer del trasporto."""
+        try:
+            feed = self.join_spectator(data.get("room"))
+        except RegistrationError as e:
+            write_message_async(writer, {"type": "ERROR", "message": str(e)})
+            await writer.drain()
+            writer.close()
+            return
+        interval = self.spectators.interval(data.get("rate"))
+        sent = 0
+        try:
+            write_message_async(writer, {"type": "SPECTATING", "room": feed.room_id, "rate": round(1 / interval, 3)})
+            writer.get_extra_info("socket").setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.spectators.limit_bytes)
+            while not writer.is_closing():
+                if await feed.wait_async(sent, self.liveness.interval):
+                    sent, closed, frame = feed.frame(sent)
+                    writer.write(frame)
+                    METRICS.inc("spectators.updates")
+                else:
+                    closed = False
+                    writer.write(HEARTBEAT_FRAME)
+                if writer.transport.get_write_buffer_size() > self.spectators.limit_bytes:
+                    log.info("Spettatore %s troppo lento: disconnesso", addr)
+                    METRICS.inc("spectators.dropped")
+                    break
+                if closed:
+                    await writer.drain()
+                    break
+                await asyncio.sleep(interval)
+        except (OSError, ConnectionError) as e:
+            log.debug("Spettatore %s disconnesso: %s", addr, e)
+        finally:
+            self.spectators.leave(feed)
+            writer.close()
+
+
+    def register_peer(self, conn, peer_addr, room_id=None, encodings=None):
+        """Inserisce il peer in una stanza e gli conferma la registrazione.
+
+        Il posto viene riservato sotto il lock del registro e il REGISTERED parte
+        dopo averlo rilasciato. Il secondo valore è True solo per la conferma che
+        rende avviabile la stanza: lo START segue sempre tutti i REGISTERED.
+        """
+        room, _ = self.rooms.join(conn, peer_addr, room_id, encodings=encodings)  # Salva connessione e indirizzo reale
+        token = self.sessions.issue(room.room_id, peer_addr, conn)
+        try:
+            self.send_to_peer(conn, encode_message({
+                "type": "REGISTERED",
+                "room": room.room_id,
+                "address": peer_addr,
+                "heartbeat": self.liveness.interval,  # Ogni quanto il peer deve farsi sentire
+                "session": token,  # Per riprendere la partita con RESUME dopo una disconnessione
+            }))
+        except Exception:
+            self.sessions.discard(peer_addr)
+            self.rooms.cancel(peer_addr)  # Il posto torna libero per il prossimo peer
+            raise
+        ready = self.rooms.confirm(room, peer_addr)
+        log.debug("Peer registrato: %s nella stanza %s", peer_addr, room.room_id)  # Indirizzo reale registrato
+        self.record("REGISTER", room=room.room_id, peer=peer_addr)
+        METRICS.inc("server.registrations")
+        return room, ready
+
+
+    def record(self, event, **fields):
+        if self.event_log is not None:
+            self.event_log.record(event, **fields)
+
+    def send_to_peer(self, conn, frame):
+        """Invia un frame sulla connessione del peer, sia essa una Connection o uno StreamWriter asyncio."""
+        if isinstance(conn, asyncio.StreamWriter):
+            conn.write(frame)  # Bufferizzato dall'event loop, non blocca
+        else:
+            conn.send_frame(frame)
+
+    def send_all(self, targets, frame):
+        """Invia lo stesso frame a più peer [(connessione, indirizzo)] senza attendere i singoli invii."""
+        for conn, addr in targets:
+            if self.sender is None:
+                self._send(conn, addr, frame)  # StreamWriter: la scrittura è solo bufferizzata
+            else:
+                self.sender.submit(self._send, conn, addr, frame)
+
+    def _send(self, conn, addr, frame):
+        try:
+            self.send_to_peer(conn, frame)
+        except Exception as e:
+            log.warning("Errore nell'invio del messaggio a %s: %s", addr, e)
+
+    def notify(self, room, addrs, message):
+        """Invia un messaggio del server ad alcuni peer della stanza.
+
+        In modalità hub passa dalle code dei destinatari: non si mescola ai frame
+        inoltrati sulla stessa connessione e arriva dopo gli eventi già accodati.
+        """
+        frame = encode_message(message)
+        if self.relay and room.room_id in self.hub.subscribers:
+            self.hub.deliver(room, addrs, frame)
+        else:
+            addrs = set(addrs)
+            self.send_all([peer for peer in room.peers if peer[1] in addrs], frame)
+
+
+    def start_game(self, room):
+        log.info("Avvio del gioco nella stanza %s", room.room_id)
+        # La stanza è completa: nessun altro peer può più modificarne la lista
+        if self.tournament is None:
+            self.launch(room, room.choose_presenter(), room.addresses())
+            return
+        tournament = Tournament(room.addresses(), self.tournament)
+        self.tournaments[room.room_id] = tournament
+        self.next_game(room)
+
+    def launch(self, room, presenter_addr, peers, tournament=None):
+        """Invia lo START di una partita ai peer che la giocano."""
+        METRICS.inc("server.games")
+        ready_at = time.time()  # Ultima registrazione (o fine della pausa): da qui si misura l'attesa della prima domanda
+        room.presenter = presenter_addr
+        self.record("START", room=room.room_id, game=tournament.game if tournament else 1, presenter=presenter_addr, peers=peers)
+        message = {
+            "type": "START",
+            "room": room.room_id,
+            "presenter": presenter_addr,  # Fornisce l'indirizzo del presentatore
+            "peers": peers,
+            "winning_score": room.winning_score,
+            "encoding": negotiate(room.encodings.values()),  # Compatta solo se tutti i peer la supportano
+            "relay": self.relay,
+            "ready_at": ready_at
+        }
+        if tournament is not None:
+            message["game"] = tournament.game
+            message["tournament"] = tournament.summary()
+        self.spectators.feed(room.room_id).start_game(message.get("game", 1), presenter_addr, peers, message.get("tournament"))
+        # Notifica tutti i peer della partita: un solo frame per tutti
+        start_frame = encode_message(message)
+        room.start = message
+        if self.relay:
+            self.hub.attach(room, start_frame, peers)  # START in testa alla coda di ogni peer, prima di ogni evento inoltrato
+        else:
+            self.send_all([peer for peer in room.peers if peer[1] in peers], start_frame)
+
+        log.info("Presentatore scelto per la stanza %s: %s", room.room_id, presenter_addr)
+
+    def handle_control(self, room, peer_addr, message):
+        """Messaggi dei peer per il server: oltre agli heartbeat, lo STATE per gli spettatori e il RESULT di fine partita nei tornei."""
+        if message.get("type") == "LEAVE":
+            self.evict(peer_addr)  # Uscita volontaria: nessuna attesa per la ripresa
+            return
+        if message.get("type") == "STATE":
+            feed = self.spectators.get(room.room_id)
+            if feed is not None and room.presenter == peer_addr:
+                # Fuori dai tornei la partita finisce con il vincitore: gli spettatori vengono scollegati
+                feed.apply(message, close=bool(message.get("winner")) and room.room_id not in self.tournaments)
+            return
+        if message.get("type") != "RESULT":
+            return
+        tournament = self.tournaments.get(room.room_id)
+        if tournament is None:
+            return
+        with self.tournament_lock:
+            if tournament.presenter != peer_addr:
+                log.warning("RESULT ignorato: %s non presenta la partita in corso", peer_addr)
+                return
+            scores = [((host, port), points) for host, port, points in message.get("scores", [])]
+            if not tournament.record(message.get("game"), scores):
+                return
+        self.record("RESULT", room=room.room_id, game=message.get("game"), scores=message.get("scores", []))
+        log.info("Partita %s della stanza %s conclusa", message.get("game"), room.room_id)
+        self.schedule(self.tournament.pause, self.next_game, room)
+
+    def schedule(self, delay, callback, *args):
+        """Esegue callback dopo delay secondi senza occupare il thread (o l'event loop) chiamante."""
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.call_later, delay, callback, *args)
+        else:
+            timer = threading.Timer(delay, callback, args)
+            timer.daemon = True
+            timer.start()
+
+    def next_game(self, room):
+        """Avvia la partita successiva del torneo con il prossimo presentatore, o chiude il torneo."""
+        tournament = self.tournaments.get(room.room_id)
+        if tournament is None:
+            return  # Stanza chiusa durante la pausa
+        with self.tournament_lock:
+            if tournament.presenter is not None:
+                return  # Partita già avviata
+            step = tournament.next_game()
+            peers = list(tournament.active)
+        if step is None:
+            self.end_tournament(room, tournament)
+            return
+        presenter_addr, eliminated = step
+        summary = tournament.summary()
+        if eliminated:
+            log.info("Stanza %s, fase %s: eliminati %s", room.room_id, tournament.stage, eliminated)
+            self.notify(room, eliminated, {"type": "ELIMINATED", "tournament": summary})
+        self.launch(room, presenter_addr, peers, tournament)
+
+    def end_tournament(self, room, tournament):
+        present = set(room.addresses())
+        winner = next((peer for peer, _ in tournament.standings.top() if peer in present), None)  # Chi è uscito non vince
+        log.info("Torneo della stanza %s terminato dopo %s partite, vincitore: %s", room.room_id, tournament.game, winner)
+        METRICS.inc("server.tournaments")
+        self.record("TOURNAMENT_END", room=room.room_id, winner=winner, standings=tournament.summary()["standings"])
+        self.tournaments.pop(room.room_id, None)
+        feed = self.spectators.get(room.room_id)
+        if feed is not None:
+            feed.update({"winner": winner, "tournament": tournament.summary()}, close=True)
+        self.notify(room, room.addresses(), {
+            "type": "TOURNAMENT_END",
+            "message": f"FINE TORNEO: Il player {winner[1]} ha vinto!" if winner else "FINE TORNEO",
+            "winner": {"host": winner[0], "port": winner[1]} if winner else None,
+            "tournament": tournament.summary(),
+        })
 
 
     def run(self):
-        print("Server in esecuzione...")
+        log.info("Server in esecuzione (modalità %s%s)", self.mode, ", relay" if self.relay else "")
+        if self.mode == "asyncio":
+            asyncio.run(self.run_async())
+            return
+        if self.shard is not None:
+            threading.Thread(target=self.adopt_handoffs, daemon=True).start()
         while True:
             conn, addr = self.server.accept()
             threading.Thread(target=self.handle_client, args=(conn, addr)).start()
 
+    def adopt_handoffs(self):
+        """Prefork: accoglie i peer che altri worker hanno collocato in stanze di questo processo."""
+        while True:
+            sock, addr, registration = self.shard.receive()
+            threading.Thread(target=self.handle_client, args=(sock, addr, registration)).start()
+
+    async def adopt_async(self, sock, registration):
+        reader, writer = await asyncio.open_connection(sock=sock)
+        await self.handle_client_async(reader, writer, registration)
+
+    async def run_async(self):
+        """Serve tutte le connessioni su un unico event loop riutilizzando il socket già in ascolto."""
+        self.loop = asyncio.get_running_loop()
+        self.spectators.loop = self.loop
+        if self.shard is not None:
+            def adopt():
+                sock, _, registration = self.shard.receive()
+                sock.setblocking(False)
+                self.loop.create_task(self.adopt_async(sock, registration))
+            self.loop.add_reader(self.shard.inbox, adopt)
+        server = await asyncio.start_server(self.handle_client_async, sock=self.server)
+        async with server:
+            await server.serve_forever()
+
 if __name__ == "__main__":
+    setup_logging()
     players = int(input("Inserisci il numero di giocatori: "))
     if players<3:
         players=3
     winning_score = int(input("Inserisci il punteggio necessario per vincere: "))
     if winning_score<0:
         winning_score=3
-    server = QuizServer(players=players, winning_score=winning_score)
+    # Es.: python server.py asyncio relay metrics torneo eventi assets
+    mode = next((arg for arg in sys.argv[1:] if arg in MODES), "thread")
+    relay = "relay" in sys.argv[1:]
+    if "metrics" in sys.argv[1:]:
+        serve(METRICS_PORT)
+    tournament = TournamentRules(stages=2) if "torneo" in sys.argv[1:] else None
+    event_log = EventLog(EVENT_LOG_PATH) if "eventi" in sys.argv[1:] else None
+    assets = AssetStore() if "assets" in sys.argv[1:] else None
+    server = QuizServer(players=players, winning_score=winning_score, mode=mode, relay=relay, tournament=tournament, event_log=event_log, assets=assets)
     server.run()
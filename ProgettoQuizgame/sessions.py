@@ -0,0 +1,99 @@
+"""Sessioni dei peer: ripresa della partita dopo una disconnessione.
+
+Al REGISTER il server rilascia un token di sessione. Se la connessione di un
+peer si interrompe a partita in corso il peer non viene rimosso subito: resta
+nella stanza per grace secondi, con punti e posto nella lista dei peer. Se in
+quel tempo si ricollega con RESUME e il token, la sessione passa sulla nuova
+connessione e il peer riceve nel RESUMED lo stato compatto della partita
+(domanda corrente, buzz, punti, peer rimasti) invece di ricominciare da capo.
+Scaduto il tempo viene rimosso come un peer morto (PEER_LEFT agli altri).
+
+In modalità hub i frame inoltrati al peer mentre è disconnesso restano in un
+Backlog e gli arrivano alla ripresa, prima del RESUMED; lato peer, le scritture
+verso il server fatte durante la disconnessione partono sulla nuova connessione.
+
+Il token inizia con l'id della stanza: in modalità pre-fork il worker che
+riceve il RESUME sa a chi passare la connessione.
+"""
+import secrets
+import threading
+from rooms import RegistrationError
+
+RESUME_GRACE = 10.0  # Secondi concessi a un peer disconnesso per riprendere la sessione
+
+
+class Session:
+    __slots__ = ("token", "peer_addr", "conn", "generation")
+
+    def __init__(self, token, peer_addr, conn):
+        self.token = token
+        self.peer_addr = peer_addr
+        self.conn = conn  # Connessione attuale; None mentre il peer è disconnesso
+        self.generation = 0  # Cambia a ogni disconnessione e ripresa: le scadenze vecchie vengono ignorate
+
+
+def room_of_token(token):
+    """Id della stanza contenuto nel token; None se il token non è valido."""
+    try:
+        return int(str(token).split("-", 1)[0])
+    except ValueError:
+        return None
+
+
+class SessionRegistry:
+    """Token di sessione dei peer registrati e stato di connessione di ciascuno."""
+
+    def __init__(self, grace=RESUME_GRACE):
+        self.grace = grace  # 0: nessuna ripresa, i peer disconnessi vengono rimossi subito
+        self.by_token = {}
+        self.by_peer = {}
+        self.lock = threading.Lock()
+
+    def issue(self, room_id, peer_addr, conn):
+        token = f"{room_id}-{secrets.token_urlsafe(16)}"
+        with self.lock:
+            session = Session(token, peer_addr, conn)
+            self.by_token[token] = session
+            self.by_peer[peer_addr] = session
+        return token
+
+    def valid(self, token):
+        """True se il token appartiene a un peer ancora registrato (ad esempio per aprire la connessione degli asset)."""
+        with self.lock:
+            return token in self.by_token
+
+    def drop(self, peer_addr, conn):
+        """Segna il peer come disconnesso; restituisce la generazione da passare a expire.
+
+        None se la connessione persa non è più quella della sessione (il peer
+        l'ha già ripresa su un'altra) o se il peer non ha una sessione.
+        """
+        with self.lock:
+            session = self.by_peer.get(peer_addr)
+            if session is None or session.conn is not conn:
+                return None
+            session.conn = None
+            session.generation += 1
+            return session.generation
+
+    def resume(self, token, conn):
+        """Sposta la sessione sulla nuova connessione; restituisce (sessione, connessione precedente)."""
+        with self.lock:
+            session = self.by_token.get(token)
+            if session is None:
+                raise RegistrationError("Session expired")
+            previous, session.conn = session.conn, conn
+            session.generation += 1
+            return session, previous  # previous non è None se il server non si era ancora accorto della caduta
+
+    def expire(self, peer_addr, generation):
+        """True se il peer è ancora disconnesso dalla stessa caduta: va rimosso."""
+        with self.lock:
+            session = self.by_peer.get(peer_addr)
+            return session is not None and session.conn is None and session.generation == generation
+
+    def discard(self, peer_addr):
+        with self.lock:
+            session = self.by_peer.pop(peer_addr, None)
+            if session is not None:
+                self.by_token.pop(session.token, None)
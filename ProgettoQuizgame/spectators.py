@@ -0,0 +1,266 @@
+"""Spettatori: seguono una partita in sola lettura ricevendo lo stato per differenze.
+
+Il presentatore comunica al server ogni cambiamento della partita (domanda,
+buzz, punti, vincitore) con un messaggio STATE sulla connessione già aperta; il
+server tiene per ogni stanza un GameFeed in cui ogni campo ricorda la versione
+in cui è cambiato l'ultima volta. Uno spettatore riceve prima lo stato completo
+(STATE), poi solo i campi cambiati rispetto alla versione che ha già
+(STATE_DELTA): i cambiamenti avvenuti tra due invii si fondono in uno solo e
+ogni spettatore riceve al massimo rate aggiornamenti al secondo. Gli spettatori
+alla stessa versione condividono lo stesso frame, codificato una volta sola.
+
+Non c'è una coda per spettatore: chi non legge abbastanza in fretta viene
+disconnesso (invio bloccato oltre send_timeout, o buffer asyncio oltre
+limit_bytes). Il lavoro fatto per i giocatori non dipende dal numero di
+spettatori: un STATE aggiorna solo il feed, gli invii agli spettatori avvengono
+nei loro thread (o task).
+
+Uso: python spectators.py STANZA [host:porta] [aggiornamenti al secondo]
+"""
+import asyncio
+import sys
+import threading
+import time
+from protocol import Connection, encode_message
+from liveness import CONNECT_TIMEOUT
+from metrics import METRICS, get_logger, setup_logging
+
+log = get_logger("spectators")
+
+DEFAULT_RATE = 5.0  # Aggiornamenti al secondo per spettatore, se non ne chiede meno
+MAX_RATE = 20.0
+SEND_TIMEOUT = 2.0  # Invio bloccato più a lungo: lo spettatore è troppo lento e viene disconnesso
+LIMIT_BYTES = 64 * 1024  # Equivalente asyncio: byte non ancora scritti verso lo spettatore
+FIELDS = ("question", "buzz", "winner")  # Campi che il presentatore può aggiornare
+
+
+class GameFeed:
+    """Stato di una stanza per gli spettatori, con la versione dell'ultima modifica di ogni campo."""
+
+    def __init__(self, room_id, loop=None):
+        self.room_id = room_id
+        self.loop = loop  # Event loop del server in modalità asyncio
+        self.version = 0
+        self.values = {}  # {campo: valore}; i punti hanno chiave ("score", host, porta)
+        self.versions = {}  # {campo: versione in cui è cambiato}
+        self.changed_at = time.time()
+        self.closed = False
+        self.frames = {}  # {versione di partenza: frame verso la versione corrente}
+        self.spectators = 0
+        self.changed = threading.Condition()
+        self.next_change = None  # Future su cui attendono gli spettatori asyncio
+
+    def update(self, fields=(), scores=(), close=False):
+        """Applica dei cambiamenti; i valori uguali a quelli attuali non creano una nuova versione."""
+        changes = list(dict(fields).items())
+        changes += [(("score", host, port), points) for (host, port), points in scores]
+        with self.changed:
+            changes = [(key, value) for key, value in changes if self.values.get(key, ...) != value]
+            if not changes and (self.closed or not close):
+                return
+            self.version += 1
+            for key, value in changes:
+                self.values[key] = value
+                self.versions[key] = self.version
+            self.closed = self.closed or close
+            self.changed_at = time.time()
+            self.frames.clear()
+            self.changed.notify_all()
+            future, self.next_change = self.next_change, None
+        if future is not None:
+            self.loop.call_soon_threadsafe(wake, future)
+
+    def start_game(self, game, presenter, peers, tournament=None):
+        """Nuova partita nella stanza: punti azzerati per chi gioca, tolti per chi non gioca più."""
+        players = {tuple(peer) for peer in peers if tuple(peer) != tuple(presenter)}
+        with self.changed:
+            previous = {(key[1], key[2]) for key in self.values if isinstance(key, tuple)}
+        scores = [(peer, None) for peer in previous - players] + [(peer, 0) for peer in players]
+        self.update({"game": game, "presenter": presenter, "peers": peers, "tournament": tournament,
+                     "question": None, "buzz": None, "winner": None}, scores)
+
+    def apply(self, message, close=False):
+        """Applica uno STATE del presentatore."""
+        fields = {key: message[key] for key in FIELDS if key in message}
+        scores = [((host, port), points) for host, port, points in message.get("scores", [])]
+        self.update(fields, scores, close)
+
+    def message(self, since):
+        """Stato completo (since=0) o campi cambiati dopo la versione since."""
+        message = {"type": "STATE_DELTA" if since else "STATE", "room": self.room_id, "version": self.version, "t": self.changed_at}
+        scores = []
+        for key, version in self.versions.items():
+            if version <= since:
+                continue
+            value = self.values[key]
+            if isinstance(key, tuple):
+                if since or value is not None:
+                    scores.append([key[1], key[2], value])  # None: il peer non gioca più
+            else:
+                message[key] = value
+        if scores or not since:
+            message["scores"] = scores
+        if self.closed:
+            message["closed"] = True
+        return message
+
+    def snapshot(self):
+        """Stato completo della stanza (usato anche per i peer che riprendono la sessione)."""
+        with self.changed:
+            return self.message(0)
+
+    def frame(self, since):
+        """(versione, chiuso, frame) per uno spettatore fermo alla versione since."""
+        with self.changed:
+            frame = self.frames.get(since)
+            if frame is None:
+                frame = self.frames[since] = encode_message(self.message(since))
+            return self.version, self.closed, frame
+
+    def wait(self, after, timeout):
+        """Attende una versione successiva ad after; False allo scadere del timeout."""
+        with self.changed:
+            return self.changed.wait_for(lambda: self.version > after, timeout)
+
+    async def wait_async(self, after, timeout):
+        with self.changed:
+            if self.version > after:
+                return True
+            if self.next_change is None:
+                self.next_change = self.loop.create_future()
+            future = self.next_change
+        done, _ = await asyncio.wait((future,), timeout=timeout)  # Senza cancellare la future condivisa
+        return bool(done)
+
+
+def wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class Spectators:
+    """Feed delle stanze del server e limiti per gli spettatori."""
+
+    def __init__(self, default_rate=DEFAULT_RATE, max_rate=MAX_RATE, send_timeout=SEND_TIMEOUT, limit_bytes=LIMIT_BYTES, max_per_room=None):
+        self.default_rate = default_rate
+        self.max_rate = max_rate
+        self.send_timeout = send_timeout
+        self.limit_bytes = limit_bytes
+        self.max_per_room = max_per_room  # None: nessun limite
+        self.feeds = {}  # {room_id: GameFeed}
+        self.lock = threading.Lock()
+        self.loop = None
+
+    def feed(self, room_id):
+        with self.lock:
+            feed = self.feeds.get(room_id)
+            if feed is None:
+                feed = self.feeds[room_id] = GameFeed(room_id, self.loop)
+            return feed
+
+    def get(self, room_id):
+        return self.feeds.get(room_id)
+
+    def close(self, room_id):
+        """La stanza è chiusa: gli spettatori ricevono l'ultimo aggiornamento e vengono scollegati."""
+        with self.lock:
+            feed = self.feeds.pop(room_id, None)
+        if feed is not None:
+            feed.update(close=True)
+
+    def interval(self, rate=None):
+        """Intervallo minimo tra due invii per la frequenza richiesta dallo spettatore."""
+        try:
+            rate = min(float(rate or self.default_rate), self.max_rate)
+        except (TypeError, ValueError):
+            rate = self.default_rate
+        return 1.0 / rate if rate > 0 else 1.0 / self.default_rate
+
+    def join(self, feed):
+        """Conta un nuovo spettatore della stanza; False se la stanza ne ha già troppi."""
+        with self.lock:
+            if self.max_per_room is not None and feed.spectators >= self.max_per_room:
+                return False
+            feed.spectators += 1
+        METRICS.inc("spectators.joined")
+        return True
+
+    def leave(self, feed):
+        with self.lock:
+            feed.spectators -= 1
+
+
+class Spectator:
+    """Client in sola lettura: applica STATE e STATE_DELTA a una copia locale dello stato."""
+
+    def __init__(self, server_host="localhost", server_port=12345, room=1, rate=None):
+        self.server = (server_host, server_port)
+        self.room = room
+        self.rate = rate
+        self.conn = None
+        self.state = {}
+        self.scores = {}  # {(host, porta): punti}
+        self.version = 0
+        self.updates = 0
+        self.closed = False
+
+    def connect(self):
+        self.conn = Connection.connect(self.server, timeout=CONNECT_TIMEOUT)
+        self.conn.sock.settimeout(None)
+        self.conn.send({"type": "SPECTATE", "room": self.room, "rate": self.rate})
+        response = self.conn.recv()
+        if not response or response["type"] != "SPECTATING":
+            self.conn.close()
+            raise ConnectionError(f"Spettatore rifiutato: {response}")
+        return response
+
+    def run(self, on_update=None):
+        """Riceve gli aggiornamenti finché la stanza non si chiude; on_update(spettatore, messaggio)."""
+        try:
+            while not self.closed:
+                message = self.conn.recv()
+                if message is None:
+                    break
+                if message["type"] not in ("STATE", "STATE_DELTA"):
+                    continue  # HEARTBEAT del server
+                self.apply(message)
+                if on_update:
+                    on_update(self, message)
+        finally:
+            self.conn.close()
+
+    def apply(self, message):
+        if message["type"] == "STATE":
+            self.state.clear()
+            self.scores.clear()
+        for host, port, points in message.pop("scores", []):
+            if points is None:
+                self.scores.pop((host, port), None)
+            else:
+                self.scores[(host, port)] = points
+        self.state.update((key, value) for key, value in message.items() if key not in ("type", "room", "version", "t", "closed"))
+        self.version = message["version"]
+        self.closed = bool(message.get("closed"))
+        self.updates += 1
+
+
+def show(spectator, message):
+    question = spectator.state.get("question")
+    buzz = spectator.state.get("buzz")
+    winner = spectator.state.get("winner")
+    ranking = ", ".join(f"{port}: {points}" for (_, port), points in sorted(spectator.scores.items(), key=lambda item: -item[1]))
+    print(f"[v{spectator.version}] partita {spectator.state.get('game')} | "
+          f"domanda: {question['text'] if question else '-'} | buzz: {buzz[1] if buzz else '-'} | {ranking}")
+    if winner:
+        print(f"Vincitore: {winner[1]}")
+
+
+if __name__ == "__main__":
+    setup_logging()
+    room = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    host, port = sys.argv[2].rsplit(":", 1) if len(sys.argv) > 2 else ("localhost", "12345")
+    rate = float(sys.argv[3]) if len(sys.argv) > 3 else None
+    spectator = Spectator(host, int(port), room, rate)
+    spectator.connect()
+    print(f"Spettatore della stanza {room}")
+    spectator.run(show)
@@ -0,0 +1,91 @@
+"""Tornei: molte partite di fila sulla stessa stanza, senza nuove connessioni.
+
+Una fase è un giro di presentatori: ogni giocatore attivo presenta una partita,
+a rotazione. I punti fatti in ogni partita si sommano nella classifica del
+torneo. A fine fase passa alla successiva la parte migliore dei giocatori
+(advance), mai meno di finalists, come in un tabellone a eliminazione. Tra una
+partita e l'altra il server invia solo un nuovo START sulle connessioni già
+registrate.
+"""
+import math
+from scoreboard import Scoreboard
+
+MIN_PLAYERS = 2  # Un presentatore e almeno un giocatore
+
+
+class TournamentRules:
+    """Formato del torneo, uguale per tutte le stanze del server."""
+
+    def __init__(self, stages=1, advance=0.5, finalists=MIN_PLAYERS, games_per_stage=None, pause=2.0):
+        self.stages = stages  # Fasi da giocare; tra una fase e l'altra si elimina
+        self.advance = advance  # Frazione dei giocatori che passa alla fase successiva
+        self.finalists = max(MIN_PLAYERS, finalists)
+        self.games_per_stage = games_per_stage  # None: un giro completo di presentatori
+        self.pause = pause  # Secondi tra la fine di una partita e lo START della successiva
+
+
+class Tournament:
+    """Stato del torneo di una stanza: giocatori attivi, presentatore di turno e classifica cumulativa."""
+
+    def __init__(self, peers, rules):
+        self.rules = rules
+        self.active = list(peers)  # In ordine di registrazione: è anche l'ordine di rotazione
+        self.eliminated = []
+        self.standings = Scoreboard(peers)  # Punti sommati su tutte le partite
+        self.stage = 1
+        self.game = 0  # Numero della partita in corso (dalla prima del torneo)
+        self.played = 0  # Partite iniziate nella fase corrente
+        self.presenter = None
+
+    def stage_games(self):
+        return self.rules.games_per_stage or len(self.active)
+
+    def next_game(self):
+        """Passa alla partita successiva; restituisce (presentatore, eliminati ora) o None a torneo finito."""
+        if len(self.active) < MIN_PLAYERS:
+            return None
+        eliminated = []
+        if self.played >= self.stage_games():
+            if self.stage >= self.rules.stages or len(self.active) <= self.rules.finalists:
+                return None
+            eliminated = self.advance_stage()
+        self.presenter = self.active[self.played % len(self.active)]
+        self.played += 1
+        self.game += 1
+        return self.presenter, eliminated
+
+    def advance_stage(self):
+        """Chiude la fase: restano i migliori della classifica (a pari punti chi li ha raggiunti prima)."""
+        keep = max(self.rules.finalists, math.ceil(len(self.active) * self.rules.advance))
+        ranked = [peer for peer, _ in self.standings.top() if peer in self.active]
+        qualified = set(ranked[:keep])
+        eliminated = [peer for peer in self.active if peer not in qualified]
+        self.active = [peer for peer in self.active if peer in qualified]
+        self.eliminated.extend(eliminated)
+        self.stage += 1
+        self.played = 0
+        return eliminated
+
+    def record(self, game, scores):
+        """Somma i punti di una partita; False se il risultato non è della partita in corso."""
+        if game != self.game:
+            return False
+        for peer, points in scores:
+            if peer in self.active and points > 0:
+                self.standings.increment(peer, points)
+        self.presenter = None  # Partita chiusa: nessun risultato atteso fino al prossimo START
+        return True
+
+    def remove(self, peer):
+        """Un peer ha lasciato la stanza: non verrà più schedulato (i suoi punti restano in classifica)."""
+        if peer in self.active:
+            self.active.remove(peer)
+
+    def summary(self):
+        """Classifica e fase correnti, nel formato inviato ai peer."""
+        return {
+            "stage": self.stage,
+            "stages": self.rules.stages,
+            "game": self.game,
+            "standings": [[host, port, points] for (host, port), points in self.standings.top()],
+        }